@@ -0,0 +1,356 @@
+"""Headless HTTP API over the PRIS statistics and the async RAG engine
+
+Run with:
+   uvicorn api:app --port 8000
+
+Endpoints:
+   GET  /health
+   GET  /metrics                     (Prometheus text format)
+   GET  /summary?country=Japan&types=PWR,BWR      (text summary and fleet analytics)
+   GET  /compare?countries=Japan,France&types=PWR (all countries when omitted)
+   POST /retrieve  {"query": "...", "country": "Japan", "k": 5}
+   POST /answer    {"question": "...", "country": "Japan", "types": ["PWR"], "stream": false,
+                    "history": [["earlier question", "earlier answer"], ...]}
+   POST /analysis  {"questions": ["..."], "country": "Japan", "types": ["PWR"], "stream": false}
+
+/analysis uses all guided questions for the country when "questions" is
+omitted. /answer replies to count and capacity questions ("how many units are
+under construction in China") straight from the PRIS table (see pris_query.py)
+with meta.route = "pris_table"; everything else goes through retrieval and
+the chat model. /answer is stateless: clients send earlier turns as "history", and
+follow-ups are rewritten into standalone questions for retrieval. With "stream": true, the answer or report is streamed as plain text.
+
+At most PRIS_API_MAX_CONCURRENCY retrieve/answer/analysis requests run at
+once. Up to PRIS_API_MAX_QUEUE more wait for a slot; anything beyond that is
+rejected with 503 and Retry-After. A failed document search (no index, or a
+failed embedding or FAISS call) is a 503 too; a failed chat-model call is a 502. PRIS_CSV_PATH, PRIS_INDEX_PATH,
+PRIS_EMBEDDER ('openai[:model]' or 'hashing[:size]') and PRIS_LLM_MODEL
+select the data and models; PRIS_NPROBE, PRIS_EF_SEARCH and PRIS_RERANK_FACTOR
+tune HNSW / IVF-PQ indexes (see vector_index.py). OPENAI_BASE_URL points both models at a local
+server such as stub_openai.py. PRIS_TRACE_FILE appends a per-stage trace of
+every request to a JSONL file; responses carry its id as meta.trace_id.
+"""
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+from conversation import ConversationMemory
+from errors import RetrievalError
+from final_app import DYNAMIC_QUESTIONS, FAISS_INDEX_PATH, PRIS_CSV_PATH, DataAnalyzer, RAGQueryEngine
+from tracing import tracer
+from warm_cache import guided_questions
+
+
+# Upper bound on documents per query for /retrieve
+MAX_RETRIEVE_K = 50
+
+
+class QueueFull(Exception):
+   """Raised when every worker slot and every queue position is taken"""
+
+
+class ConcurrencyLimiter:
+   """Run at most max_concurrency requests at once, with up to max_queue more waiting in FIFO order"""
+
+   def __init__(self, max_concurrency: int = 4, max_queue: int = 32):
+       self.max_concurrency = max_concurrency
+       self.max_queue = max_queue
+       self.active = self.waiting = self.rejected = 0
+       self._semaphore = asyncio.Semaphore(max_concurrency)
+
+   async def acquire(self):
+       if self.active >= self.max_concurrency and self.waiting >= self.max_queue:
+           self.rejected += 1
+           raise QueueFull()
+       self.waiting += 1
+       try:
+           await self._semaphore.acquire()
+       finally:
+           self.waiting -= 1
+       self.active += 1
+
+   def release(self):
+       self.active -= 1
+       self._semaphore.release()
+
+   def stats(self) -> Dict[str, int]:
+       return {
+           "active": self.active,
+           "waiting": self.waiting,
+           "rejected": self.rejected,
+           "max_concurrency": self.max_concurrency,
+           "max_queue": self.max_queue,
+       }
+
+
+def build_engine() -> RAGQueryEngine:
+   """RAG engine configured from the environment"""
+   from langchain_openai import ChatOpenAI
+   from offline import get_embeddings
+
+   index_path = os.environ.get("PRIS_INDEX_PATH", FAISS_INDEX_PATH)
+   engine = RAGQueryEngine(
+       index_path,
+       embeddings=get_embeddings(os.environ.get("PRIS_EMBEDDER", "openai")),
+       llm=ChatOpenAI(model=os.environ.get("PRIS_LLM_MODEL", "gpt-4"), temperature=0),
+   )
+   engine.configure_search(
+       nprobe=int(os.environ.get("PRIS_NPROBE", "16")),
+       ef_search=int(os.environ.get("PRIS_EF_SEARCH", "64")),
+       rerank_factor=int(os.environ.get("PRIS_RERANK_FACTOR", "10")),
+   )
+   if engine.vectorstore is not None:
+       # Build the BM25 index now rather than on the event loop during the first request
+       engine.lexical_index
+       engine.warm_retrieval(index_path, os.environ.get("PRIS_CSV_PATH", PRIS_CSV_PATH),
+                             guided_questions(DYNAMIC_QUESTIONS))
+   return engine
+
+
+class SlotStreamingResponse(StreamingResponse):
+   """Streams a generation and frees its concurrency slot however the response ends
+
+   The slot is released here rather than in the body generator, which never
+   runs when the client disconnects before the body starts.
+   """
+
+   def __init__(self, content, limiter: ConcurrencyLimiter, **kwargs):
+       super().__init__(content, **kwargs)
+       self.limiter = limiter
+
+   async def __call__(self, scope, receive, send):
+       try:
+           await super().__call__(scope, receive, send)
+       finally:
+           self.limiter.release()
+
+
+async def _json_body(request: Request) -> Dict:
+   try:
+       body = await request.json()
+   except ValueError:
+       raise HTTPException(400, "Request body must be JSON")
+   if not isinstance(body, dict):
+       raise HTTPException(400, "Request body must be a JSON object")
+   return body
+
+
+def _required(body: Dict, field: str):
+   value = body.get(field)
+   if not value:
+       raise HTTPException(400, f"'{field}' is required")
+   return value
+
+
+def _int_field(body: Dict, field: str, default: int, maximum: int) -> int:
+   value = body.get(field, default)
+   try:
+       if isinstance(value, bool):
+           raise TypeError(value)
+       number = int(value)
+   except (TypeError, ValueError):
+       raise HTTPException(400, f"'{field}' must be an integer")
+   if not 1 <= number <= maximum:
+       raise HTTPException(400, f"'{field}' must be between 1 and {maximum}")
+   return number
+
+
+def _types(value, field: str = "types") -> Optional[List[str]]:
+   """A comma-separated string or a list of strings; anything else is a 400"""
+   if not value:
+       return None
+   if isinstance(value, str):
+       return [t for t in value.split(",") if t]
+   if not isinstance(value, list) or not all(isinstance(t, str) for t in value):
+       raise HTTPException(400, f"'{field}' must be a list of strings or a comma-separated string")
+   return value
+
+
+def _summary(request: Request, country: str, types) -> str:
+   return request.app.state.analyzer.get_country_summary(country, _types(types))
+
+
+async def _acquire(request: Request) -> ConcurrencyLimiter:
+   limiter = request.app.state.limiter
+   try:
+       await limiter.acquire()
+   except QueueFull:
+       raise HTTPException(503, "Server busy, retry shortly", headers={"Retry-After": "1"})
+   return limiter
+
+
+def _engine_error(e: Exception) -> HTTPException:
+   if isinstance(e, RetrievalError):
+       return HTTPException(503, f"Document search unavailable: {str(e)}")
+   return HTTPException(502, f"Generation failed: {str(e)}")
+
+
+async def _resume(first: str, rest: AsyncIterator[str]) -> AsyncIterator[str]:
+   yield first
+   async for chunk in rest:
+       yield chunk
+
+
+async def _generate(request: Request, body: Dict, chunks: Callable[[Dict], AsyncIterator[str]],
+                    field: str, extra: Dict):
+   """Run a generation inside a concurrency slot, streamed or as one JSON document
+
+   A stream starts only once its first chunk exists, so a failed search (503)
+   or model call (502) still gets an error status instead of a broken 200.
+   """
+   limiter = await _acquire(request)
+   meta: Dict = {}
+   if body.get("stream"):
+       stream = chunks(meta)
+       try:
+           first = await stream.__anext__()
+       except StopAsyncIteration:
+           first = ""
+       except Exception as e:
+           limiter.release()
+           raise _engine_error(e)
+       return SlotStreamingResponse(_resume(first, stream), limiter, media_type="text/plain; charset=utf-8")
+
+   try:
+       text = "".join([chunk async for chunk in chunks(meta)])
+   except Exception as e:
+       raise _engine_error(e)
+   finally:
+       limiter.release()
+   return JSONResponse({**extra, field: text, "meta": meta})
+
+
+async def health(request: Request):
+   return JSONResponse({
+       "status": "ok",
+       "index_loaded": request.app.state.engine.vectorstore is not None,
+       **request.app.state.limiter.stats(),
+   })
+
+
+async def metrics(request: Request):
+   return PlainTextResponse(tracer.metrics.render(), headers={"Content-Type": "text/plain; version=0.0.4"})
+
+
+async def summary(request: Request):
+   country = request.query_params.get("country")
+   if not country:
+       raise HTTPException(400, "'country' is required")
+   types = request.query_params.get("types")
+   return JSONResponse({
+       "country": country,
+       "summary": _summary(request, country, types),
+       "analytics": request.app.state.analyzer.get_country_analytics(country, _types(types)).to_dict(),
+   })
+
+
+async def compare(request: Request):
+   table = request.app.state.analyzer.compare_countries(
+       _types(request.query_params.get("countries"), "countries"), _types(request.query_params.get("types"))
+   )
+   rows = table.astype(object).where(table.notna(), None).reset_index().rename(columns={"Country": "country"})
+   return JSONResponse({"countries": rows.to_dict("records")})
+
+
+async def retrieve(request: Request):
+   body = await _json_body(request)
+   queries = body.get("queries") or ([body["query"]] if body.get("query") else None)
+   if not queries:
+       raise HTTPException(400, "'query' or 'queries' is required")
+   if not isinstance(queries, list) or not all(isinstance(q, str) and q.strip() for q in queries):
+       raise HTTPException(400, "'query' must be a string and 'queries' a list of strings")
+   k = _int_field(body, "k", 5, MAX_RETRIEVE_K)
+   limiter = await _acquire(request)
+   try:
+       documents = await request.app.state.engine.asearch_documents(
+           list(queries), body.get("country") or "", k
+       )
+   except RetrievalError as e:
+       raise _engine_error(e)
+   finally:
+       limiter.release()
+   return JSONResponse({"documents": documents})
+
+
+async def answer(request: Request):
+   body = await _json_body(request)
+   question, country = _required(body, "question"), _required(body, "country")
+   history = body.get("history") or []
+   if not isinstance(history, list) or not all(isinstance(turn, list) and len(turn) == 2 for turn in history):
+       raise HTTPException(400, "'history' must be a list of [question, answer] pairs")
+   conversation = ConversationMemory.from_turns((str(q), str(a)) for q, a in history)
+   # Count and capacity questions are answered from the PRIS table, without a concurrency slot
+   meta: Dict = {}
+   text = request.app.state.analyzer.answer_structured(question, country, _types(body.get("types")), meta, conversation)
+   if text is not None:
+       if body.get("stream"):
+           return PlainTextResponse(text)
+       return JSONResponse({"country": country, "question": question, "answer": text, "meta": meta})
+   data_summary = _summary(request, country, body.get("types"))
+   engine = request.app.state.engine
+   return await _generate(
+       request, body, lambda meta: engine.astream_answer(question, country, data_summary, meta, conversation),
+       "answer", {"country": country, "question": question},
+   )
+
+
+async def analysis(request: Request):
+   body = await _json_body(request)
+   country = _required(body, "country")
+   questions = body.get("questions") or [
+       q for topic_questions in DYNAMIC_QUESTIONS.get(country, {}).values() for q in topic_questions
+   ]
+   if not questions:
+       raise HTTPException(400, f"'questions' is required for {country}")
+   data_summary = _summary(request, country, body.get("types"))
+   engine = request.app.state.engine
+   return await _generate(
+       request, body, lambda meta: engine.astream_analysis(questions, country, data_summary, meta),
+       "report", {"country": country, "questions": questions},
+   )
+
+
+async def _http_error(request: Request, exc: HTTPException):
+   return JSONResponse({"error": exc.detail}, status_code=exc.status_code, headers=exc.headers)
+
+
+def create_app(analyzer: Optional[DataAnalyzer] = None, engine: Optional[RAGQueryEngine] = None,
+               max_concurrency: Optional[int] = None, max_queue: Optional[int] = None) -> Starlette:
+   """ASGI app; the analyzer and engine are built at startup unless given"""
+
+   @asynccontextmanager
+   async def lifespan(app: Starlette):
+       app.state.analyzer = analyzer or await asyncio.to_thread(
+           DataAnalyzer, os.environ.get("PRIS_CSV_PATH", PRIS_CSV_PATH)
+       )
+       app.state.engine = engine or await asyncio.to_thread(build_engine)
+       yield
+
+   app = Starlette(
+       routes=[
+           Route("/health", health),
+           Route("/metrics", metrics),
+           Route("/summary", summary),
+           Route("/compare", compare),
+           Route("/retrieve", retrieve, methods=["POST"]),
+           Route("/answer", answer, methods=["POST"]),
+           Route("/analysis", analysis, methods=["POST"]),
+       ],
+       exception_handlers={HTTPException: _http_error},
+       lifespan=lifespan,
+   )
+   app.state.limiter = ConcurrencyLimiter(
+       max_concurrency or int(os.environ.get("PRIS_API_MAX_CONCURRENCY", "4")),
+       max_queue if max_queue is not None else int(os.environ.get("PRIS_API_MAX_QUEUE", "32")),
+   )
+   return app
+
+
+app = create_app()
@@ -0,0 +1,264 @@
+"""Batch generation of the guided-analysis reports for every country and topic group
+
+Usage:
+   python batch_reports.py                               # all of COUNTRIES x DYNAMIC_QUESTIONS
+   python batch_reports.py --countries Japan China --workers 2
+   python batch_reports.py --output-dir reports --force  # regenerate finished reports
+
+Every finished report is appended to <output-dir>/reports.jsonl before the
+next one is picked up, so an interrupted run resumes where it stopped.
+Reports are also written as <output-dir>/<country>/<topic>.md, and the
+run's throughput summary goes to <output-dir>/summary.json.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from context_budget import count_tokens
+from errors import RetrievalError
+from final_app import COUNTRIES, DYNAMIC_QUESTIONS, FAISS_INDEX_PATH, PRIS_CSV_PATH, DataAnalyzer, RAGQueryEngine
+
+
+CHECKPOINT_NAME = "reports.jsonl"
+SUMMARY_NAME = "summary.json"
+
+Job = Tuple[str, str, List[str]]  # (country, topic, questions)
+
+
+def _slug(text: str) -> str:
+   return re.sub(r"[^a-z0-9]+", "_", text.lower()).strip("_") or "report"
+
+
+def report_key(country: str, topic: str, questions: List[str], data_summary: str, model: str) -> str:
+   """Identity of a report; edited questions, new statistics or another model make it stale"""
+   payload = json.dumps([country, topic, questions, data_summary, model], ensure_ascii=False)
+   return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def question_matrix(countries: Optional[List[str]] = None, topics: Optional[List[str]] = None) -> List[Job]:
+   """(country, topic, questions) for every selected country and topic group, in UI order"""
+   jobs = []
+   for country in countries or COUNTRIES:
+       for topic, questions in DYNAMIC_QUESTIONS.get(country, {}).items():
+           if topics and not any(t.lower() in topic.lower() for t in topics):
+               continue
+           jobs.append((country, topic, questions))
+   return jobs
+
+
+def load_checkpoint(path: str) -> Dict[str, Dict]:
+   """Finished reports by key; a torn last line from an interrupted write is ignored"""
+   done = {}
+   if not os.path.exists(path):
+       return done
+   with open(path, encoding="utf-8") as f:
+       for line in f:
+           try:
+               record = json.loads(line)
+           except ValueError:
+               continue
+           done[record["key"]] = record
+   return done
+
+
+def _is_rate_limit(exc: Exception) -> bool:
+   if isinstance(exc, RetrievalError) and exc.__cause__ is not None:
+       exc = exc.__cause__
+   status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+   return status == 429 or type(exc).__name__ in ("RateLimitError", "APITimeoutError", "APIConnectionError")
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+   headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+   try:
+       return float(headers.get("retry-after"))
+   except (TypeError, ValueError):
+       return None
+
+
+class BatchRunner:
+   """Generates reports through a bounded pool of async workers, checkpointing each one"""
+
+   def __init__(self, engine: RAGQueryEngine, analyzer: DataAnalyzer, output_dir: str, model: str,
+                workers: int = 4, max_retries: int = 6, base_delay: float = 2.0, max_delay: float = 60.0,
+                types: Optional[List[str]] = None):
+       self.engine = engine
+       self.analyzer = analyzer
+       self.output_dir = output_dir
+       self.model = model
+       self.workers = workers
+       self.max_retries = max_retries
+       self.base_delay = base_delay
+       self.max_delay = max_delay
+       self.types = types
+       self.checkpoint_path = os.path.join(output_dir, CHECKPOINT_NAME)
+       self.stats = {
+           "generated": 0, "resumed": 0, "failed": 0, "retries": 0,
+           "context_tokens": 0, "report_tokens": 0,
+           "cache_hits": 0, "semantic_hits": 0, "cache_misses": 0,
+       }
+       self.failures: List[Dict] = []
+
+   async def _with_backoff(self, label: str, call):
+       """Retry rate-limit and transient API errors with capped exponential backoff and jitter"""
+       for attempt in range(self.max_retries + 1):
+           try:
+               return await call()
+           except Exception as e:
+               if attempt == self.max_retries or not _is_rate_limit(e):
+                   raise
+               delay = _retry_after(e) or min(self.max_delay, self.base_delay * 2 ** attempt)
+               delay *= random.uniform(1.0, 1.25)
+               self.stats["retries"] += 1
+               print(f"  rate limited on {label}; retrying in {delay:.1f}s")
+               await asyncio.sleep(delay)
+
+   async def _generate(self, country: str, topic: str, questions: List[str], data_summary: str) -> Tuple[str, Dict]:
+       label = f"{country} / {topic}"
+       # Embed the questions first, with backoff, so the engine's own embedding lookup is free
+       await self._with_backoff(label, lambda: self.engine.embeddings.aembed_documents(questions))
+
+       async def generate():
+           meta: Dict = {}
+           report = await self.engine.agenerate_analysis(questions, country, data_summary, meta)
+           return report, meta
+
+       return await self._with_backoff(label, generate)
+
+   def _write(self, record: Dict, checkpoint):
+       country_dir = os.path.join(self.output_dir, _slug(record["country"]))
+       os.makedirs(country_dir, exist_ok=True)
+       with open(os.path.join(country_dir, f"{_slug(record['topic'])}.md"), "w", encoding="utf-8") as f:
+           f.write(f"# {record['country']} — {record['topic']}\n\n")
+           f.write("".join(f"- {q}\n" for q in record["questions"]))
+           f.write(f"\n{record['report']}\n")
+       checkpoint.write(json.dumps(record, ensure_ascii=False) + "\n")
+       checkpoint.flush()
+       os.fsync(checkpoint.fileno())
+
+   async def _worker(self, queue: "asyncio.Queue", checkpoint):
+       while True:
+           try:
+               key, country, topic, questions, data_summary = queue.get_nowait()
+           except asyncio.QueueEmpty:
+               return
+           started = time.perf_counter()
+           try:
+               report, meta = await self._generate(country, topic, questions, data_summary)
+           except Exception as e:
+               self.stats["failed"] += 1
+               self.failures.append({"country": country, "topic": topic, "error": str(e)})
+               print(f"  failed {country} / {topic}: {e}")
+               continue
+
+           cache = meta.get("cache", "miss")
+           self.stats[{"hit": "cache_hits", "semantic": "semantic_hits"}.get(cache, "cache_misses")] += 1
+           report_tokens = count_tokens(report, self.model)
+           self.stats["generated"] += 1
+           self.stats["context_tokens"] += meta.get("context_tokens", 0)
+           self.stats["report_tokens"] += report_tokens
+           self._write({
+               "key": key,
+               "country": country,
+               "topic": topic,
+               "questions": questions,
+               "model": self.model,
+               "report": report,
+               "report_tokens": report_tokens,
+               "meta": meta,
+               "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+           }, checkpoint)
+           print(f"  {country} / {topic}: {time.perf_counter() - started:.1f}s ({cache})")
+
+   async def run(self, jobs: List[Job], force: bool = False) -> Dict:
+       os.makedirs(self.output_dir, exist_ok=True)
+       done = {} if force else load_checkpoint(self.checkpoint_path)
+       queue: "asyncio.Queue" = asyncio.Queue()
+       for country, topic, questions in jobs:
+           data_summary = self.analyzer.get_country_summary(country, self.types)
+           key = report_key(country, topic, questions, data_summary, self.model)
+           if key in done:
+               self.stats["resumed"] += 1
+               continue
+           queue.put_nowait((key, country, topic, questions, data_summary))
+
+       print(f"{len(jobs)} reports: {self.stats['resumed']} already done, {queue.qsize()} to generate "
+             f"with {self.workers} workers")
+       started = time.perf_counter()
+       # Always append: with --force the newest record for a key wins on the next load
+       with open(self.checkpoint_path, "a", encoding="utf-8") as checkpoint:
+           await asyncio.gather(*(self._worker(queue, checkpoint) for _ in range(self.workers)))
+       elapsed = time.perf_counter() - started
+
+       summary = {
+           **self.stats,
+           "reports": len(jobs),
+           "workers": self.workers,
+           "model": self.model,
+           "elapsed_seconds": round(elapsed, 2),
+           "reports_per_minute": round(self.stats["generated"] / elapsed * 60, 2) if elapsed else 0.0,
+           "query_embeddings": dict(self.engine.embeddings.stats),
+           "failures": self.failures,
+       }
+       with open(os.path.join(self.output_dir, SUMMARY_NAME), "w", encoding="utf-8") as f:
+           json.dump(summary, f, ensure_ascii=False, indent=2)
+       return summary
+
+
+def print_summary(summary: Dict):
+   print(f"Reports: {summary['generated']} generated, {summary['resumed']} resumed, {summary['failed']} failed "
+         f"in {summary['elapsed_seconds']:.1f}s ({summary['reports_per_minute']:.1f} reports/min, "
+         f"{summary['workers']} workers)")
+   print(f"Tokens: {summary['context_tokens']:,} context, {summary['report_tokens']:,} report")
+   print(f"Response cache: {summary['cache_hits']} hits, {summary['semantic_hits']} similar, "
+         f"{summary['cache_misses']} misses; query embeddings: {summary['query_embeddings']['memory_hits']} "
+         f"memory hits, {summary['query_embeddings']['disk_hits']} disk hits, "
+         f"{summary['query_embeddings']['misses']} misses")
+   print(f"Rate-limit retries: {summary['retries']}")
+
+
+def main():
+   parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+   parser.add_argument("--countries", nargs="+", help="default: every country in COUNTRIES")
+   parser.add_argument("--topics", nargs="+", help="substrings of topic group names, e.g. Safety Fuel")
+   parser.add_argument("--types", nargs="+", help="reactor type filter for the statistics summary")
+   parser.add_argument("--output-dir", default="reports")
+   parser.add_argument("--workers", type=int, default=4, help="reports generated concurrently")
+   parser.add_argument("--max-retries", type=int, default=6, help="retries per call after rate limits")
+   parser.add_argument("--index-dir", default=FAISS_INDEX_PATH)
+   parser.add_argument("--csv", default=PRIS_CSV_PATH)
+   parser.add_argument("--embedder", default="openai", help="'openai[:model]' or 'hashing[:size]' (offline)")
+   parser.add_argument("--model", default="gpt-4")
+   parser.add_argument("--force", action="store_true", help="ignore the checkpoint and regenerate everything")
+   args = parser.parse_args()
+
+   from langchain_openai import ChatOpenAI
+   from offline import get_embeddings
+
+   jobs = question_matrix(args.countries, args.topics)
+   if not jobs:
+       parser.error("no country/topic matches the selection")
+   # Backoff is handled here, so the client should surface 429s instead of retrying silently
+   engine = RAGQueryEngine(args.index_dir, embeddings=get_embeddings(args.embedder),
+                           llm=ChatOpenAI(model=args.model, temperature=0, max_retries=0))
+   if engine.vectorstore is None:
+       parser.error(f"could not load the FAISS index from {args.index_dir}")
+   runner = BatchRunner(engine, DataAnalyzer(args.csv), args.output_dir, args.model,
+                        workers=args.workers, max_retries=args.max_retries, types=args.types)
+   try:
+       summary = asyncio.run(runner.run(jobs, force=args.force))
+   except KeyboardInterrupt:
+       print(f"Interrupted; {runner.stats['generated']} new reports are checkpointed, rerun to resume")
+       return
+   print_summary(summary)
+
+
+if __name__ == "__main__":
+   main()
@@ -0,0 +1,112 @@
+"""Benchmark: recall, latency and memory of HNSW / IVF-PQ indexes against the exact flat index
+
+Builds every index type over one corpus (synthetic clustered vectors, or
+the vectors of an existing index with --index-dir) and sweeps the search
+knobs. Every configuration runs with and without the exact rerank pass the
+engine uses, which fetches rerank_factor * k candidates and re-scores them
+against the memory-mapped exact vectors. Recall@k is measured against
+exact flat search. Index MB is the in-memory index. The exact vectors
+behind the rerank stay on disk and are paged in per candidate.
+
+Usage: python benchmarks/bench_ann_index.py [--chunks 100000] [--dim 384] [--queries 500]
+       python benchmarks/bench_ann_index.py --index-dir faiss_index
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_index import ExactReranker, build_index, configure, index_bytes, write_exact_vectors
+
+
+def synthetic_corpus(n: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+   """Topic clusters with per-chunk noise, like chunks of many profiles covering the same themes"""
+   topics = rng.normal(size=(max(16, n // 200), dim)).astype(np.float32)
+   vectors = topics[rng.integers(0, len(topics), size=n)] + rng.normal(scale=0.6, size=(n, dim))
+   return vectors.astype(np.float32)
+
+
+def load_corpus(index_dir: str) -> np.ndarray:
+   from mmap_docstore import INDEX_NAME, read_faiss_index
+   index = read_faiss_index(os.path.join(index_dir, INDEX_NAME))
+   return index.reconstruct_n(0, index.ntotal).astype(np.float32)
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+   k = truth.shape[1]
+   return float(np.mean([len(set(f[:k].tolist()) & set(t.tolist())) / k for f, t in zip(found, truth)]))
+
+
+def timed_search(index, reranker, queries: np.ndarray, k: int, rerank_factor: int) -> tuple:
+   """One query per call, as the app searches; returns (rows, ms per query)"""
+   rows = []
+   start = time.perf_counter()
+   for query in queries:
+       query = query[None, :]
+       if reranker is not None:
+           _, candidates = index.search(query, k * rerank_factor)
+           _, found = reranker.rerank(query, candidates, k)
+       else:
+           _, found = index.search(query, k)
+       rows.append(found[0])
+   return np.stack(rows), (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+   parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+   parser.add_argument("--chunks", type=int, default=100_000)
+   parser.add_argument("--dim", type=int, default=384)
+   parser.add_argument("--index-dir", help="benchmark the vectors of an existing index instead")
+   parser.add_argument("--queries", type=int, default=500)
+   parser.add_argument("--k", type=int, default=20, help="the engine's fetch_k for k=5")
+   parser.add_argument("--rerank-factors", type=int, nargs="+", default=[4, 10],
+                       help="candidates per result for the exact rerank pass")
+   parser.add_argument("--types", nargs="+", default=["flat", "hnsw", "ivfpq"])
+   args = parser.parse_args()
+
+   rng = np.random.default_rng(0)
+   vectors = load_corpus(args.index_dir) if args.index_dir else synthetic_corpus(args.chunks, args.dim, rng)
+   # Queries near, but not on, corpus vectors
+   queries = vectors[rng.integers(0, len(vectors), size=args.queries)]
+   queries = (queries + rng.normal(scale=0.3, size=queries.shape)).astype(np.float32)
+
+   with tempfile.TemporaryDirectory() as tmp:
+       write_exact_vectors(tmp, vectors)
+       reranker = ExactReranker.load(tmp, len(vectors))
+       print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {args.queries} queries, recall@{args.k} vs flat; "
+             f"exact vectors for reranking: {vectors.nbytes / 2**20:.1f} MB on disk")
+
+       baseline = None
+       print(f"{'index':<22} {'build s':>8} {'index MB':>9} {'rerank':>7} {'ms/query':>9} {'recall':>7}")
+       for index_type in args.types:
+           start = time.perf_counter()
+           index = build_index(vectors, index_type)
+           build_seconds = time.perf_counter() - start
+           size_mb = index_bytes(index) / 2**20
+
+           if index_type == "flat":
+               sweep = [("", {})]
+           elif index_type.lower().startswith("hnsw"):
+               sweep = [(f"ef={ef}", {"ef_search": ef}) for ef in (16, 64, 128)]
+           else:
+               sweep = [(f"nprobe={n}", {"nprobe": n}) for n in (4, 16, 64)]
+
+           for label, params in sweep:
+               configure(index, **params)
+               factors = [1] if index_type == "flat" else [1, *args.rerank_factors]
+               for factor in factors:
+                   rows, ms = timed_search(index, reranker if factor > 1 else None, queries, args.k, factor)
+                   if baseline is None:
+                       baseline = rows
+                   name = f"{index_type} {label}".strip()
+                   print(f"{name:<22} {build_seconds:>8.1f} {size_mb:>9.1f} "
+                         f"{('x' + str(factor)) if factor > 1 else '-':>7} {ms:>9.3f} {recall(rows, baseline):>7.3f}")
+
+
+if __name__ == "__main__":
+   main()
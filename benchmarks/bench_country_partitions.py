@@ -0,0 +1,100 @@
+"""Benchmark: per-country sub-indexes vs metadata-filtered global FAISS search
+
+Builds synthetic multi-country corpora of growing size and compares the
+app's former path, FAISS.similarity_search(filter={"country": ...}) with
+its default fetch_k=20 over-fetch, against CountryPartitions routing.
+Recall@5 is measured against exact search restricted to the country.
+
+Usage: python benchmarks/bench_country_partitions.py [--chunks-per-country 160] [--queries 200]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from country_partitions import CountryPartitions
+
+
+def synthetic_corpus(n_countries: int, per_country: int, dim: int, rng: np.random.Generator):
+   """Countries share topics (global centroids) plus a weaker country-specific offset"""
+   topics = rng.normal(size=(32, dim)).astype(np.float32)
+   offsets = rng.normal(scale=0.35, size=(n_countries, dim)).astype(np.float32)
+   topic_ids = rng.integers(0, len(topics), size=n_countries * per_country)
+   countries = np.repeat(np.arange(n_countries), per_country)
+   vectors = topics[topic_ids] + offsets[countries] + rng.normal(scale=0.5, size=(len(countries), dim))
+   return vectors.astype(np.float32), countries, topics, offsets
+
+
+def build_store(vectors: np.ndarray, countries: np.ndarray):
+   import faiss
+   from langchain_community.docstore.in_memory import InMemoryDocstore
+   from langchain_community.vectorstores import FAISS
+   from langchain_core.documents import Document
+   from langchain_core.embeddings import FakeEmbeddings
+
+   index = faiss.IndexFlatL2(vectors.shape[1])
+   index.add(vectors)
+   docstore = InMemoryDocstore({
+       str(i): Document(page_content=str(i), metadata={"country": f"C{c}"}) for i, c in enumerate(countries)
+   })
+   return FAISS(FakeEmbeddings(size=vectors.shape[1]), index, docstore, {i: str(i) for i in range(len(countries))})
+
+
+def run(n_countries: int, per_country: int, n_queries: int, dim: int, k: int, rng: np.random.Generator) -> dict:
+   vectors, countries, topics, offsets = synthetic_corpus(n_countries, per_country, dim, rng)
+   store = build_store(vectors, countries)
+   partitions = CountryPartitions.build(vectors, [f"C{c}" for c in countries])
+
+   query_countries = rng.integers(0, n_countries, size=n_queries)
+   queries = (topics[rng.integers(0, len(topics), size=n_queries)] + offsets[query_countries]
+              + rng.normal(scale=0.5, size=(n_queries, dim))).astype(np.float32)
+
+   filtered_time = partitioned_time = 0.0
+   filtered_recall = partitioned_recall = 0.0
+   for query, c in zip(queries, query_countries):
+       members = np.flatnonzero(countries == c)
+       exact = set(members[np.argsort(((vectors[members] - query) ** 2).sum(axis=1))[:k]].tolist())
+
+       start = time.perf_counter()
+       docs = store.similarity_search_with_score_by_vector(query.tolist(), k=k, filter={"country": f"C{c}"})
+       filtered_time += time.perf_counter() - start
+       filtered_recall += len(exact & {int(doc.page_content) for doc, _ in docs}) / k
+
+       start = time.perf_counter()
+       _, rows = partitions.search(f"C{c}", query[None, :], k)
+       partitioned_time += time.perf_counter() - start
+       partitioned_recall += len(exact & set(rows[0].tolist())) / k
+
+   return {
+       "countries": n_countries,
+       "chunks": len(vectors),
+       "filtered_ms": filtered_time / n_queries * 1000,
+       "partitioned_ms": partitioned_time / n_queries * 1000,
+       "filtered_recall": filtered_recall / n_queries,
+       "partitioned_recall": partitioned_recall / n_queries,
+   }
+
+
+def main():
+   parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+   parser.add_argument("--chunks-per-country", type=int, default=160)
+   parser.add_argument("--queries", type=int, default=200)
+   parser.add_argument("--dim", type=int, default=384)
+   parser.add_argument("--countries", type=int, nargs="+", default=[7, 25, 100, 250])
+   args = parser.parse_args()
+
+   rng = np.random.default_rng(0)
+   print(f"{'countries':>9} {'chunks':>8} {'filtered ms':>12} {'partitioned ms':>15} "
+         f"{'filtered R@5':>13} {'partitioned R@5':>16}")
+   for n_countries in args.countries:
+       row = run(n_countries, args.chunks_per_country, args.queries, args.dim, 5, rng)
+       print(f"{row['countries']:>9} {row['chunks']:>8} {row['filtered_ms']:>12.3f} {row['partitioned_ms']:>15.3f} "
+             f"{row['filtered_recall']:>13.3f} {row['partitioned_recall']:>16.3f}")
+
+
+if __name__ == "__main__":
+   main()
@@ -0,0 +1,54 @@
+"""Micro-benchmark: precomputed country summary index vs per-call DataFrame filtering
+
+Usage: python benchmarks/bench_country_summary.py [--repeat N]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from final_app import COUNTRIES, PRIS_CSV_PATH, DataAnalyzer
+
+
+def legacy_country_summary(df, country: str) -> str:
+   """The original per-call filtering implementation of get_country_summary"""
+   country_data = df[df['Country'] == country]
+   operational = country_data[country_data['Status'] == 'Operational']
+   valid_dates = country_data['First Grid Connection'].dropna()
+   latest_connection = "No connected units" if len(valid_dates) == 0 else max(valid_dates)
+   return f"""Nuclear Power Statistics for {country}:
+       - Total Units: {len(country_data)}
+       - Operational Units: {len(operational)}
+       - Total Capacity: {operational['Gross Electrical Capacity [MW]'].sum():,.0f} MW
+       - Reactor Types: {', '.join(country_data['Type'].unique())}
+       - Latest Connection: {latest_connection}
+       """
+
+
+def main():
+   parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+   parser.add_argument("--repeat", type=int, default=200, help="calls per country")
+   args = parser.parse_args()
+
+   os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+   start = timeit.default_timer()
+   analyzer = DataAnalyzer(PRIS_CSV_PATH)
+   print(f"DataAnalyzer load (incl. summary index): {(timeit.default_timer() - start) * 1000:.2f} ms")
+
+   countries = COUNTRIES + sorted(set(analyzer.df['Country'].dropna()) - set(COUNTRIES))[:10]
+   calls = args.repeat * len(countries)
+   legacy = timeit.timeit(lambda: [legacy_country_summary(analyzer.df, c) for c in countries], number=args.repeat)
+   indexed = timeit.timeit(lambda: [analyzer.get_country_summary(c) for c in countries], number=args.repeat)
+   filtered = timeit.timeit(lambda: [analyzer.get_country_summary(c, ['PWR', 'BWR']) for c in countries], number=args.repeat)
+
+   print(f"{'path':<34}{'per call':>12}")
+   print(f"{'legacy per-call filtering':<34}{legacy / calls * 1e6:>9.1f} us")
+   print(f"{'summary index':<34}{indexed / calls * 1e6:>9.1f} us")
+   print(f"{'summary index + type filter':<34}{filtered / calls * 1e6:>9.1f} us")
+   print(f"speedup: {legacy / indexed:.0f}x")
+
+
+if __name__ == "__main__":
+   main()
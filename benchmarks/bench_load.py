@@ -0,0 +1,300 @@
+"""Load test: PRIS summaries, retrieval, analysis and chat under concurrent sessions, offline
+
+Each scale runs in a fresh process against a synthetic PRIS table and CNPP
+corpus that are N times the shipped size. Embeddings are HashingEmbeddings
+and generation is FakeChatModel, both with configurable latency, so
+results depend only on this code. Per scale the output records startup
+time per stage, peak RSS, and, per operation and session count, p50/p95/p99
+latency and throughput.
+
+Usage:
+   python benchmarks/bench_load.py --scales 1 10 100 --sessions 1 8 32 --output load.json
+   python benchmarks/bench_load.py --compare load.json --output load_new.json   # run and diff
+   python benchmarks/bench_load.py --diff load.json load_new.json               # diff only
+
+Scale 1000 builds ~1.1M chunks; use a small --dim and expect several GB of RAM.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from typing import Dict, List
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BASE_CHUNKS = 1140  # chunks in the shipped faiss_index
+RESULT_VERSION = 1
+OPERATIONS = ("summary", "retrieve", "answer", "analysis")
+# Metrics where a higher value is an improvement; everything else is a cost
+HIGHER_IS_BETTER = ("throughput_per_s",)
+
+
+def synthetic_pris(path: str, scale: int, rng: random.Random):
+   """PRIS.csv with every unit repeated scale times under a distinct name"""
+   with open(os.path.join(ROOT, "PRIS.csv"), encoding="utf-8") as f:
+       header, *rows = f.read().splitlines()
+   with open(path, "w", encoding="utf-8") as f:
+       f.write(header + "\n")
+       for copy in range(scale):
+           for row in rows:
+               fields = row.split(",")
+               if copy and len(fields) > 1 and fields[1]:
+                   fields[1] = f"{fields[1]}-S{copy}"
+               f.write(",".join(fields) + "\n")
+
+
+def synthetic_corpus(index_dir: str, scale: int, dim: int, rng: random.Random) -> int:
+   """CNPP-like chunks built from guided-question vocabulary, with random vectors; returns chunk count"""
+   from final_app import COUNTRIES, DYNAMIC_QUESTIONS, REACTOR_TYPES
+   from ingest import text_key, write_index
+
+   sentences = [q.rstrip("?") + "." for topics in DYNAMIC_QUESTIONS.values() for qs in topics.values() for q in qs]
+   np_rng = np.random.default_rng(rng.randrange(1 << 30))
+   chunks, vectors = [], {}
+   for i in range(BASE_CHUNKS * scale):
+       country = COUNTRIES[i % len(COUNTRIES)]
+       reactor_type = REACTOR_TYPES[i % len(REACTOR_TYPES)]
+       text = (f"Section {i}. {country} operates {rng.randint(1, 40)} {reactor_type} units "
+               f"totalling {rng.randint(500, 90000)} MW. " + " ".join(rng.sample(sentences, 6)))
+       vector = np_rng.normal(size=dim).astype(np.float32)
+       vectors[text_key(text)] = vector / np.linalg.norm(vector)
+       chunks.append({"id": f"synthetic-{i}", "text": text,
+                      "metadata": {"country": country, "source": "CNPP", "doc_type": "policy"}})
+   write_index(index_dir, chunks, vectors)
+   return len(chunks)
+
+
+def percentiles(latencies: List[float], wall_seconds: float, errors: int) -> Dict[str, float]:
+   ms = np.asarray(latencies) * 1000 if latencies else np.zeros(1)
+   return {
+       "p50_ms": round(float(np.percentile(ms, 50)), 3),
+       "p95_ms": round(float(np.percentile(ms, 95)), 3),
+       "p99_ms": round(float(np.percentile(ms, 99)), 3),
+       "mean_ms": round(float(ms.mean()), 3),
+       "throughput_per_s": round(len(latencies) / wall_seconds, 3) if wall_seconds else 0.0,
+       "errors": errors,
+   }
+
+
+def run_scale(config: Dict) -> Dict:
+   """One scale in a fresh process, so startup time and peak RSS are not shared between scales"""
+   import resource
+
+   rng = random.Random(config["seed"])
+   scale = config["scale"]
+   with tempfile.TemporaryDirectory() as workdir:
+       csv_path = os.path.join(workdir, "PRIS.csv")
+       index_dir = os.path.join(workdir, "index")
+       os.makedirs(index_dir)
+       synthetic_pris(csv_path, scale, rng)
+
+       startup = {}
+       started = time.perf_counter()
+       from final_app import DYNAMIC_QUESTIONS, DataAnalyzer, RAGQueryEngine
+       from embedding_cache import CachedEmbeddings
+       from offline import FakeChatModel, HashingEmbeddings
+       startup["import_seconds"] = time.perf_counter() - started
+
+       chunks = synthetic_corpus(index_dir, scale, config["dim"], rng)
+
+       started = time.perf_counter()
+       analyzer = DataAnalyzer(csv_path)
+       startup["analyzer_seconds"] = time.perf_counter() - started
+
+       embeddings = HashingEmbeddings(config["dim"], latency_seconds=config["embedding_latency"])
+       llm = FakeChatModel(first_token_seconds=config["first_token_latency"],
+                           token_seconds=config["token_latency"], reply_tokens=config["reply_tokens"])
+       started = time.perf_counter()
+       engine = RAGQueryEngine(index_dir, embeddings=embeddings, llm=llm)
+       startup["engine_seconds"] = time.perf_counter() - started
+       # No disk tier, so earlier runs can't turn embedding misses into hits
+       engine.embeddings = CachedEmbeddings(embeddings, db_path=None)
+       started = time.perf_counter()
+       engine.lexical_index
+       startup["lexical_index_seconds"] = time.perf_counter() - started
+       startup = {key: round(value, 4) for key, value in startup.items()}
+
+       topics = [(country, questions) for country, groups in DYNAMIC_QUESTIONS.items()
+                 for questions in groups.values()]
+       counter = iter(range(1 << 62))
+
+       def call(operation: str):
+           country, questions = topics[rng.randrange(len(topics))]
+           # A unique suffix keeps every request a response- and embedding-cache miss
+           question = f"{rng.choice(questions)} (request {next(counter)})"
+           if operation == "summary":
+               return analyzer.get_country_summary(country)
+           if operation == "retrieve":
+               return engine.get_relevant_documents(question, country)
+           summary = analyzer.get_country_summary(country)
+           if operation == "answer":
+               return engine.answer_question(question, country, summary)
+           return engine.generate_analysis([question] + questions[1:], country, summary)
+
+       def timed(operation: str):
+           started = time.perf_counter()
+           call(operation)
+           return time.perf_counter() - started
+
+       operations = {}
+       for operation in config["operations"]:
+           requests = config["requests"] * (20 if operation in ("summary", "retrieve") else 1)
+           operations[operation] = {}
+           for sessions in config["sessions"]:
+               latencies, errors = [], 0
+               started = time.perf_counter()
+               with ThreadPoolExecutor(sessions) as pool:
+                   for future in [pool.submit(timed, operation) for _ in range(requests)]:
+                       try:
+                           latencies.append(future.result())
+                       except Exception:
+                           errors += 1
+               operations[operation][str(sessions)] = percentiles(latencies, time.perf_counter() - started, errors)
+
+       return {
+           "scale": scale,
+           "chunks": chunks,
+           "pris_rows": len(analyzer.df),
+           "startup": startup,
+           "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+           "operations": operations,
+       }
+
+
+def flatten(results: Dict) -> Dict[str, float]:
+   """metric path -> value, e.g. 'scale=10/answer/sessions=8/p95_ms'"""
+   flat = {}
+   for row in results["scales"]:
+       prefix = f"scale={row['scale']}"
+       flat[f"{prefix}/peak_rss_mb"] = row["peak_rss_mb"]
+       for key, value in row["startup"].items():
+           flat[f"{prefix}/startup/{key}"] = value
+       for operation, by_sessions in row["operations"].items():
+           for sessions, metrics in by_sessions.items():
+               for key, value in metrics.items():
+                   flat[f"{prefix}/{operation}/sessions={sessions}/{key}"] = value
+   return flat
+
+
+def diff(old: Dict, new: Dict, threshold: float) -> List[str]:
+   """Print metrics that changed by more than threshold; returns the regressions"""
+   before, after = flatten(old), flatten(new)
+   regressions = []
+   print(f"{'metric':<58} {'before':>12} {'after':>12} {'change':>9}")
+   for path in sorted(before.keys() & after.keys()):
+       a, b = before[path], after[path]
+       if path.endswith("/errors"):
+           changed = b != a
+           worse = b > a
+           change = f"{b - a:+d}"
+       else:
+           if not a:
+               continue
+           relative = (b - a) / a
+           changed = abs(relative) > threshold
+           worse = relative < 0 if path.endswith(HIGHER_IS_BETTER) else relative > 0
+           change = f"{relative:+.1%}"
+       if changed:
+           flag = " REGRESSION" if worse else ""
+           print(f"{path:<58} {a:>12} {b:>12} {change:>9}{flag}")
+           if worse:
+               regressions.append(path)
+   for path in sorted(before.keys() ^ after.keys()):
+       print(f"{path:<58} only in {'before' if path in before else 'after'}")
+   print(f"{len(regressions)} regressions beyond {threshold:.0%}")
+   return regressions
+
+
+def _git_commit() -> str:
+   try:
+       return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                             text=True, check=True).stdout.strip()
+   except (OSError, subprocess.CalledProcessError):
+       return "unknown"
+
+
+def print_results(results: Dict):
+   for row in results["scales"]:
+       startup = ", ".join(f"{key.replace('_seconds', '')} {value:.2f}s" for key, value in row["startup"].items())
+       print(f"\nscale {row['scale']}x: {row['chunks']} chunks, {row['pris_rows']} PRIS rows, "
+             f"peak RSS {row['peak_rss_mb']:.0f} MB; startup: {startup}")
+       print(f"  {'operation':<10} {'sessions':>8} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'req/s':>9} {'errors':>7}")
+       for operation, by_sessions in row["operations"].items():
+           for sessions, m in by_sessions.items():
+               print(f"  {operation:<10} {sessions:>8} {m['p50_ms']:>10.2f} {m['p95_ms']:>10.2f} "
+                     f"{m['p99_ms']:>10.2f} {m['throughput_per_s']:>9.1f} {m['errors']:>7}")
+
+
+def main():
+   parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+   parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+   parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32], help="concurrent sessions")
+   parser.add_argument("--operations", nargs="+", choices=OPERATIONS, default=list(OPERATIONS))
+   parser.add_argument("--requests", type=int, default=40,
+                       help="requests per generation run (x20 for summary and retrieve)")
+   parser.add_argument("--dim", type=int, default=256)
+   parser.add_argument("--embedding-latency", type=float, default=0.05, help="seconds per embedding request")
+   parser.add_argument("--first-token-latency", type=float, default=0.3, help="seconds to the first token")
+   parser.add_argument("--token-latency", type=float, default=0.002, help="seconds per further token")
+   parser.add_argument("--reply-tokens", type=int, default=150)
+   parser.add_argument("--seed", type=int, default=0)
+   parser.add_argument("--output", help="write results as JSON")
+   parser.add_argument("--compare", help="diff the new results against this JSON file")
+   parser.add_argument("--diff", nargs=2, metavar=("BEFORE", "AFTER"), help="only diff two result files")
+   parser.add_argument("--threshold", type=float, default=0.10, help="relative change reported by a diff")
+   parser.add_argument("--fail-on-regression", action="store_true", help="exit 1 when a diff finds regressions")
+   args = parser.parse_args()
+
+   if args.diff:
+       with open(args.diff[0]) as f_old, open(args.diff[1]) as f_new:
+           regressions = diff(json.load(f_old), json.load(f_new), args.threshold)
+       sys.exit(1 if regressions and args.fail_on_regression else 0)
+
+   config = {
+       "sessions": args.sessions,
+       "operations": args.operations,
+       "requests": args.requests,
+       "dim": args.dim,
+       "embedding_latency": args.embedding_latency,
+       "first_token_latency": args.first_token_latency,
+       "token_latency": args.token_latency,
+       "reply_tokens": args.reply_tokens,
+       "seed": args.seed,
+   }
+   results = {
+       "version": RESULT_VERSION,
+       "commit": _git_commit(),
+       "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+       "python": platform.python_version(),
+       "config": config,
+       "scales": [],
+   }
+   for scale in args.scales:
+       print(f"running scale {scale}x ...", flush=True)
+       with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+           results["scales"].append(pool.submit(run_scale, {**config, "scale": scale}).result())
+
+   print_results(results)
+   if args.output:
+       with open(args.output, "w") as f:
+           json.dump(results, f, indent=2)
+       print(f"\nwrote {args.output}")
+   if args.compare:
+       with open(args.compare) as f:
+           regressions = diff(json.load(f), results, args.threshold)
+       sys.exit(1 if regressions and args.fail_on_regression else 0)
+
+
+if __name__ == "__main__":
+   main()
@@ -0,0 +1,72 @@
+"""Micro-benchmark: fleet analytics cold vs memoized, and per-country loops vs one groupby comparison
+
+Usage: python benchmarks/bench_pris_analytics.py [--repeat N]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from final_app import PRIS_CSV_PATH
+from pris_analytics import PrisAnalytics
+from pris_data import load_pris
+
+
+def looped_comparison(analytics: PrisAnalytics, countries) -> pd.DataFrame:
+   """One filter and aggregation per country, the way a comparison would be built from profiles"""
+   df = analytics.df
+   rows = {}
+   for country in countries:
+       frame = df[df['Country'] == country]
+       rows[country] = {
+           'units': len(frame),
+           'operational_units': int(frame['operational'].sum()),
+           'operational_capacity': int(frame['op_capacity'].sum()),
+           'under_construction_units': int(frame['construction'].sum()),
+           'under_construction_capacity': int(frame['construction_capacity'].sum()),
+           'mean_age': frame['op_age'].mean(),
+       }
+   return pd.DataFrame.from_dict(rows, orient='index').sort_values('operational_capacity', ascending=False)
+
+
+def main():
+   parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+   parser.add_argument("--repeat", type=int, default=20)
+   args = parser.parse_args()
+
+   os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+   df = load_pris(PRIS_CSV_PATH)
+   countries = sorted(df['Country'].dropna().unique())
+   filters = [None, ['PWR'], ['PWR', 'BWR']]
+   profiles = len(countries) * len(filters)
+
+   def cold():
+       analytics = PrisAnalytics(df)
+       for types in filters:
+           for country in countries:
+               analytics.profile(country, types)
+       return analytics
+
+   start = timeit.default_timer()
+   analytics = cold()
+   cold_ms = (timeit.default_timer() - start) * 1000
+   warm = timeit.timeit(lambda: [analytics.profile(c, t) for t in filters for c in countries], number=args.repeat)
+
+   looped = timeit.timeit(lambda: looped_comparison(analytics, countries), number=args.repeat)
+   grouped = timeit.timeit(lambda: analytics._build_comparison((), ()), number=args.repeat)
+
+   print(f"{len(countries)} countries x {len(filters)} type filters = {profiles} profiles")
+   print(f"{'path':<36}{'time':>12}")
+   print(f"{'profiles, cold (incl. setup)':<36}{cold_ms / profiles * 1000:>9.1f} us per profile")
+   print(f"{'profiles, memoized':<36}{warm / args.repeat / profiles * 1e6:>9.1f} us per profile")
+   print(f"{'comparison, per-country loop':<36}{looped / args.repeat * 1000:>9.2f} ms")
+   print(f"{'comparison, one groupby':<36}{grouped / args.repeat * 1000:>9.2f} ms")
+   print(f"speedup of one groupby: {looped / grouped:.0f}x")
+
+
+if __name__ == "__main__":
+   main()
@@ -0,0 +1,135 @@
+"""Benchmark: PRIS-table routing of chat questions vs the full RAG chain
+
+Runs a labelled question set through the router: count and capacity
+questions for every app country, the guided policy questions and ad-hoc
+policy questions. It reports the routing split, any misrouted questions
+and whether every routed answer matches a direct pandas filter of the PRIS
+table. With an index it also times the RAG chain for the same questions,
+using a simulated chat model with API-like latency, so the per-question
+saving can be compared.
+
+Usage: python benchmarks/bench_query_router.py [--index-dir faiss_index --embedder hashing:64]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from final_app import COUNTRIES, DYNAMIC_QUESTIONS, PRIS_CSV_PATH, DataAnalyzer
+
+
+# (template, expected metric, expected statuses)
+STRUCTURED = [
+   ("How many units are under construction in {country}?", "count", ("Under Construction",)),
+   ("What is the total operational capacity in {country}?", "capacity", ("Operational",)),
+   ("How many reactors are operating in {country}?", "count", ("Operational",)),
+   ("How many nuclear reactors does {country} have?", "count", ()),
+   ("What is {country}'s nuclear capacity in MW?", "capacity", ("Operational",)),
+   ("How many PWR units are operational in {country}?", "count", ("Operational",)),
+   ("How many PWRs are operating in {country}?", "count", ("Operational",)),
+   ("Number of reactors permanently shut down in {country}", "count",
+    ("Permanent Shutdown", "Decommissioning Completed")),
+   ("What capacity is under construction in {country}?", "capacity", ("Under Construction",)),
+]
+POLICY = [
+   "Why is {country} expanding its nuclear program?",
+   "How is {country} managing spent fuel?",
+   "What are the main safety regulations for reactors in {country}?",
+   "How many reactors will {country} build by 2035?",
+   "Which utility operates the most reactors in {country}?",
+   "What is the capacity of the largest plant in {country}?",
+   "How much do reactors in {country} generate?",
+   "How much nuclear energy does {country} produce in TWh?",
+]
+
+
+def expected_count(df, country: str, statuses, types=None):
+   rows = df[df['Country'] == country]
+   if statuses:
+       rows = rows[rows['Status'].isin(statuses)]
+   if types:
+       rows = rows[rows['Type'].isin(types)]
+   return len(rows), int(rows['Gross Electrical Capacity [MW]'].fillna(0).sum())
+
+
+def main():
+   parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+   parser.add_argument("--index-dir", help="also time the RAG chain over this index")
+   parser.add_argument("--embedder", default="hashing:384", help="'openai[:model]' or 'hashing[:size]'")
+   parser.add_argument("--first-token-latency", type=float, default=0.6, help="simulated chat model, seconds")
+   parser.add_argument("--token-latency", type=float, default=0.01)
+   parser.add_argument("--reply-tokens", type=int, default=150)
+   parser.add_argument("--rag-samples", type=int, default=10, help="structured questions timed through RAG")
+   args = parser.parse_args()
+
+   os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+   analyzer = DataAnalyzer(PRIS_CSV_PATH)
+   router = analyzer.query_router
+
+   labelled = [(t.format(country=c), c, metric, statuses) for c in COUNTRIES for t, metric, statuses in STRUCTURED]
+   labelled += [(t.format(country=c), c, None, None) for c in COUNTRIES for t in POLICY]
+   for country, topics in DYNAMIC_QUESTIONS.items():
+       for question in (q for qs in topics.values() for q in qs):
+           # One guided question is itself a table lookup
+           table = question.startswith("How many units are currently under construction")
+           labelled.append((question, country, "count" if table else None, ("Under Construction",) if table else None))
+
+   misrouted, wrong = [], []
+   route_ms = {True: [], False: []}
+   for question, country, metric, statuses in labelled:
+       started = time.perf_counter()
+       query = router.parse(question, country)
+       answer = router.answer(query) if query else None
+       route_ms[metric is not None].append((time.perf_counter() - started) * 1000)
+       if (query is not None) != (metric is not None):
+           misrouted.append(question)
+       if query is None or metric is None:
+           continue
+       units, mw = expected_count(analyzer.df, country, statuses, query.types)
+       if query.metric != metric or query.statuses != statuses or query.countries != (country,):
+           wrong.append(f"{question} -> {query}")
+       elif (query.metric == "count" and f"**{units} unit" not in answer and f"**{units}** reactor units" not in answer
+             and not (units == 0 and "no units" in answer)):
+           wrong.append(f"{question}: expected {units} units\n{answer}")
+       elif query.metric == "capacity" and f"{mw:,} MW" not in answer and not (mw == 0 and "no " in answer):
+           wrong.append(f"{question}: expected {mw:,} MW\n{answer}")
+
+   structured = [item for item in labelled if item[2] is not None]
+   routed = sum(1 for item in structured if item[0] not in misrouted)
+   print(f"{len(labelled)} questions: {len(structured)} structured, {len(labelled) - len(structured)} policy")
+   print(f"routing split: {routed} to the PRIS table, {len(labelled) - routed} to RAG; "
+         f"{len(structured) - routed} structured missed, {len(misrouted) - len(structured) + routed} policy misrouted")
+   for question in misrouted:
+       print(f"  misrouted: {question}")
+   print(f"routed answers matching a pandas filter: {routed - len(wrong)}/{routed}")
+   for problem in wrong:
+       print(f"  wrong: {problem}")
+   for is_structured, label in ((True, "structured (parse + answer)"), (False, "policy (classify only)")):
+       print(f"router latency, {label}: median {statistics.median(route_ms[is_structured]):.3f} ms, "
+             f"max {max(route_ms[is_structured]):.3f} ms")
+
+   if not args.index_dir:
+       return
+   from offline import FakeChatModel, get_embeddings
+   from final_app import RAGQueryEngine
+
+   llm = FakeChatModel(first_token_seconds=args.first_token_latency, token_seconds=args.token_latency,
+                       reply_tokens=args.reply_tokens)
+   engine = RAGQueryEngine(args.index_dir, embeddings=get_embeddings(args.embedder), llm=llm)
+   rag_ms = []
+   for question, country, *_ in structured[:args.rag_samples]:
+       summary = analyzer.get_country_summary(country)
+       started = time.perf_counter()
+       engine.answer_question(question, country, summary)
+       rag_ms.append((time.perf_counter() - started) * 1000)
+   rag = statistics.median(rag_ms)
+   print(f"RAG chain for structured questions: median {rag:.0f} ms "
+         f"(simulated model: {args.first_token_latency}s first token, {args.token_latency}s/token)")
+   print(f"speedup for routed questions: {rag / statistics.median(route_ms[True]):,.0f}x")
+
+
+if __name__ == "__main__":
+   main()
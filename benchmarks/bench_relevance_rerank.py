@@ -0,0 +1,225 @@
+"""Benchmark: fixed top-k retrieval vs the over-fetch + relevance rerank stage with an adaptive cutoff
+
+Runs every guided-analysis topic group (three questions, as the app
+submits them) and a set of single chat questions through both
+configurations and reports, per configuration:
+
+- context chunks and prompt tokens sent to the model,
+- retrieval and end-to-end latency, with a simulated chat model whose
+  first token waits on prompt processing (--prompt-token-latency),
+- grounding: the share of questions with at least one evidence chunk in
+  the packed context (evidence recall), and the share of context chunks
+  that are evidence for one of the request's questions (precision).
+
+Evidence is labelled per question as terms a supporting chunk must
+contain. Questions whose terms occur nowhere in the country's corpus (or
+that have no profile in it, like Japan) are reported and left out. With --model openai the answers are generated by
+the API and also checked for the evidence terms.
+
+Usage:
+   python ingest.py --embedder hashing --index-dir /tmp/cnpp_hashing
+   python benchmarks/bench_relevance_rerank.py --index-dir /tmp/cnpp_hashing --embedder hashing
+"""
+import argparse
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding_cache import CachedEmbeddings
+from final_app import DYNAMIC_QUESTIONS, FAISS_INDEX_PATH, RAGQueryEngine
+from offline import FakeChatModel, get_embeddings
+
+
+# Guided question -> terms any supporting chunk contains (lowercase, hyphens removed)
+EVIDENCE = {
+   "How does Korea's nuclear energy policy align with its carbon neutrality goals?":
+       ["carbon neutral", "net zero", "netzero", "2050"],
+   "What is Korea's position on nuclear plant life extension and new builds?":
+       ["continued operation", "life extension", "lifetime extension", "new build", "shin hanul", "saeul"],
+   "How does Korea integrate nuclear with renewable energy sources?": ["renewable"],
+   "What are the key features and deployment status of the APR-1400?": ["apr1400"],
+   "How is Korea advancing its SMR development through SMART reactor?": ["smart", "ismr"],
+   "What is Korea's nuclear technology export strategy and achievements?": ["export"],
+   "How does KINS implement its regulatory oversight functions?": ["kins"],
+   "What are the key safety features in Korean nuclear designs?": ["safety feature", "passive", "severe accident"],
+   "How does Korea manage its nuclear emergency preparedness system?": ["emergency"],
+   "What is Korea's spent fuel management policy and infrastructure?": ["spent fuel"],
+   "How does Korea ensure nuclear fuel supply security?": ["fuel supply", "uranium", "enrichment"],
+   "What R&D is being conducted for advanced fuel technologies?":
+       ["accident tolerant", "pyroprocess", "fuel development", "advanced fuel"],
+   "What is the current status of the Barakah Nuclear Power Plant?": ["barakah"],
+   "How is the APR-1400 technology being implemented in UAE?": ["apr1400"],
+   "What are the key milestones in the Barakah construction timeline?": ["barakah"],
+   "How does FANR regulate nuclear activities in UAE?": ["fanr", "federal authority for nuclear regulation"],
+   "What safety standards are implemented at Barakah?": ["safety standard", "fanr"],
+   "How is nuclear emergency preparedness managed?": ["emergency"],
+   "How is UAE developing its nuclear workforce?": ["workforce", "human resource", "training", "scholarship"],
+   "What international partnerships support UAE's nuclear program?":
+       ["kepco", "international cooperation", "bilateral", "agreement"],
+   "What is the role of ENEC in program implementation?": ["enec", "emirates nuclear energy"],
+   "What is the scope and timeline of the El Dabaa NPP project?": ["dabaa"],
+   "How is Egypt cooperating with Russia on the VVER technology?": ["vver", "rosatom", "russian"],
+   "What are the key project milestones and challenges?": ["dabaa", "milestone"],
+   "How is Egypt establishing its nuclear regulatory framework?": ["enrra", "regulatory framework", "nuclear law"],
+   "What measures are in place for nuclear safety and security?":
+       ["nuclear security", "physical protection", "safeguards"],
+   "How is Egypt developing its nuclear workforce?": ["workforce", "human resource", "training"],
+   "How does nuclear fit into Egypt's energy strategy?": ["energy strategy", "energy mix"],
+   "What are the economic and environmental benefits expected?": ["economic", "environmental", "emission"],
+   "How will El Dabaa impact regional energy security?": ["energy security", "dabaa"],
+   "What is China's nuclear capacity target for 2025/2030?": ["five year plan", "fiveyear plan", "target"],
+   "How many units are currently under construction?": ["under construction"],
+   "What new sites are being developed for nuclear power?": ["site"],
+   "What is the status of Hualong One deployment?": ["hualong"],
+   "How is China developing its SMR technology?": ["smr", "linglong", "acp100", "small modular"],
+   "What advanced reactor designs is China pursuing?":
+       ["htrpm", "fast reactor", "cfr600", "generation iv", "gen iv", "high temperature gas"],
+   "How has China localized nuclear technology?": ["locali", "domestic"],
+   "What is China's nuclear export strategy?": ["export"],
+   "How is China's nuclear supply chain organized?": ["supply chain", "manufactur"],
+   "What is the status of nuclear plant life extensions?":
+       ["licence renewal", "license renewal", "subsequent license", "life extension"],
+   "How is the existing fleet's performance being optimized?": ["capacity factor", "uprate", "performance"],
+   "What regulatory changes support continued operation?": ["license renewal", "subsequent license", "rulemaking"],
+   "What is the progress on SMR deployment?": ["smr", "small modular", "nuscale"],
+   "How does NRC regulate new reactor technologies?": ["nrc", "nuclear regulatory commission"],
+   "What advanced reactor designs are being developed?":
+       ["advanced reactor", "natrium", "xe100", "microreactor", "small modular"],
+   "How do federal policies support nuclear energy?": ["inflation reduction", "department of energy", "federal"],
+   "What incentives exist for new nuclear projects?": ["tax credit", "loan guarantee", "incentive"],
+   "How is nuclear waste management being addressed?": ["spent fuel", "waste"],
+   "How is the CANDU fleet being maintained and upgraded?": ["refurbish"],
+   "What life extension programs are in progress?": ["refurbish", "life extension"],
+   "How is CANDU technology being exported?": ["export"],
+   "What is Canada's SMR deployment roadmap?": ["roadmap", "smr action plan"],
+   "How is regulatory framework adapting for SMRs?": ["cnsc", "vendor design review", "canadian nuclear safety"],
+   "What SMR designs are being developed?": ["bwrx300", "arc100", "microreactor", "small modular"],
+   "What R&D programs are prioritized?": ["research and development", "r&d", "canadian nuclear laboratories"],
+   "How is nuclear supporting clean energy goals?": ["clean energy", "climate", "emission", "net zero", "netzero"],
+   "What new applications are being explored?": ["hydrogen", "isotope", "district heating", "medical"],
+}
+# Single chat questions; their evidence terms are listed with them
+CHAT = [
+   ("Korea, Republic of", "What is the APR-1400?", ["apr1400"]),
+   ("Korea, Republic of", "What does KINS do?", ["kins"]),
+   ("United Arab Emirates", "When did Barakah unit 1 start commercial operation?", ["barakah"]),
+   ("Egypt", "Who is building El Dabaa?", ["dabaa"]),
+   ("China", "Where is Hualong One being built?", ["hualong"]),
+   ("Canada", "Which Canadian plants are being refurbished?", ["refurbish"]),
+   ("United States of America", "How does the NRC license advanced reactors?", ["nrc", "nuclear regulatory commission"]),
+   ("United States of America", "How is spent fuel stored in the US?", ["spent fuel"]),
+]
+
+
+def normalize(text: str) -> str:
+   return text.lower().replace("-", "")
+
+
+def evaluation_set(corpus):
+   """(country, questions, evidence terms per question) requests, and the questions left out"""
+   requests, skipped = [], []
+   for country, topics in DYNAMIC_QUESTIONS.items():
+       texts = corpus.get(country, [])
+       for questions in topics.values():
+           kept = [q for q in questions if any(term in text for text in texts for term in EVIDENCE.get(q, ()))]
+           skipped += [f"{country}: {q}" for q in questions if q not in kept]
+           if kept:
+               requests.append((country, kept, [EVIDENCE[q] for q in kept]))
+   requests += [(country, [question], [terms]) for country, question, terms in CHAT]
+   return requests, skipped
+
+
+def is_evidence(text: str, terms) -> bool:
+   text = normalize(text)
+   return any(term in text for term in terms)
+
+
+def run(engine, requests, model_grounding: bool):
+   totals = {"chunks": [], "context_tokens": [], "prompt_tokens": [], "retrieval_ms": [], "total_ms": []}
+   questions = recalled = chunks = precise = answered = 0
+   for country, question_list, evidence in requests:
+       meta = {}
+       # Cold embedding cache, so both configurations pay for their embedding request
+       engine.embeddings._memory.clear()
+       if len(question_list) > 1:
+           answer = engine.generate_analysis(question_list, country, "", meta)
+       else:
+           answer = engine.answer_question(question_list[0], country, "", meta)
+       # The packed context of this request, as the prompt received it
+       doc_ids, docs = engine._pack_context(*engine._retrieve(question_list, country), {})
+       totals["chunks"].append(len(docs))
+       totals["context_tokens"].append(meta["context_tokens"])
+       totals["prompt_tokens"].append(meta["prompt_tokens"])
+       totals["retrieval_ms"].append(meta["retrieval_seconds"] * 1000)
+       totals["total_ms"].append(meta["total_seconds"] * 1000)
+       questions += len(question_list)
+       recalled += sum(any(is_evidence(doc, terms) for doc in docs) for terms in evidence)
+       chunks += len(docs)
+       precise += sum(any(is_evidence(doc, terms) for terms in evidence) for doc in docs)
+       answered += sum(is_evidence(answer, terms) for terms in evidence) if model_grounding else 0
+   result = {name: statistics.mean(values) for name, values in totals.items()}
+   result.update(recall=recalled / questions, precision=precise / max(chunks, 1),
+                 answer_grounding=answered / questions if model_grounding else None)
+   return result
+
+
+def main():
+   parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+   parser.add_argument("--index-dir", default=FAISS_INDEX_PATH)
+   parser.add_argument("--embedder", default="openai", help="must match the embedder the index was built with")
+   parser.add_argument("--model", default="fake", help="'fake' (simulated latency) or 'openai[:model]'")
+   parser.add_argument("--first-token-latency", type=float, default=0.5, help="simulated model, seconds")
+   parser.add_argument("--prompt-token-latency", type=float, default=0.0002, help="simulated prefill, seconds/token")
+   parser.add_argument("--token-latency", type=float, default=0.0)
+   parser.add_argument("--reply-tokens", type=int, default=50)
+   args = parser.parse_args()
+
+   if args.model == "fake":
+       llm = FakeChatModel(first_token_seconds=args.first_token_latency, prompt_token_seconds=args.prompt_token_latency,
+                           token_seconds=args.token_latency, reply_tokens=args.reply_tokens)
+   else:
+       from langchain_openai import ChatOpenAI
+       _, _, name = args.model.partition(":")
+       llm = ChatOpenAI(model=name or "gpt-4", temperature=0)
+   engine = RAGQueryEngine(args.index_dir, embeddings=get_embeddings(args.embedder), llm=llm)
+   if engine.vectorstore is None:
+       parser.error(f"could not load the FAISS index from {args.index_dir}")
+   engine.embeddings = CachedEmbeddings(engine.embeddings.embeddings, db_path=None)
+   # Every request reaches the model; a cached answer would hide the prompt-size effect
+   engine.response_cache.get = lambda key: None
+   engine.response_cache.get_similar = lambda scope, vector: None
+   store = engine.vectorstore
+   corpus = {}
+   for row in range(store.index.ntotal):
+       doc = store.docstore.search(store.index_to_docstore_id[row])
+       corpus.setdefault(doc.metadata.get("country"), []).append(normalize(doc.page_content))
+   engine.lexical_index  # build outside the timed region
+
+   requests, skipped = evaluation_set(corpus)
+   print(f"{len(requests)} requests, {sum(len(q) for _, q, _ in requests)} questions "
+         f"({len(skipped)} guided questions without evidence in the corpus left out)")
+   for question in skipped:
+       print(f"  no evidence: {question}")
+
+   relevance = engine.relevance
+   results = {}
+   for label, stage in (("fixed top-5", None), ("rerank", relevance)):
+       engine.relevance = stage
+       results[label] = run(engine, requests, args.model != "fake")
+
+   print(f"{'configuration':<14}{'chunks':>8}{'ctx tok':>9}{'prompt tok':>11}{'retrieve ms':>12}"
+         f"{'total ms':>10}{'recall':>8}{'precision':>10}" + ("  answer" if args.model != "fake" else ""))
+   for label, r in results.items():
+       print(f"{label:<14}{r['chunks']:>8.1f}{r['context_tokens']:>9.0f}{r['prompt_tokens']:>11.0f}"
+             f"{r['retrieval_ms']:>12.1f}{r['total_ms']:>10.0f}{r['recall']:>8.3f}{r['precision']:>10.3f}"
+             + (f"{r['answer_grounding']:>8.3f}" if r["answer_grounding"] is not None else ""))
+   base, new = results["fixed top-5"], results["rerank"]
+   print(f"prompt tokens {new['prompt_tokens'] / base['prompt_tokens'] - 1:+.1%}, "
+         f"end-to-end latency {new['total_ms'] / base['total_ms'] - 1:+.1%}, "
+         f"evidence recall {new['recall'] - base['recall']:+.3f}, precision {new['precision'] - base['precision']:+.3f}")
+
+
+if __name__ == "__main__":
+   main()
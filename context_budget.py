@@ -0,0 +1,101 @@
+"""Assemble retrieved chunks into a prompt context: drop near-duplicates and pack to a token budget"""
+import hashlib
+import logging
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import List, Sequence
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"\w+")
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = np.random.default_rng(1)
+_PERMUTATIONS = 64
+_HASH_A = _rng.integers(1, _MERSENNE_PRIME, size=_PERMUTATIONS, dtype=np.uint64)
+_HASH_B = _rng.integers(0, _MERSENNE_PRIME, size=_PERMUTATIONS, dtype=np.uint64)
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+   """tiktoken encoding, or None when its BPE files can't be loaded (cached, so the download isn't retried)"""
+   try:
+       import tiktoken
+       try:
+           return tiktoken.encoding_for_model(model)
+       except KeyError:
+           return tiktoken.get_encoding("cl100k_base")
+   except Exception:
+       logger.warning("tiktoken encoding for %s unavailable; estimating tokens from length", model)
+       return None
+
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+   """Token count with tiktoken, or a ~4 chars/token estimate when its BPE files are unavailable"""
+   encoding = _encoding(model)
+   if encoding is None:
+       return max(1, len(text) // 4)
+   return len(encoding.encode(text))
+
+
+def minhash_signature(text: str, shingle_size: int = 5) -> np.ndarray:
+   """MinHash signature over word shingles, for Jaccard similarity estimates"""
+   words = _WORD_RE.findall(text.lower())
+   if len(words) < shingle_size:
+       shingles = {" ".join(words)}
+   else:
+       shingles = {" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)}
+   hashes = np.fromiter(
+       (int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little") % _MERSENNE_PRIME
+        for s in shingles),
+       dtype=np.uint64,
+       count=len(shingles),
+   )
+   # (a * h + b) mod p, computed in uint64 with wraparound; good enough for similarity estimates
+   return ((np.outer(hashes, _HASH_A) + _HASH_B) % _MERSENNE_PRIME).min(axis=0)
+
+
+@dataclass
+class PackedContext:
+   doc_ids: List[str]
+   texts: List[str]
+   tokens_in: int
+   tokens_used: int
+   dropped_duplicates: int = 0
+   dropped_over_budget: int = 0
+   token_counts: List[int] = field(default_factory=list)
+
+   @property
+   def tokens_saved(self) -> int:
+       return self.tokens_in - self.tokens_used
+
+
+def pack_context(doc_ids: Sequence[str], texts: Sequence[str], budget_tokens: int,
+                 similarity_threshold: float = 0.8, model: str = "gpt-4") -> PackedContext:
+   """Keep chunks in the given (best-first) order, skipping near-duplicates and chunks that overflow the budget"""
+   token_counts = [count_tokens(text, model) for text in texts]
+   packed = PackedContext([], [], tokens_in=sum(token_counts), tokens_used=0)
+   kept_signatures: List[np.ndarray] = []
+   for doc_id, text, tokens in zip(doc_ids, texts, token_counts):
+       signature = minhash_signature(text)
+       if any(float(np.mean(signature == other)) >= similarity_threshold for other in kept_signatures):
+           packed.dropped_duplicates += 1
+           continue
+       if packed.tokens_used + tokens > budget_tokens:
+           packed.dropped_over_budget += 1
+           continue
+       kept_signatures.append(signature)
+       packed.doc_ids.append(doc_id)
+       packed.texts.append(text)
+       packed.token_counts.append(tokens)
+       packed.tokens_used += tokens
+
+   logger.info(
+       "context packed: %d/%d chunks, %d -> %d tokens (%d saved; %d near-duplicates, %d over budget)",
+       len(packed.texts), len(texts), packed.tokens_in, packed.tokens_used, packed.tokens_saved,
+       packed.dropped_duplicates, packed.dropped_over_budget,
+   )
+   return packed
@@ -0,0 +1,118 @@
+"""Bounded chat memory: the last few turns verbatim plus a rolling summary of older ones
+
+Only the prompt window (recent turns and summary) reaches the model, and
+both parts are capped in tokens, so per-turn prompt size stays flat however
+long a session runs. Turns leaving the window are folded into the summary
+extractively: the question plus the first sentence of its answer, oldest
+dropped first, with no model call. The transcript kept for display is a
+bounded deque of (question, answer) tuples.
+"""
+import re
+from collections import deque
+from typing import Deque, Iterable, List, Optional, Tuple
+
+from context_budget import count_tokens
+
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+# Pronouns that only make sense against the previous turn; words like "this" or "more" are
+# too common in standalone questions to justify a rewrite call
+_FOLLOW_UP_RE = re.compile(r"\b(it|its|they|them|their|those)\b", re.IGNORECASE)
+# Elliptical follow-ups that swap one part of the previous question: "what about Japan?", "and France?"
+_ELLIPSIS_RE = re.compile(r"^\s*(what about|how about|what of|and|same for|also for)\b", re.IGNORECASE)
+
+Turn = Tuple[str, str]  # (question, answer)
+
+
+def clip_tokens(text: str, budget: int, model: str = "gpt-4") -> str:
+   """Cut text at a word boundary so it fits the token budget"""
+   tokens = count_tokens(text, model)
+   if tokens <= budget:
+       return text
+   clipped = text[:max(0, len(text) * budget // tokens - 1)].rsplit(" ", 1)[0]
+   return clipped + "…"
+
+
+def _gist(question: str, answer: str) -> str:
+   lead = _SENTENCE_RE.split(" ".join(answer.split()), 1)[0]
+   return f"- Asked: {' '.join(question.split())} Answered: {lead}"
+
+
+class ConversationMemory:
+   """Chat history for one session: a compact transcript and a token-bounded prompt window"""
+
+   def __init__(self, max_turns: int = 4, history_token_budget: int = 800, summary_token_budget: int = 250,
+                max_transcript_turns: int = 100, model: str = "gpt-4"):
+       self.max_turns = max_turns
+       self.history_token_budget = history_token_budget
+       self.summary_token_budget = summary_token_budget
+       self.model = model
+       self.transcript: Deque[Turn] = deque(maxlen=max_transcript_turns)
+       self._window: Deque[Tuple[str, str, int]] = deque()  # (question, clipped answer, tokens)
+       self._gists: Deque[Tuple[str, int]] = deque()  # summary lines, oldest first
+
+   @classmethod
+   def from_turns(cls, turns: Iterable[Turn], **kwargs) -> "ConversationMemory":
+       memory = cls(**kwargs)
+       for question, answer in turns:
+           memory.add(question, answer)
+       return memory
+
+   def __len__(self) -> int:
+       return len(self.transcript)
+
+   def add(self, question: str, answer: str):
+       """Record a finished turn, folding whatever no longer fits the window into the summary"""
+       self.transcript.append((question, answer))
+       # One long report must not crowd every other turn out of the window
+       answer = clip_tokens(answer, self.history_token_budget // 2, self.model)
+       self._window.append((question, answer, count_tokens(f"User: {question}\nAssistant: {answer}", self.model)))
+       while len(self._window) > 1 and (
+           len(self._window) > self.max_turns
+           or sum(tokens for _, _, tokens in self._window) > self.history_token_budget
+       ):
+           old_question, old_answer, _ = self._window.popleft()
+           self._fold(old_question, old_answer)
+
+   def _fold(self, question: str, answer: str):
+       gist = clip_tokens(_gist(question, answer), self.summary_token_budget // 3, self.model)
+       self._gists.append((gist, count_tokens(gist, self.model)))
+       while sum(tokens for _, tokens in self._gists) > self.summary_token_budget:
+           self._gists.popleft()
+
+   def clear(self):
+       self.transcript.clear()
+       self._window.clear()
+       self._gists.clear()
+
+   @property
+   def summary(self) -> str:
+       return "\n".join(gist for gist, _ in self._gists)
+
+   def prompt_block(self) -> str:
+       """Summary of earlier turns and the recent turns verbatim, for the answer prompt"""
+       if not self._window:
+           return ""
+       parts = []
+       if self._gists:
+           parts.append(f"Earlier in this conversation:\n{self.summary}")
+       parts.append("\n".join(f"User: {q}\nAssistant: {a}" for q, a, _ in self._window))
+       return "\n\n".join(parts)
+
+   def last_turn(self, answer_tokens: int = 120) -> Optional[str]:
+       """The previous exchange, briefly, as context for rewriting a follow-up"""
+       if not self._window:
+           return None
+       question, answer, _ = self._window[-1]
+       return f"User: {question}\nAssistant: {clip_tokens(answer, answer_tokens, self.model)}"
+
+   def needs_rewrite(self, question: str) -> bool:
+       """True when the question leans on earlier turns: a pronoun ('its safety record') or an ellipsis ('and France?')"""
+       return bool(self._window) and bool(_FOLLOW_UP_RE.search(question) or _ELLIPSIS_RE.search(question))
+
+   def fallback_query(self, question: str) -> str:
+       """Standalone query without a model: the follow-up joined to the previous question"""
+       return f"{self._window[-1][0]} {question}" if self._window else question
+
+   def turns(self) -> List[Turn]:
+       return list(self.transcript)
@@ -0,0 +1,103 @@
+"""Per-country FAISS sub-indexes routed by the selected country"""
+import json
+import os
+import re
+from typing import Dict, Iterable, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from mmap_docstore import docstore_token, replace_atomically
+from vector_index import build_index
+
+
+PARTITIONS_DIR = "partitions"
+PARTITIONS_MANIFEST = "partitions.json"
+
+
+def _slug(country: str) -> str:
+   return re.sub(r"[^a-z0-9]+", "_", country.lower()).strip("_") or "unknown"
+
+
+class CountryPartitions:
+   """One sub-index per country; results are mapped back to global index rows"""
+
+   def __init__(self, indexes: Dict[str, faiss.Index], rows: Dict[str, np.ndarray], ntotal: int):
+       self.indexes = indexes
+       self.rows = rows
+       self.ntotal = ntotal
+
+   @classmethod
+   def build(cls, vectors: np.ndarray, countries: Iterable[Optional[str]],
+             metric: int = faiss.METRIC_L2, index_type: str = "flat") -> "CountryPartitions":
+       """Partition the rows of a vector matrix by country, one index of the given type each"""
+       by_country: Dict[str, list] = {}
+       for row, country in enumerate(countries):
+           if country:
+               by_country.setdefault(country, []).append(row)
+       indexes, rows = {}, {}
+       for country, members in by_country.items():
+           members = np.asarray(members, dtype=np.int64)
+           indexes[country], rows[country] = build_index(vectors[members], index_type, metric), members
+       return cls(indexes, rows, len(vectors))
+
+   @classmethod
+   def from_store(cls, store) -> "CountryPartitions":
+       """Derive partitions from a loaded LangChain FAISS store (for indexes built without them)"""
+       vectors = store.index.reconstruct_n(0, store.index.ntotal)
+       countries = []
+       for row in range(store.index.ntotal):
+           doc = store.docstore.search(store.index_to_docstore_id[row])
+           countries.append(getattr(doc, "metadata", {}).get("country"))
+       return cls.build(vectors, countries, store.index.metric_type)
+
+   def save(self, index_dir: str):
+       """Write the sub-indexes, then the manifest, stamped with the docstore written just before
+
+       Every file is replaced atomically and the manifest goes last, so a
+       crash leaves either the previous manifest or a complete new set.
+       """
+       directory = os.path.join(index_dir, PARTITIONS_DIR)
+       os.makedirs(directory, exist_ok=True)
+       manifest = {"ntotal": self.ntotal, "docstore_token": docstore_token(index_dir), "countries": {}}
+       for country, index in self.indexes.items():
+           filename = f"{_slug(country)}.faiss"
+           replace_atomically(os.path.join(directory, filename),
+                              lambda path, index=index: faiss.write_index(index, path))
+           manifest["countries"][country] = {"file": filename, "rows": self.rows[country].tolist()}
+
+       def write_manifest(path: str):
+           with open(path, "w", encoding="utf-8") as f:
+               json.dump(manifest, f, ensure_ascii=False)
+
+       replace_atomically(os.path.join(directory, PARTITIONS_MANIFEST), write_manifest)
+
+   @classmethod
+   def load(cls, index_dir: str, ntotal: int) -> Optional["CountryPartitions"]:
+       """Load saved partitions; None when missing or built for a different global index
+
+       Row counts can match after a rebuild, so the docstore token is checked too.
+       """
+       directory = os.path.join(index_dir, PARTITIONS_DIR)
+       manifest_path = os.path.join(directory, PARTITIONS_MANIFEST)
+       if not os.path.exists(manifest_path):
+           return None
+       with open(manifest_path, encoding="utf-8") as f:
+           manifest = json.load(f)
+       if manifest.get("ntotal") != ntotal or manifest.get("docstore_token") != docstore_token(index_dir):
+           return None
+       indexes, rows = {}, {}
+       for country, entry in manifest["countries"].items():
+           indexes[country] = faiss.read_index(os.path.join(directory, entry["file"]))
+           rows[country] = np.asarray(entry["rows"], dtype=np.int64)
+       return cls(indexes, rows, ntotal)
+
+   def __contains__(self, country: str) -> bool:
+       return country in self.indexes
+
+   def search(self, country: str, vectors: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+       """Search only the country's sub-index; returns (distances, global rows) with -1 padding"""
+       index = self.indexes[country]
+       scores, local = index.search(np.ascontiguousarray(vectors, dtype=np.float32), min(k, index.ntotal))
+       rows = np.where(local >= 0, self.rows[country][np.maximum(local, 0)], -1)
+       return scores, rows
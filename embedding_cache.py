@@ -0,0 +1,140 @@
+"""Query embedding cache with an in-memory LRU tier and a persistent SQLite tier"""
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+EMBEDDING_CACHE_PATH = os.path.join(".cache", "query_embeddings.sqlite3")
+
+
+def normalize_text(text: str) -> str:
+   """Unicode-normalise and collapse whitespace so trivially different queries share an entry"""
+   return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+class CachedEmbeddings(Embeddings):
+   """Embeddings wrapper that serves repeated texts from memory or disk instead of the API"""
+
+   def __init__(
+       self,
+       embeddings: Embeddings,
+       model_name: Optional[str] = None,
+       db_path: Optional[str] = EMBEDDING_CACHE_PATH,
+       max_memory_entries: int = 2048,
+   ):
+       self.embeddings = embeddings
+       self.model_name = model_name or getattr(embeddings, "model", type(embeddings).__name__)
+       self.max_memory_entries = max_memory_entries
+       self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+       self._lock = threading.Lock()
+       self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+       self._db = None
+       if db_path:
+           os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+           self._db = sqlite3.connect(db_path, check_same_thread=False)
+           self._db.execute(
+               "CREATE TABLE IF NOT EXISTS embeddings ("
+               "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL)"
+           )
+           self._db.commit()
+
+   def _key(self, text: str) -> str:
+       return hashlib.sha256(f"{self.model_name}\0{normalize_text(text)}".encode()).hexdigest()
+
+   def _remember(self, key: str, vector: List[float]):
+       self._memory[key] = vector
+       self._memory.move_to_end(key)
+       while len(self._memory) > self.max_memory_entries:
+           self._memory.popitem(last=False)
+
+   def _lookup(self, keys: List[str], count: bool = True) -> Dict[str, List[float]]:
+       """Resolve keys from the LRU tier, then the disk tier, optionally updating hit counters"""
+       found: Dict[str, List[float]] = {}
+       with self._lock:
+           for key in keys:
+               if key in self._memory:
+                   self._memory.move_to_end(key)
+                   found[key] = self._memory[key]
+                   self.stats["memory_hits"] += count
+           pending = [key for key in dict.fromkeys(keys) if key not in found]
+           if pending and self._db is not None:
+               placeholders = ",".join("?" * len(pending))
+               rows = self._db.execute(
+                   f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", pending
+               ).fetchall()
+               for key, blob in rows:
+                   vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                   found[key] = vector
+                   self._remember(key, vector)
+               self.stats["disk_hits"] += len(rows) if count else 0
+       return found
+
+   def _store(self, items: Dict[str, List[float]]):
+       with self._lock:
+           for key, vector in items.items():
+               self._remember(key, vector)
+           if self._db is not None:
+               self._db.executemany(
+                   "INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)",
+                   [(key, self.model_name, np.asarray(v, dtype=np.float32).tobytes()) for key, v in items.items()],
+               )
+               self._db.commit()
+
+   def _partition(self, texts: List[str]) -> Tuple[List[str], Dict[str, List[float]], Dict[str, str]]:
+       """(keys, cached vectors, texts still to embed by key)"""
+       keys = [self._key(text) for text in texts]
+       found = self._lookup(keys)
+       missing = {key: text for key, text in zip(keys, texts) if key not in found}
+       if missing:
+           with self._lock:
+               self.stats["misses"] += len(missing)
+       return keys, found, missing
+
+   def _complete(self, keys: List[str], found: Dict[str, List[float]], missing: Dict[str, str],
+                 vectors: List[List[float]]) -> List[List[float]]:
+       computed = dict(zip(missing.keys(), vectors))
+       if computed:
+           self._store(computed)
+           found.update(computed)
+       return [found[key] for key in keys]
+
+   def embed_documents(self, texts: List[str]) -> List[List[float]]:
+       keys, found, missing = self._partition(texts)
+       # One batched API request for every text not yet cached
+       vectors = self.embeddings.embed_documents(list(missing.values())) if missing else []
+       return self._complete(keys, found, missing, vectors)
+
+   def embed_query(self, text: str) -> List[float]:
+       return self.embed_documents([text])[0]
+
+   async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+       keys, found, missing = self._partition(texts)
+       vectors = await self.embeddings.aembed_documents(list(missing.values())) if missing else []
+       return self._complete(keys, found, missing, vectors)
+
+   async def aembed_query(self, text: str) -> List[float]:
+       return (await self.aembed_documents([text]))[0]
+
+   def cached(self, texts: List[str]) -> List[Optional[List[float]]]:
+       """Vectors already in memory or on disk, None for the rest; never calls the API"""
+       keys = [self._key(text) for text in texts]
+       found = self._lookup(keys, count=False)
+       return [found.get(key) for key in keys]
+
+   def prewarm(self, texts: Iterable[str]) -> int:
+       """Embed any texts not cached yet in one batch; returns how many were embedded"""
+       texts = list(dict.fromkeys(texts))
+       keys = [self._key(text) for text in texts]
+       found = self._lookup(keys, count=False)
+       missing = {key: text for key, text in zip(keys, texts) if key not in found}
+       if missing:
+           self._store(dict(zip(missing.keys(), self.embeddings.embed_documents(list(missing.values())))))
+       return len(missing)
@@ -0,0 +1,10 @@
+"""Exceptions shared by the engine and its front ends
+
+Kept out of final_app.py: Streamlit re-executes the app script on every
+rerun, so a class defined there would no longer match the one raised by an
+engine cached from an earlier run.
+"""
+
+
+class RetrievalError(RuntimeError):
+   """Document search failed or the FAISS index is unavailable; callers decide how to report it"""
@@ -1,20 +1,47 @@
 import os
+import time
+import logging
+import resource
+import threading
+import numpy as np
 import streamlit as st
-import pandas as pd
-from typing import Dict, List, Tuple, Set
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple, Set
 import streamlit.components.v1 as components
-from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from context_budget import count_tokens, pack_context
+from errors import RetrievalError
+from conversation import ConversationMemory
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from relevance import RelevanceReranker
+from response_cache import ResponseCache, question_entities
+from tracing import record_error, serve_metrics, span, tracer
+
+# Imported on first use instead: pandas (with the PRIS modules), the OpenAI client,
+# LangChain and the FAISS stack take longer to import than the dashboard and filters take to render
+if TYPE_CHECKING:
+   import pandas as pd
+   from pris_analytics import FleetProfile
+   from langchain_core.documents import Document
+   from langchain_core.embeddings import Embeddings
+   from langchain_core.language_models import BaseChatModel
+   from langchain_core.prompt_values import PromptValue
+   from langchain_core.prompts import ChatPromptTemplate
+   from country_partitions import CountryPartitions
+   from vector_index import ExactReranker
+   from warm_cache import WarmCache
 
 
 # OpenAI API Key
-os.environ["OPENAI_API_KEY"] = ""
+os.environ.setdefault("OPENAI_API_KEY", "")
+
+logger = logging.getLogger(__name__)
 
 
 # Constants
+PRIS_CSV_PATH = "PRIS.csv"
+FAISS_INDEX_PATH = "faiss_index"
+# A failed index load is retried after this long rather than kept for the life of the cached engine
+INDEX_RETRY_SECONDS = 30.0
 COUNTRIES = ['Korea, Republic of', 'United States of America', 'China', 'Japan', 'United Arab Emirates', 'Canada', 'Egypt']
 REACTOR_TYPES = ['PWR', 'BWR', 'PHWR', 'VVER', 'EPR']
 
@@ -151,39 +178,166 @@ DYNAMIC_QUESTIONS = {
 class DataAnalyzer:
    """Data Analysis Engine"""
   
-   def __init__(self):
-       self.df = pd.read_csv("PRIS.csv")
+   def __init__(self, csv_path: str = PRIS_CSV_PATH):
+       from pris_analytics import PrisAnalytics
+       from pris_data import load_pris
+       from pris_query import PrisQueryRouter
+
+       self.df = load_pris(csv_path)
+       self._build_summary_index()
+       self.analytics = PrisAnalytics(self.df)
+       self.query_router = PrisQueryRouter(self.df)
+
+   def _build_summary_index(self):
+       """Precompute per Country x Type and per Country statistics once at load time"""
+       import pandas as pd
+
+       df = self.df
+       is_operational = df['Status'].eq('Operational')
+       by_type = df.assign(
+           _operational=is_operational,
+           _op_capacity=df['Gross Electrical Capacity [MW]'].where(is_operational, 0),
+       ).groupby(['Country', 'Type'], sort=False, dropna=False, observed=True).agg(
+           units=('Country', 'size'),
+           operational=('_operational', 'sum'),
+           capacity=('_op_capacity', 'sum'),
+           latest_connection=('First Grid Connection', 'max'),
+       )
+       by_country = by_type.groupby(level='Country', sort=False).agg(
+           units=('units', 'sum'),
+           operational=('operational', 'sum'),
+           capacity=('capacity', 'sum'),
+           latest_connection=('latest_connection', 'max'),
+       )
+
+       self._type_stats: Dict[Tuple[str, str], Dict] = by_type.to_dict('index')
+       self._country_stats: Dict[str, Dict] = by_country.to_dict('index')
+       self._country_types: Dict[str, List[str]] = {}
+       for country, reactor_type in by_type.index:
+           if pd.notna(reactor_type):
+               self._country_types.setdefault(country, []).append(reactor_type)
+
+   def _lookup_stats(self, country: str, selected_types: Optional[List[str]] = None) -> Dict:
+       """Combine precomputed statistics for a country, optionally restricted to reactor types"""
+       import pandas as pd
+
+       if not selected_types:
+           stats = dict(self._country_stats.get(country, {}))
+           stats['types'] = self._country_types.get(country, [])
+       else:
+           rows = [(t, self._type_stats[(country, t)]) for t in selected_types if (country, t) in self._type_stats]
+           dates = [row['latest_connection'] for _, row in rows if pd.notna(row['latest_connection'])]
+           stats = {
+               'units': sum(row['units'] for _, row in rows),
+               'operational': sum(row['operational'] for _, row in rows),
+               'capacity': sum(row['capacity'] for _, row in rows),
+               'latest_connection': max(dates) if dates else None,
+               'types': [t for t, _ in rows],
+           }
+       return stats
   
-   def get_country_summary(self, country: str) -> str:
-       """Generate statistical summary for selected country"""
-       country_data = self.df[self.df['Country'] == country]
-       operational = country_data[country_data['Status'] == 'Operational']
-      
-       # Filter out empty dates and get the most recent connection
-       valid_dates = country_data['First Grid Connection'].dropna()
-       latest_connection = "No connected units" if len(valid_dates) == 0 else max(valid_dates)
-      
+   def get_country_summary(self, country: str, selected_types: Optional[List[str]] = None) -> str:
+       """Generate statistical summary for selected country and reactor types"""
+       with tracer.trace("summary", country=country, types=selected_types or []):
+           with span("stats_lookup"):
+               stats = self._lookup_stats(country, selected_types)
+           with span("fleet_analytics"):
+               profile = self.get_country_analytics(country, selected_types)
+               rank = self.analytics.rank(country, selected_types)
+           summary = self._format_summary(country, selected_types, stats).rstrip() + "\n" + profile.to_prompt()
+           if rank:
+               summary += f"\n- Rank by operating capacity: {rank[0]} of {rank[1]} countries"
+           return summary
+
+   def get_country_analytics(self, country: str, selected_types: Optional[List[str]] = None) -> "FleetProfile":
+       """Capacity trends, type mix, fleet age and construction pipeline for a country and type filter"""
+       return self.analytics.profile(country, selected_types)
+
+   def answer_structured(self, question: str, country: str, selected_types: Optional[List[str]] = None,
+                         meta: Optional[Dict] = None,
+                         conversation: Optional[ConversationMemory] = None) -> Optional[str]:
+       """Templated answer from the PRIS table for count / capacity questions, or None for the RAG chain"""
+       started = time.perf_counter()
+       with tracer.trace("route", country=country, types=selected_types or []) as trace:
+           # A follow-up without its own country leans on earlier turns, so it goes to the rewrite and RAG
+           follow_up = conversation is not None and conversation.needs_rewrite(question)
+           with span("pris_lookup"):
+               answer = self.query_router.route(question, country, selected_types, follow_up)
+           trace.set(route="pris_table" if answer is not None else "rag")
+       if answer is not None and meta is not None:
+           elapsed = time.perf_counter() - started
+           meta.update(route="pris_table", route_seconds=elapsed, total_seconds=elapsed, trace_id=trace.trace_id)
+       return answer
+
+   def compare_countries(self, countries: Optional[List[str]] = None,
+                         selected_types: Optional[List[str]] = None) -> "pd.DataFrame":
+       """Side-by-side fleet statistics, one row per country"""
+       return self.analytics.compare(countries, selected_types)
+
+   @staticmethod
+   def _format_summary(country: str, selected_types: Optional[List[str]], stats: Dict) -> str:
+       import pandas as pd
+
+       latest_connection = stats.get('latest_connection')
+       if latest_connection is None or pd.isna(latest_connection):
+           latest_connection = "No connected units"
+       else:
+           latest_connection = latest_connection.strftime('%Y-%m-%d')
+
        summary = f"""Nuclear Power Statistics for {country}:
-       - Total Units: {len(country_data)}
-       - Operational Units: {len(operational)}
-       - Total Capacity: {operational['Gross Electrical Capacity [MW]'].sum():,.0f} MW
-       - Reactor Types: {', '.join(country_data['Type'].unique())}
+       - Total Units: {stats.get('units', 0)}
+       - Operational Units: {stats.get('operational', 0)}
+       - Total Capacity: {stats.get('capacity', 0):,.0f} MW
+       - Reactor Types: {', '.join(stats['types'])}
        - Latest Connection: {latest_connection}
        """
+       if selected_types:
+           summary += f"- Reactor Type Filter: {', '.join(selected_types)}\n"
        return summary
 
 
 class RAGQueryEngine:
    """RAG Search and Response Generation Engine"""
   
-   def __init__(self):
-       self.embeddings = OpenAIEmbeddings()
-       try:
-           self.vectorstore = FAISS.load_local("faiss_index", self.embeddings, allow_dangerous_deserialization=True)
-       except Exception as e:
-           st.error(f"Failed to load FAISS index: {str(e)}")
-           self.vectorstore = None
-       self.llm = ChatOpenAI(model="gpt-4", temperature=0)
+   def __init__(self, index_path: str = FAISS_INDEX_PATH, embeddings: Optional["Embeddings"] = None,
+                llm: Optional["BaseChatModel"] = None, context_token_budget: int = 3000):
+       from langchain_core.output_parsers import StrOutputParser
+       from langchain_core.prompts import ChatPromptTemplate
+       from embedding_cache import CachedEmbeddings
+
+       if embeddings is None:
+           from langchain_openai import OpenAIEmbeddings
+           embeddings = OpenAIEmbeddings()
+       self.embeddings = CachedEmbeddings(embeddings)
+       # The FAISS index is loaded by the first search (see _load_index)
+       self.index_path = index_path
+       self._index_loaded = False
+       self._index_retry_at = 0.0
+       # Why the last index load failed, for RetrievalError messages; None once loaded
+       self.index_error: Optional[str] = None
+       self._index_lock = threading.Lock()
+       self._warm_thread: Optional[threading.Thread] = None
+       # Set by the cached builder; the index load, which happens later, adds its cost to it
+       self.resource_stats: Optional["ResourceStats"] = None
+       self._vectorstore = self._partitions = self._reranker = None
+       self.configure_search()
+       # "hybrid" fuses BM25 and FAISS rankings; "vector" and "lexical" use one retriever only
+       self.retrieval_mode = "hybrid"
+       self.retrieval_stats = {"dense": 0, "lexical_only": 0, "warm": 0, "candidates": 0, "kept": 0}
+       # Precomputed guided-question rankings (see warm_cache.py); None searches live
+       self.warm_cache: Optional["WarmCache"] = None
+       self._lexical_index: Optional[BM25Index] = None
+       self._lexical_lock = threading.Lock()
+       # Second-stage scoring of over-fetched candidates with an adaptive cutoff; None keeps a fixed top k
+       self.relevance: Optional[RelevanceReranker] = RelevanceReranker()
+       # Candidates per question handed to the relevance stage
+       self.rerank_candidates = 20
+       # ChatOpenAI is created when generation is first requested
+       self._llm = llm
+       self._output_parser = StrOutputParser()
+       self.response_cache = ResponseCache()
+       # Upper bound on retrieved-context tokens sent to the LLM per request
+       self.context_token_budget = context_token_budget
       
        # Initialize prompt template for guided analysis (maintaining original)
        self.analysis_prompt = ChatPromptTemplate.from_template("""
@@ -210,6 +364,8 @@ class RAGQueryEngine:
        - Nuclear capacity trends
        - Reactor type distribution
        - Operational performance metrics
+       The fleet analytics in the Statistical Context are computed from the same PRIS data;
+       quote those figures rather than estimating capacity, age or construction numbers.
 
 
        [OUTPUT INSTRUCTIONS]
@@ -242,6 +398,10 @@ class RAGQueryEngine:
        {context}
 
 
+       Conversation So Far:
+       {history}
+
+
        [TASK]
        Provide a clear, concise answer that:
        1. Directly addresses the question
@@ -249,73 +409,874 @@ class RAGQueryEngine:
        3. Maintains professional tone
        4. Indicates if information is limited or uncertain
        """)
+
+       # Rewrites chat follow-ups into standalone questions for retrieval
+       self.condense_prompt = ChatPromptTemplate.from_template("""
+       Rewrite the follow-up question as a standalone question about nuclear power programs,
+       resolving pronouns and references from the previous exchange. Return only the question.
+
+       Previous exchange:
+       {last_turn}
+
+       Follow-up question: {question}
+       """)
   
-   def get_relevant_documents(self, query: str, country: str) -> List[str]:
-       """Search for relevant documents with country filter"""
+   def _load_index(self):
+       """Load the FAISS index, its country partitions and exact vectors on first use"""
+       with self._index_lock:
+           if self._index_loaded or time.monotonic() < self._index_retry_at:
+               return
+           from country_partitions import CountryPartitions
+           from mmap_docstore import load_vectorstore
+           from vector_index import ExactReranker
+
+           rss_before, started = _rss_bytes(), time.perf_counter()
+           with span("index_load", path=self.index_path):
+               try:
+                   vectorstore = load_vectorstore(self.index_path, self.embeddings)
+                   index = vectorstore.index
+                   # Route country-filtered searches to per-country sub-indexes
+                   self._partitions = (CountryPartitions.load(self.index_path, index.ntotal)
+                                       or CountryPartitions.from_store(vectorstore))
+                   # Exact vectors saved with HNSW / IVF-PQ indexes, for reranking their candidates
+                   self._reranker = ExactReranker.load(self.index_path, index.ntotal, index.metric_type)
+                   self._vectorstore = vectorstore
+               except Exception as e:
+                   self.index_error = f"{type(e).__name__}: {e}"
+                   logger.warning("Failed to load FAISS index from %s: %s", self.index_path, self.index_error)
+                   self._vectorstore = self._partitions = self._reranker = None
+                   self._index_retry_at = time.monotonic() + INDEX_RETRY_SECONDS
+                   return
+               self._index_loaded, self.index_error = True, None
+           if self.resource_stats is not None:
+               self.resource_stats.add_load(time.perf_counter() - started, _rss_bytes() - rss_before)
+           self._configure_indexes()
+
+   @property
+   def index_loaded(self) -> bool:
+       """Whether the FAISS index is in memory, without triggering a load"""
+       return self._index_loaded
+
+   @property
+   def vectorstore(self):
+       """The FAISS vector store, or None while the index can't be loaded (retried every INDEX_RETRY_SECONDS)"""
+       if not self._index_loaded:
+           self._load_index()
+       return self._vectorstore
+
+   @property
+   def partitions(self) -> Optional["CountryPartitions"]:
+       if not self._index_loaded:
+           self._load_index()
+       return self._partitions
+
+   @property
+   def reranker(self) -> Optional["ExactReranker"]:
+       if not self._index_loaded:
+           self._load_index()
+       return self._reranker
+
+   @property
+   def llm(self) -> "BaseChatModel":
+       if self._llm is None:
+           from langchain_openai import ChatOpenAI
+           self._llm = ChatOpenAI(model="gpt-4", temperature=0)
+       return self._llm
+
+   @llm.setter
+   def llm(self, llm: "BaseChatModel"):
+       self._llm = llm
+
+   def warm_retrieval(self, index_path: str, csv_path: str, questions: Dict[str, List[str]]) -> bool:
+       """Attach precomputed guided-question retrieval, rebuilt when the index or PRIS data changed"""
        if self.vectorstore is None:
-           return ["Error: FAISS index could not be loaded."]
-      
+           return False
+       from warm_cache import ensure_warm_cache
+
        try:
-           docs = self.vectorstore.similarity_search(
-               query,
-               k=5,
-               filter={"country": country} if country else None
-           )
-          
-           formatted_docs = []
-           for doc in docs:
-               source = f"[{doc.metadata['source']}]"
-               if doc.metadata['source'] == 'CNPP':
-                   source += f" {doc.metadata['country']} Policy Document"
-               formatted_docs.append(f"{source}: {doc.page_content}")
-          
-           return formatted_docs
-          
+           self.warm_cache, rebuilt = ensure_warm_cache(self, index_path, csv_path, questions,
+                                                        k=self.candidate_depth(5))
+           return rebuilt
        except Exception as e:
-           st.error(f"Error during document search: {str(e)}")
-           return [f"Error: Failed to search documents: {str(e)}"]
-  
-   def generate_analysis(self, questions: List[str], country: str, data_summary: str) -> str:
+           logger.warning("Could not precompute guided-question retrieval: %s", e)
+           return False
+
+   def start_warm_up(self, index_path: str, csv_path: str, questions: Dict[str, List[str]]) -> threading.Thread:
+       """Run warm_retrieval, index load included, in a daemon thread after any earlier warm-up"""
+       previous = self._warm_thread
+
+       def run():
+           if previous is not None:
+               previous.join()
+           self.warm_retrieval(index_path, csv_path, questions)
+
+       self._warm_thread = threading.Thread(target=run, name="warm-retrieval", daemon=True)
+       self._warm_thread.start()
+       return self._warm_thread
+
+   def configure_search(self, nprobe: int = 16, ef_search: int = 64, rerank_factor: int = 10):
+       """Accuracy knobs of HNSW / IVF-PQ indexes: lists probed, graph search breadth, rerank over-fetch"""
+       self.search_params = {"nprobe": nprobe, "ef_search": ef_search, "rerank_factor": rerank_factor}
+       self.rerank_factor = rerank_factor
+       if self._index_loaded:
+           self._configure_indexes()
+
+   def _configure_indexes(self):
+       from vector_index import configure
+
+       if self._vectorstore is None:
+           return
+       for index in [self._vectorstore.index, *self._partitions.indexes.values()]:
+           configure(index, self.search_params["nprobe"], self.search_params["ef_search"])
+
+   @property
+   def lexical_index(self) -> BM25Index:
+       """BM25 index over the same chunks as the vector store, built on first use"""
+       with self._lexical_lock:
+           if self._lexical_index is None:
+               store = self.vectorstore
+               self._lexical_index = BM25Index.from_documents(
+                   store.docstore.search(store.index_to_docstore_id[row]) for row in range(store.index.ntotal)
+               )
+       return self._lexical_index
+
+   def _plan_search(self, queries: List[str], country: str, k: int,
+                    fetch_k: int) -> Tuple[List[List[int]], List[int]]:
+       """BM25 rankings per query, and the positions of queries that also need a vector search"""
+       lexical = [[] for _ in queries]
+       if self.retrieval_mode != "vector":
+           lexical = [[row for row, _ in self.lexical_index.search(q, country, fetch_k)] for q in queries]
+
+       # Exact-term queries ('APR-1400 status', 'KINS') are answered lexically without an embedding call
+       dense_queries = [
+           i for i, q in enumerate(queries)
+           if self.retrieval_mode == "vector" or (
+               self.retrieval_mode == "hybrid"
+               and not (len(lexical[i]) >= k and self.lexical_index.is_exact_term_query(q, country))
+           )
+       ]
+       self.retrieval_stats["dense"] += len(dense_queries)
+       self.retrieval_stats["lexical_only"] += len(queries) - len(dense_queries)
+       return lexical, dense_queries
+
+   def _vector_rankings(self, vectors: List[List[float]], country: str, fetch_k: int) -> List[List[int]]:
+       """One multi-query FAISS search over already embedded queries; returns ranked rows per query"""
+       if not vectors:
+           return []
+       from vector_index import is_approximate
+
+       store = self.vectorstore
+       vectors = np.asarray(vectors, dtype=np.float32)
+       if store._normalize_L2:
+           vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+       if country and country not in self.partitions:
+           return [[] for _ in vectors]
+       index = self.partitions.indexes[country] if country else store.index
+       rerank = self.reranker is not None and is_approximate(index)
+       candidates = fetch_k * self.rerank_factor if rerank else fetch_k
+       if country:
+           # Cost depends only on the selected country's corpus, and every hit matches the filter
+           _, rows = self.partitions.search(country, vectors, candidates)
+       else:
+           _, rows = index.search(vectors, min(candidates, index.ntotal))
+       if rerank:
+           _, rows = self.reranker.rerank(vectors, rows, fetch_k)
+       return [[int(row) for row in query_rows if row != -1] for query_rows in rows]
+
+   @staticmethod
+   def _query_rankings(lexical: List[List[int]], dense: Dict[int, List[int]],
+                       k: int) -> List[List[Tuple[int, float]]]:
+       """Fuse the BM25 and vector rankings of each query; (row, score) pairs, higher score is better"""
+       return [
+           reciprocal_rank_fusion([ranking for ranking in (lexical[i], dense.get(i, [])) if ranking])[:k]
+           for i in range(len(lexical))
+       ]
+
+   def _merge(self, rankings: List[List[Tuple[int, float]]], country: str) -> List[Tuple[str, "Document", float]]:
+       """Merge per-query rankings by document id, keeping each document's best score"""
+       from langchain_core.documents import Document
+
+       store = self.vectorstore
+       best: Dict[str, Tuple["Document", float]] = {}
+       with span("fusion") as stage:
+           for ranking in rankings:
+               for row, score in ranking:
+                   doc = store.docstore.search(store.index_to_docstore_id[row])
+                   if not isinstance(doc, Document):
+                       continue
+                   if country and doc.metadata.get('country') != country:
+                       continue
+                   doc_id = doc.id or store.index_to_docstore_id[row]
+                   if doc_id not in best or score > best[doc_id][1]:
+                       best[doc_id] = (doc, score)
+           stage.set(documents=len(best))
+
+       # Stable sort keeps first-seen order for equal scores, so context order is reproducible
+       ranked = sorted(best.items(), key=lambda item: item[1][1], reverse=True)
+       return [(doc_id, doc, score) for doc_id, (doc, score) in ranked]
+
+   def _rank(self, lexical: List[List[int]], dense_queries: List[int], vectors: List[List[float]],
+             country: str, fetch_k: int, k: int) -> List[List[Tuple[int, float]]]:
+       with span("vector_search", queries=len(vectors)):
+           dense = dict(zip(dense_queries, self._vector_rankings(vectors, country, fetch_k)))
+       return self._query_rankings(lexical, dense, k)
+
+   def rank_queries(self, queries: List[str], country: str, k: int = 5,
+                    candidates: Optional[int] = None) -> List[List[Tuple[int, float]]]:
+       """Live fused ranking per query, `candidates` deep (default k); queries needing vectors are embedded in one batch"""
+       candidates = candidates or k
+       fetch_k = max(k * 4, candidates)
+       with span("lexical_search", queries=len(queries)):
+           lexical, dense_queries = self._plan_search(queries, country, k, fetch_k)
+       vectors = []
+       if dense_queries:
+           with span("embedding", texts=len(dense_queries)):
+               vectors = self.embeddings.embed_documents([queries[i] for i in dense_queries])
+       return self._rank(lexical, dense_queries, vectors, country, fetch_k, candidates)
+
+   async def arank_queries(self, queries: List[str], country: str, k: int = 5,
+                           candidates: Optional[int] = None) -> List[List[Tuple[int, float]]]:
+       """Async rank_queries: only the embedding request is awaited; BM25 and FAISS take milliseconds"""
+       candidates = candidates or k
+       fetch_k = max(k * 4, candidates)
+       with span("lexical_search", queries=len(queries)):
+           lexical, dense_queries = self._plan_search(queries, country, k, fetch_k)
+       vectors = []
+       if dense_queries:
+           with span("embedding", texts=len(dense_queries)):
+               vectors = await self.embeddings.aembed_documents([queries[i] for i in dense_queries])
+       return self._rank(lexical, dense_queries, vectors, country, fetch_k, candidates)
+
+   def _warm_rankings(self, queries: List[str], country: str, k: int) -> Optional[List[List[Tuple[int, float]]]]:
+       """Precomputed rankings when every query is a warmed guided question"""
+       if self.warm_cache is None:
+           return None
+       with span("warm_lookup") as stage:
+           rankings = self.warm_cache.lookup(country, queries, k)
+           stage.set(hit=rankings is not None)
+       if rankings is not None:
+           self.retrieval_stats["warm"] += len(queries)
+       return rankings
+
+   def candidate_depth(self, k: int) -> int:
+       """Candidates fetched per query for a final top k: over-fetched when the relevance stage is on"""
+       return max(k, self.rerank_candidates) if self.relevance is not None else k
+
+   def _candidate_vectors(self, rows: np.ndarray) -> Optional[np.ndarray]:
+       """Stored vectors of the candidate rows, from the exact vectors or the flat index; None if unavailable"""
+       try:
+           if self.reranker is not None:
+               return np.asarray(self.reranker.vectors[rows], dtype=np.float32)
+           return self.vectorstore.index.reconstruct_batch(rows)
+       except RuntimeError:
+           # IVF-PQ without exact vectors keeps no reconstructable copy
+           return None
+
+   def _cosine(self, queries: List[str], rows: np.ndarray) -> Optional[np.ndarray]:
+       """Cosine of each query against each candidate, NaN rows for queries whose vector isn't cached
+
+       Queries answered lexically or from the warm cache are not embedded just for this.
+       """
+       cached = self.embeddings.cached(queries)
+       if all(vector is None for vector in cached):
+           return None
+       vectors = self._candidate_vectors(rows)
+       if vectors is None:
+           return None
+       known = [i for i, vector in enumerate(cached) if vector is not None]
+       query_vectors = np.asarray([cached[i] for i in known], dtype=np.float32)
+       query_vectors /= np.maximum(np.linalg.norm(query_vectors, axis=1, keepdims=True), 1e-12)
+       vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+       cosine = np.full((len(queries), len(rows)), np.nan)
+       cosine[known] = query_vectors @ vectors.T
+       return cosine
+
+   def _rerank(self, queries: List[str], rankings: List[List[Tuple[int, float]]],
+               k: int) -> List[List[Tuple[int, float]]]:
+       """Rescore every query against every candidate in one batch and cut each list at a score gap"""
+       if self.relevance is None:
+           return [ranking[:k] for ranking in rankings]
+       # Union in first-stage order, so equal scores keep the fused order
+       rows = np.fromiter(dict.fromkeys(row for ranking in rankings for row, _ in ranking), dtype=np.int64)
+       if not len(rows):
+           return rankings
+       with span("rerank", queries=len(queries), candidates=len(rows)) as stage:
+           scores = self.relevance.score(self.lexical_index.score_rows(queries, rows), self._cosine(queries, rows))
+           reranked = self.relevance.select(rows, scores, rankings, k)
+           kept = len({row for ranking in reranked for row, _ in ranking})
+           stage.set(kept=kept)
+       self.retrieval_stats["candidates"] += len(rows)
+       self.retrieval_stats["kept"] += kept
+       return reranked
+
+   def _search(self, queries: List[str], country: str, k: int = 5) -> List[Tuple[str, "Document", float]]:
+       """Hybrid BM25 + vector search over-fetching candidates for the relevance stage
+
+       Served from the warm cache when it covers every query.
+       """
+       depth = self.candidate_depth(k)
+       rankings = self._warm_rankings(queries, country, depth)
+       if rankings is None:
+           rankings = self.rank_queries(queries, country, k, depth)
+       return self._merge(self._rerank(queries, rankings, k), country)
+
+   async def _asearch(self, queries: List[str], country: str, k: int = 5) -> List[Tuple[str, "Document", float]]:
+       depth = self.candidate_depth(k)
+       rankings = self._warm_rankings(queries, country, depth)
+       if rankings is None:
+           rankings = await self.arank_queries(queries, country, k, depth)
+       return self._merge(self._rerank(queries, rankings, k), country)
+
+   @staticmethod
+   def _format_document(doc: "Document") -> str:
+       source = f"[{doc.metadata['source']}]"
+       if doc.metadata['source'] == 'CNPP':
+           source += f" {doc.metadata['country']} Policy Document"
+       return f"{source}: {doc.page_content}"
+
+   def _retrieved(self, hits: List[Tuple[str, "Document", float]]) -> Tuple[List[str], List[str]]:
+       return [doc_id for doc_id, _, _ in hits], [self._format_document(doc) for _, doc, _ in hits]
+
+   def _require_index(self):
+       if self.vectorstore is None:
+           raise RetrievalError(f"FAISS index could not be loaded: {self.index_error or 'unknown error'}")
+
+   def _retrieve(self, queries: List[str], country: str, k: int = 5) -> Tuple[List[str], List[str]]:
+       """Return (doc ids, formatted documents); raises RetrievalError when search is unavailable or fails"""
+       with span("retrieval", queries=len(queries), country=country) as stage:
+           self._require_index()
+           try:
+               hits = self._search(queries, country, k)
+           except Exception as e:
+               raise RetrievalError(f"Failed to search documents: {e}") from e
+           stage.set(doc_ids=[doc_id for doc_id, _, _ in hits])
+       return self._retrieved(hits)
+
+   async def _aretrieve(self, queries: List[str], country: str, k: int = 5) -> Tuple[List[str], List[str]]:
+       with span("retrieval", queries=len(queries), country=country) as stage:
+           self._require_index()
+           try:
+               hits = await self._asearch(queries, country, k)
+           except Exception as e:
+               raise RetrievalError(f"Failed to search documents: {e}") from e
+           stage.set(doc_ids=[doc_id for doc_id, _, _ in hits])
+       return self._retrieved(hits)
+
+   def search_documents(self, queries: List[str], country: str, k: int = 5) -> List[str]:
+       """Search for documents relevant to any of the queries, deduplicated and ordered by score"""
+       with tracer.trace("retrieve", country=country, queries=len(queries)):
+           return self._retrieve(queries, country, k)[1]
+
+   async def asearch_documents(self, queries: List[str], country: str, k: int = 5) -> List[str]:
+       with tracer.trace("retrieve", country=country, queries=len(queries)):
+           return (await self._aretrieve(queries, country, k))[1]
+
+   def get_relevant_documents(self, query: str, country: str) -> List[str]:
+       """Search for relevant documents with country filter"""
+       return self.search_documents([query], country)
+
+   async def aget_relevant_documents(self, query: str, country: str) -> List[str]:
+       return await self.asearch_documents([query], country)
+
+   @property
+   def _model_name(self) -> str:
+       return getattr(self.llm, "model_name", "gpt-4")
+
+   def _pack_context(self, doc_ids: List[str], docs: List[str], meta: Dict) -> Tuple[List[str], List[str]]:
+       """Drop near-duplicate chunks and pack the rest, best first, under the context token budget"""
+       with span("context_packing", budget=self.context_token_budget) as stage:
+           packed = pack_context(doc_ids, docs, self.context_token_budget, model=self._model_name)
+           stage.set(tokens_in=packed.tokens_in, tokens_used=packed.tokens_used,
+                     dropped_duplicates=packed.dropped_duplicates,
+                     dropped_over_budget=packed.dropped_over_budget, doc_ids=packed.doc_ids)
+       meta["context_tokens"] = packed.tokens_used
+       meta["context_tokens_saved"] = packed.tokens_saved
+       return packed.doc_ids, packed.texts
+
+   def _response_key(self, prompt: "ChatPromptTemplate", *parts) -> str:
+       model = getattr(self.llm, "model_name", type(self.llm).__name__)
+       return self.response_cache.make_key(prompt.pretty_repr(), model, *parts)
+
+   def _analysis_request(self, questions: List[str], country: str, data_summary: str, doc_ids: List[str],
+                         relevant_docs: List[str]) -> Tuple[str, "ChatPromptTemplate", Dict]:
+       """Response cache key, prompt and prompt inputs for a guided analysis"""
+       cache_key = self._response_key(self.analysis_prompt, sorted(questions), country, data_summary, doc_ids)
+       return cache_key, self.analysis_prompt, {
+           "questions": "\n".join(questions),
+           "context": "\n\n".join(relevant_docs),
+           "data_summary": data_summary,
+       }
+
+   def _answer_request(self, question: str, country: str, data_summary: str, doc_ids: List[str],
+                       relevant_docs: List[str], history: str = "", search_question: Optional[str] = None
+                       ) -> Tuple[str, str, "ChatPromptTemplate", Dict]:
+       """Response cache key, semantic cache scope, prompt and prompt inputs for an ad-hoc question
+
+       Both are keyed by the standalone question and by the history the prompt
+       carries, so opening questions are shared across sessions but an answer
+       written for one conversation is never served in another.
+       """
+       cache_key = self._response_key(self.qa_prompt, search_question or question, country, data_summary, doc_ids,
+                                      history)
+       # Near-duplicate standalone questions share an answer only when they name the same
+       # countries, reactor types and years, with the same statistics and history
+       semantic_scope = self._response_key(self.qa_prompt, country, data_summary, history,
+                                           question_entities(search_question or question))
+       return cache_key, semantic_scope, self.qa_prompt, {
+           "question": question,
+           "context": "\n\n".join(relevant_docs),
+           "data_summary": data_summary,
+           "history": history or "None; this is the first question.",
+       }
+
+   def _condense_inputs(self, question: str, conversation: Optional[ConversationMemory]) -> Optional[Dict]:
+       if conversation is None or not conversation.needs_rewrite(question):
+           return None
+       return {"last_turn": conversation.last_turn(), "question": question}
+
+   def _record_rewrite(self, question: str, rewritten: str, meta: Dict, stage) -> str:
+       rewritten = " ".join(rewritten.split()).strip('"') or question
+       meta["standalone_question"] = rewritten
+       stage.set(standalone_question=rewritten)
+       return rewritten
+
+   def standalone_question(self, question: str, conversation: Optional[ConversationMemory],
+                           meta: Optional[Dict] = None) -> str:
+       """Retrieval query for a chat turn: follow-ups are rewritten using the previous exchange"""
+       meta = {} if meta is None else meta
+       inputs = self._condense_inputs(question, conversation)
+       if inputs is None:
+           return question
+       with span("question_rewrite") as stage:
+           try:
+               rewritten = (self.condense_prompt | self.llm | self._output_parser).invoke(inputs)
+           except Exception as e:
+               record_error(e)
+               rewritten = conversation.fallback_query(question)
+           return self._record_rewrite(question, rewritten, meta, stage)
+
+   async def astandalone_question(self, question: str, conversation: Optional[ConversationMemory],
+                                  meta: Optional[Dict] = None) -> str:
+       meta = {} if meta is None else meta
+       inputs = self._condense_inputs(question, conversation)
+       if inputs is None:
+           return question
+       with span("question_rewrite") as stage:
+           try:
+               rewritten = await (self.condense_prompt | self.llm | self._output_parser).ainvoke(inputs)
+           except Exception as e:
+               record_error(e)
+               rewritten = conversation.fallback_query(question)
+           return self._record_rewrite(question, rewritten, meta, stage)
+
+   def _history(self, conversation: Optional[ConversationMemory], meta: Dict) -> str:
+       history = conversation.prompt_block() if conversation is not None else ""
+       if history:
+           meta["history_tokens"] = count_tokens(history, self._model_name)
+       return history
+
+   def _lookup_response(self, cache_key: str, semantic_scope: str,
+                        search_question: str) -> Tuple[Optional[str], str, Optional[Callable[[str], None]]]:
+       """(cached response, outcome, writer for the semantic tier on a miss)
+
+       The semantic tier reuses the question vector retrieval already cached;
+       a question searched without one (lexical-only) skips it rather than
+       paying for an embedding call just to probe the cache.
+       """
+       with span("cache_lookup") as stage:
+           cached, outcome, question_vector = self.response_cache.get(cache_key), "hit", None
+           if cached is None:
+               question_vector = self.embeddings.cached([search_question])[0]
+               if question_vector is not None:
+                   cached, outcome = self.response_cache.get_similar(semantic_scope, question_vector), "semantic"
+           stage.set(outcome=outcome if cached is not None else "miss")
+       if cached is not None or question_vector is None:
+           return cached, outcome, None
+       return None, outcome, lambda answer: self.response_cache.put_similar(
+           semantic_scope, cache_key, question_vector, answer)
+
+   def _assemble_prompt(self, prompt: "ChatPromptTemplate", inputs: Dict, meta: Dict) -> "PromptValue":
+       with span("prompt_assembly") as stage:
+           prompt_value = prompt.invoke(inputs)
+           meta["prompt_tokens"] = count_tokens(prompt_value.to_string(), self._model_name)
+           stage.set(prompt_tokens=meta["prompt_tokens"])
+       return prompt_value
+
+   def _finish_response(self, parts: List[str], cache_key: Optional[str], meta: Dict, started: float,
+                        on_complete: Optional[Callable[[str], None]], stage):
+       meta["total_seconds"] = time.perf_counter() - started
+       response = "".join(parts)
+       meta["completion_tokens"] = count_tokens(response, self._model_name)
+       stage.set(ttft_seconds=meta.get("ttft_seconds"), completion_tokens=meta["completion_tokens"])
+       if cache_key is not None:
+           self.response_cache.put(cache_key, response)
+       if on_complete is not None:
+           on_complete(response)
+
+   def _stream_response(self, prompt_value: "PromptValue", cache_key: Optional[str], meta: Dict, started: float,
+                        on_complete: Optional[Callable[[str], None]] = None) -> Iterator[str]:
+       """Stream model output while timing first token and total latency, caching the final text"""
+       parts = []
+       with span("generation", model=self._model_name) as stage:
+           for chunk in (self.llm | self._output_parser).stream(prompt_value):
+               if not parts:
+                   meta["ttft_seconds"] = time.perf_counter() - started
+               parts.append(chunk)
+               yield chunk
+           self._finish_response(parts, cache_key, meta, started, on_complete, stage)
+
+   async def _astream_response(self, prompt_value: "PromptValue", cache_key: Optional[str], meta: Dict,
+                               started: float, on_complete: Optional[Callable[[str], None]] = None
+                               ) -> AsyncIterator[str]:
+       parts = []
+       with span("generation", model=self._model_name) as stage:
+           async for chunk in (self.llm | self._output_parser).astream(prompt_value):
+               if not parts:
+                   meta["ttft_seconds"] = time.perf_counter() - started
+               parts.append(chunk)
+               yield chunk
+           self._finish_response(parts, cache_key, meta, started, on_complete, stage)
+
+   @staticmethod
+   def _record_cached(meta: Dict, outcome: str, started: float):
+       meta["cache"] = outcome
+       meta["ttft_seconds"] = meta["total_seconds"] = time.perf_counter() - started
+
+   def _record_miss(self, meta: Dict):
+       self.response_cache.record_miss()
+       meta["cache"] = "miss"
+
+   def _cached_analysis(self, cache_key: str) -> Optional[str]:
+       with span("cache_lookup") as stage:
+           cached = self.response_cache.get(cache_key)
+           stage.set(outcome="miss" if cached is None else "hit")
+       return cached
+
+   def _analysis_stages(self, questions: List[str], country: str, data_summary: str, meta: Dict) -> Iterator[str]:
+       started = time.perf_counter()
+       # One embedding request and one FAISS search for all selected questions
+       doc_ids, relevant_docs = self._pack_context(*self._retrieve(questions, country), meta)
+       meta["retrieval_seconds"] = time.perf_counter() - started
+
+       cache_key, prompt, inputs = self._analysis_request(questions, country, data_summary, doc_ids, relevant_docs)
+       cached = self._cached_analysis(cache_key)
+       if cached is not None:
+           self._record_cached(meta, "hit", started)
+           yield cached
+           return
+       self._record_miss(meta)
+       yield from self._stream_response(self._assemble_prompt(prompt, inputs, meta), cache_key, meta, started)
+
+   async def _aanalysis_stages(self, questions: List[str], country: str, data_summary: str,
+                               meta: Dict) -> AsyncIterator[str]:
+       started = time.perf_counter()
+       doc_ids, relevant_docs = self._pack_context(*await self._aretrieve(questions, country), meta)
+       meta["retrieval_seconds"] = time.perf_counter() - started
+
+       cache_key, prompt, inputs = self._analysis_request(questions, country, data_summary, doc_ids, relevant_docs)
+       cached = self._cached_analysis(cache_key)
+       if cached is not None:
+           self._record_cached(meta, "hit", started)
+           yield cached
+           return
+       self._record_miss(meta)
+       async for chunk in self._astream_response(self._assemble_prompt(prompt, inputs, meta),
+                                                 cache_key, meta, started):
+           yield chunk
+
+   def stream_analysis(self, questions: List[str], country: str, data_summary: str,
+                       meta: Optional[Dict] = None) -> Iterator[str]:
+       """Stream the comprehensive analysis report as it is generated"""
+       meta = {} if meta is None else meta
+       with tracer.trace("analysis", country=country, questions=len(questions)) as trace:
+           meta["trace_id"] = trace.trace_id
+           yield from self._analysis_stages(questions, country, data_summary, meta)
+           trace.set(**meta)
+
+   async def astream_analysis(self, questions: List[str], country: str, data_summary: str,
+                              meta: Optional[Dict] = None) -> AsyncIterator[str]:
+       """Async stream_analysis, for serving many sessions from one event loop"""
+       meta = {} if meta is None else meta
+       with tracer.trace("analysis", country=country, questions=len(questions)) as trace:
+           meta["trace_id"] = trace.trace_id
+           async for chunk in self._aanalysis_stages(questions, country, data_summary, meta):
+               yield chunk
+           trace.set(**meta)
+
+   def generate_analysis(self, questions: List[str], country: str, data_summary: str,
+                         meta: Optional[Dict] = None) -> str:
        """Generate comprehensive analysis report"""
-       relevant_docs = []
-       for question in questions:
-           relevant_docs.extend(self.get_relevant_documents(question, country))
-      
-       rag_chain = (
-           {
-               "questions": lambda x: "\n".join(x["questions"]),
-               "context": lambda x: "\n\n".join(set(relevant_docs)),  # Remove duplicates
-               "data_summary": lambda x: x["data_summary"]
-           }
-           | self.analysis_prompt
-           | self.llm
-           | StrOutputParser()
+       return "".join(self.stream_analysis(questions, country, data_summary, meta))
+
+   async def agenerate_analysis(self, questions: List[str], country: str, data_summary: str,
+                                meta: Optional[Dict] = None) -> str:
+       return "".join([chunk async for chunk in self.astream_analysis(questions, country, data_summary, meta)])
+
+   def _answer_stages(self, question: str, country: str, data_summary: str, meta: Dict,
+                      conversation: Optional[ConversationMemory]) -> Iterator[str]:
+       started = time.perf_counter()
+       search_question = self.standalone_question(question, conversation, meta)
+       retrieval_started = time.perf_counter()
+       doc_ids, relevant_docs = self._pack_context(*self._retrieve([search_question], country), meta)
+       meta["retrieval_seconds"] = time.perf_counter() - retrieval_started
+
+       cache_key, semantic_scope, prompt, inputs = self._answer_request(
+           question, country, data_summary, doc_ids, relevant_docs, self._history(conversation, meta), search_question
        )
-      
-       return rag_chain.invoke({
-           "questions": questions,
-           "data_summary": data_summary
-       })
-  
-   def answer_question(self, question: str, country: str, data_summary: str) -> str:
+       cached, outcome, on_complete = self._lookup_response(cache_key, semantic_scope, search_question)
+       if cached is not None:
+           self._record_cached(meta, outcome, started)
+           yield cached
+           return
+       self._record_miss(meta)
+       yield from self._stream_response(self._assemble_prompt(prompt, inputs, meta),
+                                        cache_key, meta, started, on_complete)
+
+   async def _aanswer_stages(self, question: str, country: str, data_summary: str, meta: Dict,
+                             conversation: Optional[ConversationMemory]) -> AsyncIterator[str]:
+       started = time.perf_counter()
+       search_question = await self.astandalone_question(question, conversation, meta)
+       retrieval_started = time.perf_counter()
+       doc_ids, relevant_docs = self._pack_context(*await self._aretrieve([search_question], country), meta)
+       meta["retrieval_seconds"] = time.perf_counter() - retrieval_started
+
+       cache_key, semantic_scope, prompt, inputs = self._answer_request(
+           question, country, data_summary, doc_ids, relevant_docs, self._history(conversation, meta), search_question
+       )
+       cached, outcome, on_complete = self._lookup_response(cache_key, semantic_scope, search_question)
+       if cached is not None:
+           self._record_cached(meta, outcome, started)
+           yield cached
+           return
+       self._record_miss(meta)
+       async for chunk in self._astream_response(self._assemble_prompt(prompt, inputs, meta),
+                                                 cache_key, meta, started, on_complete):
+           yield chunk
+
+   def stream_answer(self, question: str, country: str, data_summary: str, meta: Optional[Dict] = None,
+                     conversation: Optional[ConversationMemory] = None) -> Iterator[str]:
+       """Stream the answer to an ad-hoc question as it is generated; the caller records the turn"""
+       meta = {} if meta is None else meta
+       with tracer.trace("answer", country=country, turn=len(conversation or ())) as trace:
+           meta["trace_id"] = trace.trace_id
+           yield from self._answer_stages(question, country, data_summary, meta, conversation)
+           trace.set(**meta)
+
+   async def astream_answer(self, question: str, country: str, data_summary: str, meta: Optional[Dict] = None,
+                            conversation: Optional[ConversationMemory] = None) -> AsyncIterator[str]:
+       """Async stream_answer, for serving many sessions from one event loop"""
+       meta = {} if meta is None else meta
+       with tracer.trace("answer", country=country, turn=len(conversation or ())) as trace:
+           meta["trace_id"] = trace.trace_id
+           async for chunk in self._aanswer_stages(question, country, data_summary, meta, conversation):
+               yield chunk
+           trace.set(**meta)
+
+   def answer_question(self, question: str, country: str, data_summary: str, meta: Optional[Dict] = None,
+                       conversation: Optional[ConversationMemory] = None) -> str:
        """Generate answer for ad-hoc question"""
-       relevant_docs = self.get_relevant_documents(question, country)
-      
-       qa_chain = (
-           {
-               "question": lambda x: x["question"],
-               "context": lambda x: "\n\n".join(relevant_docs),
-               "data_summary": lambda x: x["data_summary"]
-           }
-           | self.qa_prompt
-           | self.llm
-           | StrOutputParser()
+       return "".join(self.stream_answer(question, country, data_summary, meta, conversation))
+
+   async def aanswer_question(self, question: str, country: str, data_summary: str, meta: Optional[Dict] = None,
+                              conversation: Optional[ConversationMemory] = None) -> str:
+       return "".join([
+           chunk async for chunk in self.astream_answer(question, country, data_summary, meta, conversation)
+       ])
+
+
+@dataclass
+class ResourceStats:
+   """Build cost of a process-wide cached resource and how often it was reused"""
+   name: str
+   load_seconds: float
+   memory_bytes: int
+   requests: int = 0
+
+   @property
+   def reuses(self) -> int:
+       return max(0, self.requests - 1)
+
+   def add_load(self, seconds: float, memory_bytes: int):
+       """Count a deferred part of the build (the RAG engine's index load) in the resource's cost"""
+       self.load_seconds += seconds
+       self.memory_bytes += max(0, memory_bytes)
+
+
+def _rss_bytes() -> int:
+   """Current resident set size of this process"""
+   try:
+       with open("/proc/self/statm") as f:
+           return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+   except (OSError, ValueError, IndexError):
+       # Peak RSS is the best portable fallback (kilobytes on Linux, bytes on macOS)
+       return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _path_fingerprint(path: str) -> Tuple:
+   """(name, mtime, size) of a file or of every file in a directory, used to invalidate cached resources"""
+   if os.path.isdir(path):
+       paths = sorted(os.path.join(path, name) for name in os.listdir(path))
+   else:
+       paths = [path]
+   fingerprint = []
+   for p in paths:
+       try:
+           stat = os.stat(p)
+           fingerprint.append((p, stat.st_mtime_ns, stat.st_size))
+       except OSError:
+           fingerprint.append((p, None, None))
+   return tuple(fingerprint)
+
+
+def _build_resource(name: str, factory: Callable) -> Tuple[object, ResourceStats]:
+   """Construct a resource while measuring its load time and RSS growth"""
+   rss_before = _rss_bytes()
+   start = time.perf_counter()
+   obj = factory()
+   stats = ResourceStats(name, time.perf_counter() - start, max(0, _rss_bytes() - rss_before))
+   return obj, stats
+
+
+# Built once per process and shared by all sessions; a changed fingerprint
+# replaces the single cached entry.
+@st.cache_resource(show_spinner="Loading PRIS data...", max_entries=1)
+def _cached_data_analyzer(csv_path: str, fingerprint: Tuple) -> Tuple[DataAnalyzer, ResourceStats]:
+   return _build_resource("DataAnalyzer", lambda: DataAnalyzer(csv_path))
+
+
+@st.cache_resource(show_spinner="Loading knowledge base...", max_entries=1)
+def _cached_rag_engine(index_path: str, fingerprint: Tuple) -> Tuple[RAGQueryEngine, ResourceStats]:
+   engine, stats = _build_resource("RAGQueryEngine", lambda: RAGQueryEngine(index_path))
+   engine.resource_stats = stats
+   return engine, stats
+
+
+# Freshness check for the precomputed guided-question retrieval, run in the
+# background so no request waits on the index load or a rebuild: re-validated
+# against the index and PRIS.csv contents whenever either file changes, and
+# once the index loads after a failed attempt.
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _warm_guided_retrieval(_engine: RAGQueryEngine, index_fingerprint: Tuple, csv_fingerprint: Tuple,
+                           index_loaded: bool) -> threading.Thread:
+   from warm_cache import guided_questions
+
+   return _engine.start_warm_up(FAISS_INDEX_PATH, PRIS_CSV_PATH, guided_questions(DYNAMIC_QUESTIONS))
+
+
+def get_data_analyzer() -> Tuple[DataAnalyzer, ResourceStats]:
+   """Process-wide DataAnalyzer, rebuilt only when PRIS.csv changes"""
+   analyzer, stats = _cached_data_analyzer(PRIS_CSV_PATH, _path_fingerprint(PRIS_CSV_PATH))
+   stats.requests += 1
+   return analyzer, stats
+
+
+def get_rag_engine() -> Tuple[RAGQueryEngine, ResourceStats]:
+   """Process-wide RAGQueryEngine, rebuilt only when the FAISS index files change"""
+   index_fingerprint = _path_fingerprint(FAISS_INDEX_PATH)
+   engine, stats = _cached_rag_engine(FAISS_INDEX_PATH, index_fingerprint)
+   _warm_guided_retrieval(engine, index_fingerprint, _path_fingerprint(PRIS_CSV_PATH), engine.index_loaded)
+   stats.requests += 1
+   return engine, stats
+
+
+class _Resources:
+   """The cached analyzers for one script run, fetched on first access"""
+
+   def __init__(self):
+       self._analyzer: Optional[DataAnalyzer] = None
+       self._engine: Optional[RAGQueryEngine] = None
+       self.stats: List[ResourceStats] = []
+
+   @property
+   def analyzer(self) -> DataAnalyzer:
+       if self._analyzer is None:
+           self._analyzer, stats = get_data_analyzer()
+           self.stats.append(stats)
+           st.session_state.analyzer_used = True
+       return self._analyzer
+
+   @property
+   def engine(self) -> RAGQueryEngine:
+       if self._engine is None:
+           self._engine, stats = get_rag_engine()
+           self.stats.append(stats)
+           st.session_state.engine_used = True
+       return self._engine
+
+
+def _render_resource_stats(resources: _Resources):
+   """Load times and cache counters of the analyzers this session has used"""
+   analyzer = resources.analyzer if st.session_state.get("analyzer_used") else None
+   rag_engine = resources.engine if st.session_state.get("engine_used") else None
+   if analyzer is None and rag_engine is None:
+       st.caption("The PRIS data and knowledge base load on the first analysis or question.")
+       return
+   for stats in resources.stats:
+       st.caption(
+           f"**{stats.name}**: loaded in {stats.load_seconds:.2f}s, "
+           f"~{stats.memory_bytes / 2**20:.1f} MB, reused {stats.reuses}x "
+           f"(~{stats.load_seconds * stats.reuses:.1f}s saved)"
        )
-      
-       return qa_chain.invoke({
-           "question": question,
-           "data_summary": data_summary
-       })
+   if rag_engine is not None:
+       embedding_stats = rag_engine.embeddings.stats
+       st.caption(
+           f"**Query embeddings**: {embedding_stats['memory_hits']} memory hits, "
+           f"{embedding_stats['disk_hits']} disk hits, {embedding_stats['misses']} misses"
+       )
+       st.caption(
+           f"**Retrieval**: {rag_engine.retrieval_stats['dense']} hybrid queries, "
+           f"{rag_engine.retrieval_stats['lexical_only']} exact-term queries without embedding, "
+           f"{rag_engine.retrieval_stats['warm']} guided questions from the warm cache; "
+           f"relevance rerank kept {rag_engine.retrieval_stats['kept']} of "
+           f"{rag_engine.retrieval_stats['candidates']} candidates"
+       )
+       response_stats = rag_engine.response_cache.stats
+       st.caption(
+           f"**Responses**: {response_stats['hits']} hits, "
+           f"{response_stats['semantic_hits']} similar-question hits, {response_stats['misses']} misses"
+       )
+   if analyzer is not None:
+       route_stats = analyzer.query_router.stats
+       st.caption(
+           f"**Chat routing**: {route_stats['structured']} answered from the PRIS table, "
+           f"{route_stats['rag']} sent to the RAG chain"
+       )
+
+
+def _latency_caption(meta: Dict) -> str:
+   """One-line timing and cache summary for a streamed response"""
+   if meta.get('route') == 'pris_table':
+       return f"⚡ Answered from the PRIS table in {meta['route_seconds'] * 1000:.1f} ms"
+   caption = (
+       f"First token {meta.get('ttft_seconds', 0):.1f}s · total {meta.get('total_seconds', 0):.1f}s "
+       f"(retrieval {meta.get('retrieval_seconds', 0):.2f}s)"
+   )
+   if 'context_tokens' in meta:
+       caption += f" · context {meta['context_tokens']:,} tokens ({meta['context_tokens_saved']:,} saved)"
+   if meta.get('cache') == 'hit':
+       caption = "⚡ Served from response cache · " + caption
+   elif meta.get('cache') == 'semantic':
+       caption = "⚡ Served from response cache (similar question) · " + caption
+   if meta.get('standalone_question'):
+       caption += f" · searched as \"{meta['standalone_question']}\""
+   return caption
+
+
+def _render_trace(trace):
+   """Stage breakdown of one traced request, for the sidebar debug panel"""
+   import pandas as pd
+
+   st.caption(f"**{trace.name}** `{trace.trace_id}` · {trace.duration * 1000:.0f} ms · {trace.status}")
+   st.dataframe(pd.DataFrame([{
+       "stage": " " * s.depth + s.name,
+       "start ms": round(s.start * 1000, 1),
+       "ms": round(s.duration * 1000, 1),
+       "details": ", ".join(f"{k}={v}" for k, v in s.attrs.items() if k != "doc_ids"),
+       "error": s.error or "",
+   } for s in trace.spans]), hide_index=True, use_container_width=True)
+   doc_ids = next((s.attrs["doc_ids"] for s in trace.spans if s.name == "context_packing"), None)
+   if doc_ids:
+       st.caption("Context documents: " + ", ".join(f"`{doc_id}`" for doc_id in doc_ids))
 
 
 def main():
@@ -402,8 +1363,12 @@ def main():
    # Initialize session state
    if 'selected_questions' not in st.session_state:
        st.session_state.selected_questions = set()
-   if 'chat_history' not in st.session_state:
-       st.session_state.chat_history = []
+   if 'conversation' not in st.session_state:
+       st.session_state.conversation = ConversationMemory()
+   if 'last_trace_id' not in st.session_state:
+       st.session_state.last_trace_id = None
+   if os.environ.get("PRIS_METRICS_PORT"):
+       serve_metrics(int(os.environ["PRIS_METRICS_PORT"]))
 
 
    # Main Header (styled bar)
@@ -427,9 +1392,9 @@ def main():
    tab1, tab2 = st.tabs(["📊 Integrated Analysis & Tableau", "💬 Real-Time Q&A Chatbot"])
 
 
-   # Initialize analyzers (preserve logic)
-   data_analyzer = DataAnalyzer()
-   rag_engine = RAGQueryEngine()
+   # Analyzers are cached per process and shared across sessions, but only built
+   # when an analysis or question needs them, so the dashboard paints first
+   resources = _Resources()
 
 
    with tab1:
@@ -522,16 +1487,22 @@ def main():
                    st.info("Select up to 3 guided questions to run the analysis.")
                else:
                    with st.spinner("🔄 Generating comprehensive analysis..."):
-                       data_summary = data_analyzer.get_country_summary(selected_country)
-                       analysis = rag_engine.generate_analysis(
-                           list(st.session_state.selected_questions),
-                           selected_country,
-                           data_summary
-                       )
+                       data_summary = resources.analyzer.get_country_summary(selected_country, selected_types)
+                       meta = {}
                        # Display report in distinct container
                        st.markdown('<div class="report-container">', unsafe_allow_html=True)
                        st.markdown('## 📑 Comprehensive Analytical Report')
-                       st.markdown(analysis)
+                       try:
+                           st.write_stream(resources.engine.stream_analysis(
+                               list(st.session_state.selected_questions),
+                               selected_country,
+                               data_summary,
+                               meta
+                           ))
+                           st.caption(_latency_caption(meta))
+                       except RetrievalError as e:
+                           st.error(f"Error during document search: {str(e)}")
+                       st.session_state.last_trace_id = meta.get("trace_id")
                        
                        # Add source citations
                        st.markdown('---')
@@ -549,31 +1520,53 @@ def main():
 
    with tab2:
        st.markdown('<h2 style="color:#0d47a1;">💡 Real-Time Q&A Chatbot</h2>', unsafe_allow_html=True)
+       conversation = st.session_state.conversation
        # Render chat history
-       for msg in st.session_state.chat_history:
-           if msg.get('role') == 'user':
-               with st.chat_message('user'):
-                   st.markdown(msg.get('content'))
-           else:
-               with st.chat_message('assistant'):
-                   st.markdown(msg.get('content'))
+       for question, answer in conversation.transcript:
+           with st.chat_message('user'):
+               st.markdown(question)
+           with st.chat_message('assistant'):
+               st.markdown(answer)
 
 
        # Chat input
        user_question = st.chat_input("Ask a question about nuclear power programs...")
        if user_question:
-           # Append user message
-           st.session_state.chat_history.append({'role': 'user', 'content': user_question})
            with st.chat_message('user'):
                st.markdown(user_question)
 
 
            with st.chat_message('assistant'):
                with st.spinner('� Searching knowledge base...'):
-                   data_summary = data_analyzer.get_country_summary(selected_country)
-                   answer = rag_engine.answer_question(user_question, selected_country, data_summary)
-                   st.session_state.chat_history.append({'role': 'assistant', 'content': answer})
-                   st.markdown(answer)
+                   meta = {}
+                   answer = resources.analyzer.answer_structured(
+                       user_question, selected_country, selected_types, meta, conversation
+                   )
+                   if answer is not None:
+                       st.markdown(answer)
+                   else:
+                       data_summary = resources.analyzer.get_country_summary(selected_country, selected_types)
+                       try:
+                           answer = st.write_stream(resources.engine.stream_answer(
+                               user_question, selected_country, data_summary, meta, conversation
+                           ))
+                       except RetrievalError as e:
+                           st.error(f"Error during document search: {str(e)}")
+                   if answer is not None:
+                       conversation.add(user_question, answer)
+                       st.caption(_latency_caption(meta))
+                   st.session_state.last_trace_id = meta.get("trace_id")
+
+   # Rendered last so they show the request that just ran
+   with st.sidebar:
+       with st.expander("⚙️ Resource Cache"):
+           _render_resource_stats(resources)
+       if st.toggle("🐞 Debug panel", key="debug_panel"):
+           trace = tracer.get(st.session_state.last_trace_id)
+           if trace is None:
+               st.caption("Run an analysis or ask a question to see its stage breakdown.")
+           else:
+               _render_trace(trace)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,264 @@
+"""Offline CNPP ingestion: parse profiles, chunk, embed and write the FAISS index
+
+Usage:
+   python ingest.py                          # OpenAI embeddings into faiss_index/
+   python ingest.py --embedder hashing       # deterministic offline embeddings
+   python ingest.py --pdf-dir CNPP --index-dir faiss_index --workers 4
+   python ingest.py --index-type ivfpq       # compressed approximate index for large corpora
+
+A content-hash manifest next to the index records every file's hash, its
+chunks and the vector of each distinct chunk text, so re-running after
+adding or replacing one profile only parses that file and only embeds the
+chunks whose text changed.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from country_partitions import CountryPartitions
+from mmap_docstore import write_docstore, write_faiss_index
+from offline import get_embeddings
+from vector_index import build_index, is_approximate, write_exact_vectors
+
+
+MANIFEST_NAME = "ingest_manifest.json"
+VECTORS_NAME = "chunk_vectors.npy"
+MANIFEST_VERSION = 1
+CHUNK_SIZE = 700
+CHUNK_OVERLAP = 100
+
+# e.g. "CNPP_Country_Profile_Korea, Republic of -2025_20251104010343.pdf"
+_CNPP_NAME_RE = re.compile(r"^CNPP_Country_Profile_(?P<country>.+?)\s*-(?P<edition>\d{4})_(?P<stamp>\d+)\.pdf$")
+
+Chunk = Dict  # {"id": str, "text": str, "metadata": dict}
+
+
+def parse_cnpp_filename(filename: str) -> Optional[Tuple[str, str, str]]:
+   """Return (country, edition, export timestamp) for a CNPP profile file name"""
+   match = _CNPP_NAME_RE.match(filename)
+   if not match:
+       return None
+   return match.group("country").strip(), match.group("edition"), match.group("stamp")
+
+
+def file_sha256(path: str) -> str:
+   digest = hashlib.sha256()
+   with open(path, "rb") as f:
+       for block in iter(lambda: f.read(1 << 20), b""):
+           digest.update(block)
+   return digest.hexdigest()
+
+
+def text_key(text: str) -> str:
+   """Key of a chunk's embedding; identical texts share one vector"""
+   return hashlib.sha256(text.encode()).hexdigest()
+
+
+def select_profiles(pdf_dir: str, keep_duplicates: bool = False) -> Dict[str, str]:
+   """Map file name -> country, keeping only the newest export per country and edition"""
+   latest: Dict[Tuple[str, str], Tuple[str, str]] = {}
+   selected: Dict[str, str] = {}
+   for name in sorted(os.listdir(pdf_dir)):
+       parsed = parse_cnpp_filename(name)
+       if parsed is None:
+           continue
+       country, edition, stamp = parsed
+       if keep_duplicates:
+           selected[name] = country
+           continue
+       previous = latest.get((country, edition))
+       if previous is None or stamp > previous[0]:
+           if previous is not None:
+               print(f"  superseded duplicate: {previous[1]}")
+           latest[(country, edition)] = (stamp, name)
+       else:
+           print(f"  superseded duplicate: {name}")
+   for (country, _), (_, name) in latest.items():
+       selected[name] = country
+   return dict(sorted(selected.items()))
+
+
+def parse_profile(path: str, country: str, chunk_size: int = CHUNK_SIZE,
+                  chunk_overlap: int = CHUNK_OVERLAP) -> List[Chunk]:
+   """Load one CNPP PDF page by page and split it into chunks (runs in a worker process)"""
+   from langchain_community.document_loaders import PyPDFLoader
+   from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+   splitter = RecursiveCharacterTextSplitter(
+       chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True
+   )
+   filename = os.path.basename(path)
+   chunks = []
+   for doc in splitter.split_documents(PyPDFLoader(path).load()):
+       metadata = dict(doc.metadata)
+       metadata.update({"source": "CNPP", "country": country, "doc_type": "policy", "file": filename})
+       chunk_id = hashlib.sha256(
+           f"{filename}\0{metadata.get('page')}\0{metadata.get('start_index')}\0{doc.page_content}".encode()
+       ).hexdigest()[:32]
+       chunks.append({"id": chunk_id, "text": doc.page_content, "metadata": metadata})
+   return chunks
+
+
+def pris_summary_chunks(csv_path: str) -> List[Chunk]:
+   """Per-country PRIS statistics documents, as shipped alongside the CNPP chunks"""
+   from pris_data import load_pris
+
+   df = load_pris(csv_path)
+   chunks = []
+   for country, group in df.groupby("Country", observed=True, sort=True):
+       text = (
+           f"Nuclear Power Statistics Summary for {country}:\n"
+           f"Total Reactors: {len(group)}\n"
+           f"Total Capacity: {group['Gross Electrical Capacity [MW]'].sum():.2f} MW\n"
+           f"Types: {', '.join(sorted(group['Type'].dropna().unique()))}\n"
+           f"Operational Units: {int((group['Status'] == 'Operational').sum())}"
+       )
+       chunks.append({
+           "id": hashlib.sha256(f"PRIS\0{text}".encode()).hexdigest()[:32],
+           "text": text,
+           "metadata": {"country": country, "source": "PRIS", "doc_type": "statistics"},
+       })
+   return chunks
+
+
+def load_manifest(index_dir: str, embedder_id: str) -> Tuple[Dict, Dict[str, np.ndarray]]:
+   """Previous manifest and its vectors by text key; empty when absent or built by another embedder"""
+   manifest_path = os.path.join(index_dir, MANIFEST_NAME)
+   vectors_path = os.path.join(index_dir, VECTORS_NAME)
+   if not (os.path.exists(manifest_path) and os.path.exists(vectors_path)):
+       return {"files": {}}, {}
+   with open(manifest_path, encoding="utf-8") as f:
+       manifest = json.load(f)
+   if manifest.get("version") != MANIFEST_VERSION or manifest.get("embedder") != embedder_id:
+       return {"files": {}}, {}
+   vectors = np.load(vectors_path)
+   return manifest, dict(zip(manifest["vector_keys"], vectors))
+
+
+def embed_missing(embedder, texts: Dict[str, str], batch_size: int) -> Dict[str, np.ndarray]:
+   """Embed {key: text} in batches"""
+   keys = list(texts)
+   vectors = {}
+   for start in range(0, len(keys), batch_size):
+       batch = keys[start:start + batch_size]
+       embedded = embedder.embed_documents([texts[key] for key in batch])
+       vectors.update(zip(batch, np.asarray(embedded, dtype=np.float32)))
+       print(f"  embedded {min(start + batch_size, len(keys))}/{len(keys)}")
+   return vectors
+
+
+def write_index(index_dir: str, chunks: List[Chunk], vectors: Dict[str, np.ndarray], index_type: str = "flat"):
+   """Write the FAISS vectors, the memory-mapped docstore and per-country partitions"""
+   from langchain_core.documents import Document
+
+   matrix = np.stack([vectors[text_key(chunk["text"])] for chunk in chunks]).astype(np.float32)
+   index = build_index(matrix, index_type)
+   partitions = CountryPartitions.build(
+       matrix, [chunk["metadata"].get("country") for chunk in chunks], index_type=index_type
+   )
+   write_faiss_index(index_dir, index)
+   write_docstore(index_dir, [
+       Document(id=chunk["id"], page_content=chunk["text"], metadata=chunk["metadata"]) for chunk in chunks
+   ])
+   partitions.save(index_dir)
+   approximate = is_approximate(index) or any(is_approximate(p) for p in partitions.indexes.values())
+   write_exact_vectors(index_dir, matrix if approximate else None)
+
+
+def ingest(pdf_dir: str, index_dir: str, embedder_name: str = "openai", csv_path: Optional[str] = "PRIS.csv",
+           workers: Optional[int] = None, batch_size: int = 256, keep_duplicates: bool = False,
+           index_type: str = "flat") -> Dict:
+   """Incrementally (re)build the index; returns counts for reporting"""
+   started = time.perf_counter()
+   embedder = get_embeddings(embedder_name)
+   embedder_id = getattr(embedder, "model", embedder_name)
+   os.makedirs(index_dir, exist_ok=True)
+   previous, known_vectors = load_manifest(index_dir, embedder_id)
+
+   profiles = select_profiles(pdf_dir, keep_duplicates)
+   files: Dict[str, Dict] = {}
+   to_parse = {}
+   for name, country in profiles.items():
+       sha = file_sha256(os.path.join(pdf_dir, name))
+       entry = previous["files"].get(name)
+       if entry and entry["sha256"] == sha and entry["country"] == country:
+           files[name] = entry
+       else:
+           to_parse[name] = (sha, country)
+
+   if to_parse:
+       with ProcessPoolExecutor(max_workers=workers) as pool:
+           futures = {
+               name: pool.submit(parse_profile, os.path.join(pdf_dir, name), country)
+               for name, (_, country) in to_parse.items()
+           }
+           for name, future in futures.items():
+               sha, country = to_parse[name]
+               files[name] = {"sha256": sha, "country": country, "chunks": future.result()}
+               print(f"  parsed {name}: {len(files[name]['chunks'])} chunks")
+
+   chunks = [chunk for name in sorted(files) for chunk in files[name]["chunks"]]
+   if csv_path:
+       chunks += pris_summary_chunks(csv_path)
+   if not chunks:
+       raise SystemExit(f"No CNPP profiles found in {pdf_dir}")
+
+   texts = {text_key(chunk["text"]): chunk["text"] for chunk in chunks}
+   vectors = {key: known_vectors[key] for key in texts if key in known_vectors}
+   missing = {key: text for key, text in texts.items() if key not in vectors}
+   vectors.update(embed_missing(embedder, missing, batch_size))
+
+   write_index(index_dir, chunks, vectors, index_type)
+   keys = list(texts)
+   np.save(os.path.join(index_dir, VECTORS_NAME), np.stack([vectors[key] for key in keys]).astype(np.float32))
+   manifest = {
+       "version": MANIFEST_VERSION,
+       "embedder": embedder_id,
+       "chunk_size": CHUNK_SIZE,
+       "chunk_overlap": CHUNK_OVERLAP,
+       "index_type": index_type,
+       "files": files,
+       "vector_keys": keys,
+   }
+   with open(os.path.join(index_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+       json.dump(manifest, f, ensure_ascii=False)
+
+   return {
+       "files": len(files),
+       "parsed": len(to_parse),
+       "chunks": len(chunks),
+       "embedded": len(missing),
+       "reused": len(texts) - len(missing),
+       "seconds": time.perf_counter() - started,
+   }
+
+
+def main():
+   parser = argparse.ArgumentParser(description="Build the CNPP FAISS index incrementally")
+   parser.add_argument("--pdf-dir", default="CNPP")
+   parser.add_argument("--index-dir", default="faiss_index")
+   parser.add_argument("--embedder", default="openai", help="'openai[:model]' or 'hashing[:size]' (offline)")
+   parser.add_argument("--csv", default="PRIS.csv", help="PRIS table for statistics documents ('' to skip)")
+   parser.add_argument("--workers", type=int, default=None, help="parser processes (default: CPU count)")
+   parser.add_argument("--batch-size", type=int, default=256, help="texts per embedding request")
+   parser.add_argument("--keep-duplicates", action="store_true",
+                       help="index every export instead of only the newest per country and edition")
+   parser.add_argument("--index-type", default="flat",
+                       help="'flat' (exact), 'hnsw[:M]' or 'ivfpq[:nlist[:m]]' for large corpora")
+   args = parser.parse_args()
+
+   stats = ingest(args.pdf_dir, args.index_dir, args.embedder, args.csv or None,
+                  args.workers, args.batch_size, args.keep_duplicates, args.index_type)
+   print(f"{stats['files']} profiles ({stats['parsed']} parsed), {stats['chunks']} chunks, "
+         f"{stats['embedded']} embedded, {stats['reused']} reused in {stats['seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+   main()
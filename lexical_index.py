@@ -0,0 +1,135 @@
+"""In-process BM25 inverted index over the CNPP chunks, and rank fusion with vector search"""
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+_TOKEN_RE = re.compile(r"[A-Za-z0-9]+(?:-[A-Za-z0-9]+)*")
+# Identifier-like tokens (APR-1400, KINS, FANR, CANDU, SMR) that dense embeddings handle poorly
+_IDENTIFIER_RE = re.compile(r"^(?:[A-Z]{2,}[A-Za-z]*|.*\d.*|.+-.+)$")
+STOPWORDS = frozenset("""
+a an and are as at be been by for from has have how in is it its of on or that the this to
+was were what which will with does do into being their there these those who why when where
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+   """Lowercased terms; hyphenated terms also emit their joined form and parts
+
+   'APR-1400' -> 'apr-1400', 'apr1400', 'apr', '1400', so it matches corpus spellings like 'APR1400'.
+   """
+   terms = []
+   for token in _TOKEN_RE.findall(text):
+       token = token.lower()
+       if token in STOPWORDS:
+           continue
+       terms.append(token)
+       if "-" in token:
+           terms.append(token.replace("-", ""))
+           terms.extend(part for part in token.split("-") if part and part not in STOPWORDS)
+   return terms
+
+
+def identifier_terms(text: str) -> List[str]:
+   """Exact-match terms: acronyms, model numbers, hyphenated designations and mid-sentence proper nouns"""
+   terms = []
+   for position, token in enumerate(_TOKEN_RE.findall(text)):
+       if len(token) < 3 or token.lower() in STOPWORDS:
+           continue
+       if _IDENTIFIER_RE.match(token) or (position > 0 and token[0].isupper()):
+           # Joined form is what tokenize() emits for every spelling ('APR-1400', 'APR1400')
+           terms.append(token.lower().replace("-", ""))
+   return terms
+
+
+class BM25Index:
+   """Okapi BM25 over a fixed corpus, with postings stored as numpy arrays"""
+
+   def __init__(self, texts: Sequence[str], countries: Sequence[Optional[str]], k1: float = 1.5, b: float = 0.75):
+       self.k1 = k1
+       self.b = b
+       self.size = len(texts)
+       postings: Dict[str, Dict[int, int]] = {}
+       lengths = np.zeros(self.size, dtype=np.float32)
+       for row, text in enumerate(texts):
+           terms = tokenize(text)
+           lengths[row] = len(terms)
+           for term in terms:
+               counts = postings.setdefault(term, {})
+               counts[row] = counts.get(row, 0) + 1
+       self._lengths = lengths
+       self._avg_length = float(lengths.mean()) if self.size else 0.0
+       self._postings = {
+           term: (np.fromiter(counts.keys(), dtype=np.int64, count=len(counts)),
+                  np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+           for term, counts in postings.items()
+       }
+       self._countries = np.asarray([country or "" for country in countries], dtype=object)
+       self._country_rows: Dict[str, np.ndarray] = {}
+       for country in set(self._countries):
+           self._country_rows[country] = np.flatnonzero(self._countries == country)
+
+   @classmethod
+   def from_documents(cls, documents: Iterable) -> "BM25Index":
+       texts, countries = [], []
+       for doc in documents:
+           texts.append(doc.page_content)
+           countries.append(doc.metadata.get("country"))
+       return cls(texts, countries)
+
+   def idf(self, term: str) -> float:
+       df = len(self._postings[term][0]) if term in self._postings else 0
+       return float(np.log(1 + (self.size - df + 0.5) / (df + 0.5)))
+
+   def contains(self, term: str, country: Optional[str] = None) -> bool:
+       """Whether the term occurs anywhere in the (country's) corpus"""
+       if term not in self._postings:
+           return False
+       if not country:
+           return True
+       return bool((self._countries[self._postings[term][0]] == country).any())
+
+   def is_exact_term_query(self, query: str, country: Optional[str] = None, max_other_terms: int = 1) -> bool:
+       """True for queries that are essentially identifiers found in the corpus ('APR-1400 status', 'KINS')"""
+       identifiers = set(identifier_terms(query))
+       if not identifiers or not all(self.contains(term, country) for term in identifiers):
+           return False
+       covered = set(tokenize(" ".join(token for token in _TOKEN_RE.findall(query)
+                                       if token.lower().replace("-", "") in identifiers)))
+       others = {term for term in tokenize(query) if term not in covered}
+       return len(others) <= max_other_terms
+
+   def _scores(self, query: str) -> np.ndarray:
+       scores = np.zeros(self.size, dtype=np.float32)
+       for term in set(tokenize(query)):
+           if term not in self._postings:
+               continue
+           rows, tf = self._postings[term]
+           norm = self.k1 * (1 - self.b + self.b * self._lengths[rows] / (self._avg_length or 1.0))
+           scores[rows] += self.idf(term) * tf * (self.k1 + 1) / (tf + norm)
+       return scores
+
+   def score_rows(self, queries: Sequence[str], rows: Sequence[int]) -> np.ndarray:
+       """BM25 score of every query against the given rows, shape (queries, rows)"""
+       rows = np.asarray(rows, dtype=np.int64)
+       return np.vstack([self._scores(query)[rows] for query in queries]) if len(queries) else np.empty((0, len(rows)))
+
+   def search(self, query: str, country: Optional[str] = None, k: int = 20) -> List[Tuple[int, float]]:
+       """Top-k (row, score) pairs, restricted to one country when given"""
+       scores = self._scores(query)
+       candidates = self._country_rows.get(country, np.empty(0, dtype=np.int64)) if country else np.arange(self.size)
+       candidates = candidates[scores[candidates] > 0]
+       if not len(candidates):
+           return []
+       top = candidates[np.argsort(-scores[candidates], kind="stable")[:k]]
+       return [(int(row), float(scores[row])) for row in top]
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+   """Fuse ranked row lists; higher fused score is better"""
+   fused: Dict[int, float] = {}
+   for ranking in rankings:
+       for rank, row in enumerate(ranking):
+           fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank + 1)
+   return sorted(fused.items(), key=lambda item: item[1], reverse=True)
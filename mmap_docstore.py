@@ -0,0 +1,201 @@
+"""Memory-mapped document store for the FAISS index, replacing the pickled index.pkl
+
+Chunk text and metadata live in docstore.bin as back-to-back JSON records,
+with their byte offsets in docstore_offsets.npy. Both files and the FAISS
+vectors are memory-mapped, so opening the index costs the same regardless
+of corpus size, worker processes share pages through the OS page cache,
+and only the documents a search actually returns are decoded.
+
+The two files are replaced one after the other, so each write stamps a
+random token at the head of docstore.bin and after the last offset; a
+crash between the replaces leaves tokens that disagree, and loading
+refuses the pair instead of decoding records at the wrong offsets.
+
+Migrate an existing pickled docstore once with:
+   python mmap_docstore.py faiss_index
+"""
+import json
+import mmap
+import os
+from typing import Iterator, Optional, Sequence, Union
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+
+DOCSTORE_DATA = "docstore.bin"
+DOCSTORE_OFFSETS = "docstore_offsets.npy"
+INDEX_NAME = "index.faiss"
+LEGACY_PICKLE = "index.pkl"
+TOKEN_BYTES = 8
+
+
+class MmapDocstore(Docstore):
+   """Read-only docstore addressed by FAISS row number"""
+
+   def __init__(self, index_dir: str):
+       offsets = np.load(os.path.join(index_dir, DOCSTORE_OFFSETS), mmap_mode="r")
+       with open(os.path.join(index_dir, DOCSTORE_DATA), "rb") as f:
+           size = os.fstat(f.fileno()).st_size
+           # mmap keeps its own reference to the file, so closing it here is safe
+           self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+       # offsets ends with [data size, token]; docstore.bin starts with the same token
+       if (len(offsets) < 2 or size < TOKEN_BYTES or int(offsets[-2]) != size
+               or int(offsets[-1]) != _token(self._data[:TOKEN_BYTES])):
+           raise ValueError(
+               f"{DOCSTORE_DATA} and {DOCSTORE_OFFSETS} in {index_dir} are from different writes; rebuild the index"
+           )
+       self._offsets = offsets[:-1]
+
+   def __len__(self) -> int:
+       return len(self._offsets) - 1
+
+   def get(self, row: int) -> Document:
+       """Decode a single record"""
+       record = json.loads(self._data[int(self._offsets[row]):int(self._offsets[row + 1])])
+       return Document(id=record["id"], page_content=record["page_content"], metadata=record["metadata"])
+
+   def search(self, search: str) -> Union[str, Document]:
+       try:
+           row = int(search)
+       except ValueError:
+           return f"ID {search} not found."
+       if not 0 <= row < len(self):
+           return f"ID {search} not found."
+       return self.get(row)
+
+   def __iter__(self) -> Iterator[Document]:
+       for row in range(len(self)):
+           yield self.get(row)
+
+
+class RowIds:
+   """index_to_docstore_id mapping for MmapDocstore, without materialising a dict"""
+
+   def __init__(self, size: int):
+       self._size = size
+
+   def __getitem__(self, row: int) -> str:
+       if not 0 <= row < self._size:
+           raise KeyError(row)
+       return str(int(row))
+
+   def __len__(self) -> int:
+       return self._size
+
+   def keys(self):
+       return range(self._size)
+
+   def values(self):
+       return (str(row) for row in range(self._size))
+
+   def items(self):
+       return ((row, str(row)) for row in range(self._size))
+
+
+def _token(data: bytes) -> int:
+   return int(np.frombuffer(data, dtype="<i8")[0])
+
+
+def docstore_token(index_dir: str) -> Optional[int]:
+   """The token stamped by the last write_docstore, for files that must match it; None without a docstore"""
+   try:
+       with open(os.path.join(index_dir, DOCSTORE_DATA), "rb") as f:
+           head = f.read(TOKEN_BYTES)
+   except OSError:
+       return None
+   return _token(head) if len(head) == TOKEN_BYTES else None
+
+
+def replace_atomically(path: str, write):
+   """Write to a temp file and rename, so processes mapping the old file keep a valid view"""
+   tmp_path = f"{path}.tmp"
+   write(tmp_path)
+   os.replace(tmp_path, path)
+
+
+def write_docstore(index_dir: str, documents: Sequence[Document]):
+   """Write documents, in FAISS row order, as a memory-mappable docstore"""
+   token = os.urandom(TOKEN_BYTES)
+   offsets = [TOKEN_BYTES]
+
+   def write_data(path: str):
+       with open(path, "wb") as f:
+           f.write(token)
+           for doc in documents:
+               record = json.dumps(
+                   {"id": doc.id, "page_content": doc.page_content, "metadata": doc.metadata},
+                   ensure_ascii=False,
+               ).encode("utf-8")
+               f.write(record)
+               offsets.append(offsets[-1] + len(record))
+
+   def write_offsets(path: str):
+       with open(path, "wb") as f:
+           np.save(f, np.asarray(offsets + [_token(token)], dtype=np.int64))
+
+   replace_atomically(os.path.join(index_dir, DOCSTORE_DATA), write_data)
+   replace_atomically(os.path.join(index_dir, DOCSTORE_OFFSETS), write_offsets)
+
+
+def write_faiss_index(index_dir: str, index: faiss.Index):
+   replace_atomically(os.path.join(index_dir, INDEX_NAME), lambda path: faiss.write_index(index, path))
+
+
+def read_faiss_index(path: str) -> faiss.Index:
+   """Memory-map the index where the index type supports it"""
+   try:
+       return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+   except RuntimeError:
+       return faiss.read_index(path)
+
+
+def load_vectorstore(index_dir: str, embeddings: Embeddings) -> FAISS:
+   """Open a FAISS store over the memory-mapped docstore (no pickle involved)"""
+   if not os.path.exists(os.path.join(index_dir, DOCSTORE_DATA)):
+       hint = ""
+       if os.path.exists(os.path.join(index_dir, LEGACY_PICKLE)):
+           hint = f"; migrate the pickled docstore with `python mmap_docstore.py {index_dir}`"
+       raise FileNotFoundError(f"No {DOCSTORE_DATA} in {index_dir}{hint}")
+   index = read_faiss_index(os.path.join(index_dir, INDEX_NAME))
+   docstore = MmapDocstore(index_dir)
+   if index.ntotal != len(docstore):
+       raise ValueError(f"{INDEX_NAME} has {index.ntotal} vectors but the docstore has {len(docstore)} documents")
+   return FAISS(embeddings, index, docstore, RowIds(len(docstore)))
+
+
+def migrate_pickle_docstore(index_dir: str) -> int:
+   """Convert a trusted legacy index.pkl into the memory-mapped format; returns document count"""
+   import pickle
+   from country_partitions import CountryPartitions
+
+   # The legacy file is produced by FAISS.save_local and read exactly once here
+   with open(os.path.join(index_dir, LEGACY_PICKLE), "rb") as f:
+       docstore, index_to_docstore_id = pickle.load(f)
+   documents = []
+   for row in range(len(index_to_docstore_id)):
+       doc_id = index_to_docstore_id[row]
+       doc = docstore.search(doc_id)
+       documents.append(Document(id=doc.id or doc_id, page_content=doc.page_content, metadata=doc.metadata))
+   write_docstore(index_dir, documents)
+
+   index_path = os.path.join(index_dir, INDEX_NAME)
+   if os.path.exists(index_path):
+       index = faiss.read_index(index_path)
+       CountryPartitions.build(
+           index.reconstruct_n(0, index.ntotal),
+           [doc.metadata.get("country") for doc in documents],
+           index.metric_type,
+       ).save(index_dir)
+   return len(documents)
+
+
+if __name__ == "__main__":
+   import sys
+   target = sys.argv[1] if len(sys.argv) > 1 else "faiss_index"
+   count = migrate_pickle_docstore(target)
+   print(f"Migrated {count} documents to {os.path.join(target, DOCSTORE_DATA)}")
@@ -0,0 +1,119 @@
+"""Deterministic local stand-ins for the OpenAI models, for offline builds and tests"""
+import asyncio
+import hashlib
+import re
+import time
+from typing import AsyncIterator, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+
+class HashingEmbeddings(Embeddings):
+   """Feature-hashed bag of words and bigrams, L2-normalised
+
+   Texts that share vocabulary land close together, so retrieval behaves
+   plausibly without any model download or network access. latency_seconds
+   simulates the round trip of an embedding API request.
+   """
+
+   def __init__(self, size: int = 384, latency_seconds: float = 0.0):
+       self.size = size
+       self.latency_seconds = latency_seconds
+       self.model = f"hashing-{size}"
+
+   def _embed(self, text: str) -> List[float]:
+       tokens = _TOKEN_RE.findall(text.lower())
+       features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+       vector = np.zeros(self.size, dtype=np.float32)
+       for feature in features:
+           digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+           bucket = int.from_bytes(digest[:4], "little") % self.size
+           vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+       norm = np.linalg.norm(vector)
+       if norm:
+           vector /= norm
+       return vector.tolist()
+
+   def embed_documents(self, texts: List[str]) -> List[List[float]]:
+       if self.latency_seconds:
+           time.sleep(self.latency_seconds)
+       return [self._embed(text) for text in texts]
+
+   def embed_query(self, text: str) -> List[float]:
+       return self.embed_documents([text])[0]
+
+   async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+       if self.latency_seconds:
+           await asyncio.sleep(self.latency_seconds)
+       return [self._embed(text) for text in texts]
+
+
+class FakeChatModel(BaseChatModel):
+   """Chat model that streams a deterministic reply with API-like latency, for load tests
+
+   The reply echoes words from the prompt. The first token arrives after
+   first_token_seconds, plus prompt_token_seconds per prompt token (~4
+   characters) for prompt processing, and each further token after
+   token_seconds.
+   """
+
+   first_token_seconds: float = 0.0
+   prompt_token_seconds: float = 0.0
+   token_seconds: float = 0.0
+   reply_tokens: int = 200
+   model_name: str = "fake-chat"
+
+   @property
+   def _llm_type(self) -> str:
+       return "fake-chat"
+
+   def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+       prompt = " ".join(str(message.content) for message in messages)
+       words = _TOKEN_RE.findall(prompt.lower()) or ["ok"]
+       start = int.from_bytes(hashlib.blake2b(prompt.encode(), digest_size=4).digest(), "little")
+       return [words[(start + i) % len(words)] + " " for i in range(self.reply_tokens)]
+
+   def _first_token_delay(self, messages: List[BaseMessage]) -> float:
+       prompt_chars = sum(len(str(message.content)) for message in messages)
+       return self.first_token_seconds + self.prompt_token_seconds * (prompt_chars // 4)
+
+   def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                 run_manager=None, **kwargs) -> ChatResult:
+       tokens = self._tokens(messages)
+       time.sleep(self._first_token_delay(messages) + self.token_seconds * (len(tokens) - 1))
+       return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+   def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+               run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+       time.sleep(self._first_token_delay(messages))
+       for i, token in enumerate(self._tokens(messages)):
+           if i:
+               time.sleep(self.token_seconds)
+           yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+   async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                      run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+       await asyncio.sleep(self._first_token_delay(messages))
+       for i, token in enumerate(self._tokens(messages)):
+           if i:
+               await asyncio.sleep(self.token_seconds)
+           yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+def get_embeddings(name: str) -> Embeddings:
+   """Embedding model by CLI name: 'openai' or 'openai:<model>' for the API, 'hashing' for offline"""
+   if name == "hashing" or name.startswith("hashing:"):
+       _, _, size = name.partition(":")
+       return HashingEmbeddings(int(size) if size else 384)
+   if name == "openai" or name.startswith("openai:"):
+       from langchain_openai import OpenAIEmbeddings
+       _, _, model = name.partition(":")
+       return OpenAIEmbeddings(model=model) if model else OpenAIEmbeddings()
+   raise ValueError(f"Unknown embedder '{name}' (expected 'openai[:model]' or 'hashing[:size]')")
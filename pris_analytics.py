@@ -0,0 +1,229 @@
+"""Vectorized fleet analytics over the typed PRIS table
+
+Capacity added per grid-connection year, cumulative operational capacity,
+type mix, fleet age and units under construction, per country and reactor
+type filter. Results are memoized by filter key. Cross-country comparisons
+come from one groupby over all countries.
+
+PRIS.csv has no shutdown dates, so cumulative operational capacity is the
+running total of today's operating units by the year they were connected.
+"""
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+CAPACITY_COLUMN = 'Gross Electrical Capacity [MW]'
+AGE_BINS = [0, 10, 20, 30, 40, 50, np.inf]
+AGE_LABELS = ["<10", "10-19", "20-29", "30-39", "40-49", "50+"]
+# Years shown individually in the prompt; earlier additions are summed per decade
+RECENT_YEARS = 10
+# Memoized results kept per instance, by filter key
+MEMO_SIZES = {"profile": 512, "compare": 64, "ranks": 64}
+
+
+def _types_key(types: Optional[Iterable[str]]) -> Tuple[str, ...]:
+   return tuple(sorted(set(types))) if types else ()
+
+
+def _units(n: int) -> str:
+   return f"{n} unit{'' if n == 1 else 's'}"
+
+
+@dataclass(frozen=True)
+class FleetProfile:
+   country: str
+   types: Tuple[str, ...]
+   as_of_year: int
+   units: int
+   operational_units: int
+   operational_capacity: int
+   capacity_added_by_year: Dict[int, int] = field(default_factory=dict)
+   cumulative_operational_capacity: Dict[int, int] = field(default_factory=dict)
+   type_mix: Dict[str, Tuple[int, int]] = field(default_factory=dict)  # type -> (operational units, MW)
+   age_distribution: Dict[str, int] = field(default_factory=dict)  # operational units by age band
+   mean_age: Optional[float] = None
+   under_construction_units: int = 0
+   under_construction_capacity: int = 0
+   under_construction_types: Dict[str, int] = field(default_factory=dict)
+
+   def to_dict(self) -> Dict:
+       return asdict(self)
+
+   def to_prompt(self) -> str:
+       """Compact text for the LLM prompt: decade totals, recent years, one line per metric"""
+       lines = [f"Fleet analytics ({self.country}{', types: ' + ', '.join(self.types) if self.types else ''}):"]
+       if self.capacity_added_by_year:
+           first_recent = self.as_of_year - RECENT_YEARS + 1
+           decades: Dict[str, int] = OrderedDict()
+           recent = []
+           for year, mw in self.capacity_added_by_year.items():
+               if year >= first_recent:
+                   recent.append(f"{year} {mw:,}")
+                   continue
+               decade = year // 10 * 10
+               # A decade cut short by the recent years is labelled with its range, e.g. 2010-16
+               label = f"{decade}s" if decade + 10 <= first_recent else f"{decade}-{(first_recent - 1) % 100:02d}"
+               decades[label] = decades.get(label, 0) + mw
+           added = [f"{label} {mw:,}" for label, mw in decades.items()] + recent
+           lines.append(f"- Capacity connected (MW): {'; '.join(added)}")
+       if self.cumulative_operational_capacity:
+           points = {}
+           for year, mw in self.cumulative_operational_capacity.items():
+               points[min(year // 10 * 10 + 9, max(self.cumulative_operational_capacity))] = mw
+           lines.append("- Cumulative capacity of operating units by connection year (MW): "
+                        + "; ".join(f"{year} {mw:,}" for year, mw in points.items()))
+       if self.type_mix:
+           lines.append("- Operating type mix: " + "; ".join(
+               f"{t} {_units(units)}/{mw:,} MW ({mw / max(self.operational_capacity, 1):.0%})"
+               for t, (units, mw) in self.type_mix.items()
+           ))
+       if self.operational_units:
+           ages = " ".join(f"{band}y:{n}" for band, n in self.age_distribution.items() if n)
+           lines.append(f"- Operating fleet age: {ages}; mean {self.mean_age:.1f} years")
+       if self.under_construction_units:
+           types = ", ".join(f"{t} {n}" for t, n in self.under_construction_types.items())
+           lines.append(f"- Under construction: {_units(self.under_construction_units)}, "
+                        f"{self.under_construction_capacity:,} MW ({types})")
+       else:
+           lines.append("- Under construction: none")
+       return "\n".join(lines)
+
+
+class PrisAnalytics:
+   """Fleet statistics per country and reactor-type filter, memoized by filter key"""
+
+   def __init__(self, df: pd.DataFrame, as_of_year: Optional[int] = None):
+       # Ages are in whole years so prompts, and the response cache keys built from them, change yearly
+       self.as_of_year = as_of_year or pd.Timestamp.today().year
+       status = df['Status']
+       year = df['First Grid Connection'].dt.year
+       capacity = df[CAPACITY_COLUMN].fillna(0).astype('int64')
+       operational = status.eq('Operational').to_numpy()
+       construction = status.eq('Under Construction').to_numpy()
+       self.df = pd.DataFrame({
+           'Country': df['Country'],
+           'Type': df['Type'],
+           'year': year.astype('Int32'),
+           'capacity': capacity,
+           'operational': operational,
+           'construction': construction,
+           'op_capacity': np.where(operational, capacity, 0),
+           'construction_capacity': np.where(construction, capacity, 0),
+           'op_age': (self.as_of_year - year).where(operational),
+       })
+       # Plain arrays for per-profile work, where pandas overhead would dwarf a few dozen rows
+       self._country = df['Country'].astype(object).to_numpy()
+       self._type = df['Type'].astype(object).fillna('').to_numpy()
+       self._year = year.fillna(-1).to_numpy(dtype=np.int64)
+       self._capacity = capacity.to_numpy()
+       self._operational = operational
+       self._construction = construction
+       # Per-instance LRU memos: a shared functools cache would keep every instance alive
+       self._memo: Dict[str, "OrderedDict[Tuple, Any]"] = {name: OrderedDict() for name in MEMO_SIZES}
+       # Shared by every Streamlit session through st.cache_resource
+       self._memo_lock = threading.Lock()
+
+   def _memoized(self, name: str, key: Tuple, build: Callable[..., Any]) -> Any:
+       memo = self._memo[name]
+       with self._memo_lock:
+           if key in memo:
+               memo.move_to_end(key)
+               return memo[key]
+       # Built outside the lock: builds nest (ranks -> comparison), and two sessions building one key is harmless
+       value = build(*key)
+       with self._memo_lock:
+           memo[key] = value
+           memo.move_to_end(key)
+           while len(memo) > MEMO_SIZES[name]:
+               memo.popitem(last=False)
+       return value
+
+   def _mask(self, country: Optional[str], types: Tuple[str, ...]) -> np.ndarray:
+       mask = np.ones(len(self._country), dtype=bool)
+       if country:
+           mask &= self._country == country
+       if types:
+           mask &= np.isin(self._type, types)
+       return mask
+
+   def profile(self, country: str, types: Optional[Iterable[str]] = None) -> FleetProfile:
+       return self._memoized("profile", (country, _types_key(types)), self._build_profile)
+
+   def _build_profile(self, country: str, types: Tuple[str, ...]) -> FleetProfile:
+       mask = self._mask(country, types)
+       operating = mask & self._operational
+       building = mask & self._construction
+       connected = mask & (self._year >= 0)
+       capacity = self._capacity
+
+       years, year_rows = np.unique(self._year[connected], return_inverse=True)
+       added = np.bincount(year_rows, weights=capacity[connected], minlength=len(years)).astype(np.int64)
+       op_years, op_rows = np.unique(self._year[operating & connected], return_inverse=True)
+       cumulative = np.cumsum(np.bincount(op_rows, weights=capacity[operating & connected],
+                                          minlength=len(op_years))).astype(np.int64)
+
+       mix_types, mix_rows = np.unique(self._type[operating], return_inverse=True)
+       mix_units = np.bincount(mix_rows, minlength=len(mix_types))
+       mix_capacity = np.bincount(mix_rows, weights=capacity[operating], minlength=len(mix_types)).astype(np.int64)
+       order = np.argsort(-mix_capacity, kind='stable')
+
+       ages = self.as_of_year - self._year[operating & connected]
+       age_counts, _ = np.histogram(ages, bins=AGE_BINS)
+
+       uc_types, uc_counts = np.unique(self._type[building], return_counts=True)
+       uc_order = np.argsort(-uc_counts, kind='stable')
+
+       return FleetProfile(
+           country=country,
+           types=types,
+           as_of_year=self.as_of_year,
+           units=int(mask.sum()),
+           operational_units=int(operating.sum()),
+           operational_capacity=int(capacity[operating].sum()),
+           capacity_added_by_year={int(y): int(mw) for y, mw in zip(years, added) if mw},
+           cumulative_operational_capacity={int(y): int(mw) for y, mw in zip(op_years, cumulative)},
+           type_mix={str(mix_types[i]): (int(mix_units[i]), int(mix_capacity[i])) for i in order},
+           age_distribution={band: int(n) for band, n in zip(AGE_LABELS, age_counts)},
+           mean_age=float(ages.mean()) if len(ages) else None,
+           under_construction_units=int(building.sum()),
+           under_construction_capacity=int(capacity[building].sum()),
+           under_construction_types={str(uc_types[i]): int(uc_counts[i]) for i in uc_order},
+       )
+
+   def compare(self, countries: Optional[Iterable[str]] = None,
+               types: Optional[Iterable[str]] = None) -> pd.DataFrame:
+       """One row per country, largest operating capacity first; a copy, so callers may modify it"""
+       return self._comparison(tuple(countries) if countries else (), _types_key(types)).copy()
+
+   def _comparison(self, countries: Tuple[str, ...], types: Tuple[str, ...]) -> pd.DataFrame:
+       return self._memoized("compare", (countries, types), self._build_comparison)
+
+   def _build_comparison(self, countries: Tuple[str, ...], types: Tuple[str, ...]) -> pd.DataFrame:
+       frame = self.df[self._mask(None, types)]
+       if countries:
+           frame = frame[frame['Country'].isin(countries)]
+       table = frame.groupby('Country', observed=True).agg(
+           units=('capacity', 'size'),
+           operational_units=('operational', 'sum'),
+           operational_capacity=('op_capacity', 'sum'),
+           under_construction_units=('construction', 'sum'),
+           under_construction_capacity=('construction_capacity', 'sum'),
+           mean_age=('op_age', 'mean'),
+           first_connection=('year', 'min'),
+           latest_connection=('year', 'max'),
+       )
+       return table.sort_values('operational_capacity', ascending=False, kind='stable')
+
+   def rank(self, country: str, types: Optional[Iterable[str]] = None) -> Optional[Tuple[int, int]]:
+       """(position, countries with operating units) by operating capacity, or None"""
+       return self._memoized("ranks", (_types_key(types),), self._build_ranks).get(country)
+
+   def _build_ranks(self, types: Tuple[str, ...]) -> Dict[str, Tuple[int, int]]:
+       table = self._comparison((), types)
+       operating = table.index[table['operational_units'] > 0]
+       return {str(country): (position, len(operating)) for position, country in enumerate(operating, 1)}
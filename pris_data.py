@@ -0,0 +1,108 @@
+"""Typed loading of the PRIS reactor table with an optional Parquet sidecar cache"""
+import hashlib
+import os
+from typing import Dict, Optional
+
+import pandas as pd
+
+
+# Bump when the schema or cleaning rules change so stale sidecars are ignored
+SCHEMA_VERSION = "1"
+
+CATEGORICAL_COLUMNS = ['Country', 'Type', 'Status', 'Location']
+CAPACITY_COLUMNS = ['Reference Unit Power [MW]', 'Gross Electrical Capacity [MW]']
+DATE_COLUMNS = ['First Grid Connection']
+PRIS_COLUMNS = ['Country', 'Name', 'Type', 'Status', 'Location'] + CAPACITY_COLUMNS + DATE_COLUMNS
+
+# PRIS short names -> names used by the CNPP profiles and the app's country selector
+COUNTRY_ALIASES: Dict[str, str] = {
+   "Korea": "Korea, Republic of",
+   "United States": "United States of America",
+}
+
+
+def _csv_fingerprint(csv_path: str) -> str:
+   """Content hash of the CSV combined with the schema version"""
+   digest = hashlib.sha256(SCHEMA_VERSION.encode())
+   with open(csv_path, "rb") as f:
+       for block in iter(lambda: f.read(1 << 20), b""):
+           digest.update(block)
+   return digest.hexdigest()
+
+
+def _repair_shifted_rows(raw: pd.DataFrame) -> pd.DataFrame:
+   """Re-align rows whose unquoted Location contains a comma (e.g. 'ONAGAWA, ISHINOMAKI')"""
+   extra = [c for c in raw.columns if c not in PRIS_COLUMNS]
+   if not extra:
+       return raw
+   spill = raw[extra[0]]
+   shifted = spill.notna() & spill.str.strip().ne("")
+   if shifted.any():
+       tail = ['Location'] + CAPACITY_COLUMNS + DATE_COLUMNS
+       rows = raw.loc[shifted, tail + [extra[0]]]
+       raw.loc[shifted, 'Location'] = rows['Location'] + "," + rows[CAPACITY_COLUMNS[0]]
+       raw.loc[shifted, CAPACITY_COLUMNS + DATE_COLUMNS] = rows[CAPACITY_COLUMNS[1:] + DATE_COLUMNS + [extra[0]]].to_numpy()
+   return raw.drop(columns=extra)
+
+
+def parse_pris_csv(csv_path: str) -> pd.DataFrame:
+   """Read PRIS.csv and apply the declared schema"""
+   raw = pd.read_csv(csv_path, dtype=str, keep_default_na=True)
+   raw = _repair_shifted_rows(raw)
+   # Drop trailing junk rows (e.g. a stray markdown fence) that carry no unit name
+   raw = raw[raw['Name'].notna()].reset_index(drop=True)
+
+   df = pd.DataFrame(index=raw.index)
+   df['Country'] = raw['Country'].str.strip().replace(COUNTRY_ALIASES)
+   df['Name'] = raw['Name'].str.strip()
+   for col in CATEGORICAL_COLUMNS:
+       values = df[col] if col in df else raw[col].str.strip()
+       df[col] = values.astype('category')
+   for col in CAPACITY_COLUMNS:
+       df[col] = pd.to_numeric(raw[col], errors='coerce').round().astype('Int32')
+   for col in DATE_COLUMNS:
+       df[col] = pd.to_datetime(raw[col], format='%Y-%m-%d', errors='coerce')
+   return df[PRIS_COLUMNS]
+
+
+def load_pris(csv_path: str, cache_path: Optional[str] = None, use_cache: bool = True) -> pd.DataFrame:
+   """Load the typed PRIS table, reusing a Parquet sidecar while the CSV is unchanged"""
+   if not use_cache:
+       return parse_pris_csv(csv_path)
+
+   try:
+       import pyarrow as pa
+       import pyarrow.parquet as pq
+   except ImportError:
+       return parse_pris_csv(csv_path)
+
+   cache_path = cache_path or f"{csv_path}.parquet"
+   fingerprint = _csv_fingerprint(csv_path)
+   if os.path.exists(cache_path):
+       try:
+           metadata = pq.read_schema(cache_path).metadata or {}
+           if metadata.get(b"pris_fingerprint", b"").decode() == fingerprint:
+               return pd.read_parquet(cache_path)
+       except (OSError, ValueError, pa.ArrowException):
+           pass  # unreadable sidecar, rebuild it below
+
+   df = parse_pris_csv(csv_path)
+   table = pa.Table.from_pandas(df, preserve_index=False)
+   metadata = dict(table.schema.metadata or {})
+   metadata[b"pris_fingerprint"] = fingerprint.encode()
+   try:
+       pq.write_table(table.replace_schema_metadata(metadata), cache_path)
+   except OSError:
+       pass  # read-only deployments simply skip the sidecar
+   return df
+
+
+if __name__ == "__main__":
+   import sys
+   path = sys.argv[1] if len(sys.argv) > 1 else "PRIS.csv"
+   untyped = pd.read_csv(path)
+   typed = parse_pris_csv(path)
+   print(typed.dtypes.to_string())
+   print(f"\nrows: {len(untyped)} raw -> {len(typed)} typed")
+   print(f"memory: {untyped.memory_usage(deep=True).sum() / 1024:.1f} KiB raw -> "
+         f"{typed.memory_usage(deep=True).sum() / 1024:.1f} KiB typed")
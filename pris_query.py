@@ -0,0 +1,246 @@
+"""Answers for structured chat questions straight from the PRIS table
+
+Questions that only count units or sum capacity by country, status and
+reactor type ("how many units are under construction in China", "total
+operational capacity in Canada") are answered from a (country, status,
+type) index with a templated reply, without embedding, search or the chat
+model. Anything asking for reasons, plans or judgement, naming something
+the table does not know (a plant, a company), or narrowing the question in
+a way the index can't (a year or date range, a negation, a status it has
+no mapping for) is left to the RAG chain.
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+
+CAPACITY_COLUMN = 'Gross Electrical Capacity [MW]'
+
+_COUNT_RE = re.compile(r"\b(how many|number of|count of|total (?:number|count))\b", re.IGNORECASE)
+_CAPACITY_RE = re.compile(r"\b(capacity|megawatts?|gigawatts?|mw|gw|how much (?:nuclear )?power)\b", re.IGNORECASE)
+_UNIT_RE = re.compile(r"\b(units?|reactors?|(?:power |nuclear )?plants?|stations?)\b", re.IGNORECASE)
+# Reasons, plans, judgement, rankings, dates and energy generated need the documents (or a table we don't index)
+_RAG_RE = re.compile(
+   r"\b(why|how (?:is|are|does|do|has|have|will|can|should)|policy|policies|plan|plans|planned|planning|"
+   r"strateg\w*|future|expect\w*|goals?|targets?|roadmap|impact\w*|affect\w*|role|challenges?|safety|"
+   r"regulat\w*|explain|describe|history|compar\w*|versus|vs|trends?|programs?|programmes?|should|will|"
+   r"would|could|life|extension|which|most|least|largest|biggest|smallest|oldest|newest|first|last|"
+   r"when|where|who|share|percent\w*|%|cost\w*|price\w*|electricity|generat\w*|produc\w*|energy|output|"
+   r"[tgmk]wh)\b",
+   re.IGNORECASE,
+)
+# The index has no time dimension: years, date ranges and grid-connection questions need the documents
+_DATE_RE = re.compile(
+   r"\b(1[89]\d\d|2\d\d\d|\d{4}s|since|before|after|between|until|during|ago|recent\w*|connect\w*|grid|"
+   r"years?|months?|decades?|january|february|march|april|may|june|july|august|september|october|"
+   r"november|december)\b",
+   re.IGNORECASE,
+)
+# Negated statuses ("not operating", "no longer running") would otherwise count the statuses they exclude
+_NEGATION_RE = re.compile(r"\b(not|no|no longer|never|without|non|except|excluding|\w+n['’]t)\b", re.IGNORECASE)
+# Status words with no PRIS mapping here; answering "offline" with every status would be wrong
+_UNKNOWN_STATUS_RE = re.compile(
+   r"\b(offline|off-line|inactive|down|stopped|halted|paused|standby|stand-by|outages?|restart\w*|"
+   r"reactivat\w*|refuel\w*|maintenance|mothball\w*|cancel\w*|abandon\w*|proposed|licen[cs]ed|approved|"
+   r"ordered|dormant|closing|closure|idling)\b",
+   re.IGNORECASE,
+)
+_WORLD_RE = re.compile(r"\b(world|worldwide|globally|global|all countries)\b", re.IGNORECASE)
+_WORD_RE = re.compile(r"[A-Za-z][\w.\-]*")
+_POSSESSIVE_RE = re.compile(r"['’]s\b")
+
+# Phrase -> PRIS statuses, most specific first so "not operating" style overlaps resolve sensibly
+STATUS_PHRASES: List[Tuple[str, Tuple[str, ...]]] = [
+   (r"under construction|being (?:built|constructed)|in construction|construction", ("Under Construction",)),
+   (r"suspended|idled?", ("Suspended Operation",)),
+   (r"permanently shut ?down|shut ?down|closed|retired|decommission\w*",
+    ("Permanent Shutdown", "Decommissioning Completed")),
+   (r"operational|operating|in operation|online|on-line|running|in service|active", ("Operational",)),
+]
+STATUS_LABELS = {
+   "Operational": "operational",
+   "Under Construction": "under construction",
+   "Permanent Shutdown": "permanently shut down",
+   "Decommissioning Completed": "fully decommissioned",
+   "Suspended Operation": "in suspended operation",
+   "Cancelled": "cancelled",
+}
+TYPE_ALIASES = {
+   "pressurized water": "PWR", "pressurised water": "PWR", "boiling water": "BWR",
+   "heavy water": "PHWR", "candu": "PHWR", "fast breeder": "FBR", "fast reactor": "FBR",
+   "gas-cooled": "GCR", "gas cooled": "GCR", "rbmk": "LWGR",
+}
+COUNTRY_ALIASES = {
+   "south korea": "Korea, Republic of", "republic of korea": "Korea, Republic of", "korea": "Korea, Republic of",
+   "united states": "United States of America", "america": "United States of America",
+   "usa": "United States of America", "u.s.": "United States of America",
+   "russia": "Russian Federation", "britain": "United Kingdom", "great britain": "United Kingdom",
+   "england": "United Kingdom", "emirates": "United Arab Emirates", "czechia": "Czech Republic",
+   "holland": "Netherlands",
+}
+# Upper-case abbreviations that collide with ordinary words ("us") are matched case-sensitively
+COUNTRY_ABBREVIATIONS = {"US": "United States of America", "UK": "United Kingdom", "UAE": "United Arab Emirates"}
+# Words that may be capitalised in a structured question without naming anything we don't index
+_KNOWN_WORDS = {
+   "how", "what", "what's", "whats", "is", "are", "the", "total", "number", "nuclear", "reactor", "reactors",
+   "unit", "units", "capacity", "in", "of", "does", "do", "has", "have", "count", "iaea", "pris", "mw", "gw",
+}
+
+
+def _units(n: int) -> str:
+   return f"{n} unit{'' if n == 1 else 's'}"
+
+
+def _phrase_re(phrases, plural: bool = False) -> re.Pattern:
+   """Whole-phrase alternation; with plural, a trailing 's' ('PWRs') is matched outside the group"""
+   alternatives = sorted(phrases, key=len, reverse=True)
+   suffix = r"s?" if plural else ""
+   return re.compile(r"\b(" + "|".join(re.escape(p) for p in alternatives) + r")" + suffix + r"\b", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class StructuredQuery:
+   metric: str  # "count" or "capacity"
+   countries: Tuple[str, ...]  # empty for every country
+   statuses: Tuple[str, ...]  # empty for every status
+   types: Tuple[str, ...]  # empty for every type
+   status_groups: Tuple[Tuple[str, ...], ...] = ()  # statuses as asked for, one group per phrase
+
+
+class PrisQueryRouter:
+   """Parses count / capacity questions and answers them from a (country, status, type) index"""
+
+   def __init__(self, df: pd.DataFrame):
+       grouped = df.groupby(['Country', 'Status', 'Type'], observed=True)[CAPACITY_COLUMN].agg(['size', 'sum'])
+       self._index: Dict[str, List[Tuple[str, str, int, int]]] = {}
+       for (country, status, reactor_type), (units, mw) in grouped.iterrows():
+           self._index.setdefault(str(country), []).append((str(status), str(reactor_type), int(units), int(mw)))
+       self.countries = sorted(self._index)
+       self.types = sorted({t for rows in self._index.values() for _, t, _, _ in rows})
+
+       self._country_re = _phrase_re([c.lower() for c in self.countries] + list(COUNTRY_ALIASES))
+       self._country_names = {c.lower(): c for c in self.countries}
+       self._abbreviation_re = re.compile(r"\b(" + "|".join(COUNTRY_ABBREVIATIONS) + r")\b")
+       self._type_re = _phrase_re(self.types + list(TYPE_ALIASES), plural=True)
+       self._type_names = {**{t.lower(): t for t in self.types}, **TYPE_ALIASES}
+       self._status_res = [(re.compile(rf"\b({p})\b", re.IGNORECASE), statuses) for p, statuses in STATUS_PHRASES]
+       self._vocabulary = (_KNOWN_WORDS | {w.lower() for c in self.countries for w in _WORD_RE.findall(c)}
+                           | {w.lower() for a in list(COUNTRY_ALIASES) + list(TYPE_ALIASES) for w in a.split()}
+                           | {t.lower() for t in self.types} | {f"{t.lower()}s" for t in self.types}
+                           | {a.lower() for a in COUNTRY_ABBREVIATIONS}
+                           | {w.lower() for p, _ in STATUS_PHRASES for w in _WORD_RE.findall(p)})
+       self.stats = {"structured": 0, "rag": 0}
+
+   def parse(self, question: str, default_country: Optional[str] = None,
+             default_types: Optional[List[str]] = None) -> Optional[StructuredQuery]:
+       """A StructuredQuery when the table alone answers the question, else None"""
+       question = _POSSESSIVE_RE.sub("", question)
+       if _RAG_RE.search(question) or _DATE_RE.search(question) or _NEGATION_RE.search(question):
+           return None
+       if _CAPACITY_RE.search(question):
+           metric = "capacity"
+       elif _COUNT_RE.search(question) and (_UNIT_RE.search(question) or self._type_re.search(question)):
+           metric = "count"
+       else:
+           return None
+       # A capitalised word we can't place is probably a plant or company name the table can't filter by
+       words = _WORD_RE.findall(question)
+       if any(w[0].isupper() and w.lower().strip(".") not in self._vocabulary for w in words[1:]):
+           return None
+
+       countries = [self._country_names.get(m.lower()) or COUNTRY_ALIASES[m.lower()]
+                    for m in self._country_re.findall(question)]
+       countries += [COUNTRY_ABBREVIATIONS[m] for m in self._abbreviation_re.findall(question)]
+       if not countries and not _WORLD_RE.search(question):
+           if not default_country:
+               return None
+           countries = [default_country]
+
+       types = [self._type_names[m.lower()] for m in self._type_re.findall(question)] or list(default_types or [])
+
+       status_groups, remaining = [], question
+       for pattern, statuses in self._status_res:
+           if pattern.search(remaining):
+               status_groups.append(statuses)
+               remaining = pattern.sub(" ", remaining)
+       if _UNKNOWN_STATUS_RE.search(remaining):
+           return None
+       if metric == "capacity" and not status_groups:
+           # "Nuclear capacity" conventionally means what is running today
+           status_groups = [("Operational",)]
+       return StructuredQuery(
+           metric=metric,
+           countries=tuple(dict.fromkeys(countries)),
+           statuses=tuple(s for group in status_groups for s in group),
+           types=tuple(dict.fromkeys(types)),
+           status_groups=tuple(status_groups),
+       )
+
+   def lookup(self, country: Optional[str], statuses: Tuple[str, ...], types: Tuple[str, ...]
+              ) -> Tuple[int, int, Dict[str, int]]:
+       """(units, gross MW, units per type) for one country, or every country when None"""
+       rows = self._index.get(country, []) if country else [r for rs in self._index.values() for r in rs]
+       units = mw = 0
+       by_type: Dict[str, int] = {}
+       for status, reactor_type, n, capacity in rows:
+           if (statuses and status not in statuses) or (types and reactor_type not in types):
+               continue
+           units += n
+           mw += capacity
+           by_type[reactor_type] = by_type.get(reactor_type, 0) + n
+       return units, mw, dict(sorted(by_type.items(), key=lambda item: -item[1]))
+
+   def _status_breakdown(self, country: Optional[str], types: Tuple[str, ...]) -> str:
+       parts = []
+       for status, label in STATUS_LABELS.items():
+           units, mw, _ = self.lookup(country, (status,), types)
+           if units:
+               parts.append(f"{units} {label}" + (f" ({mw:,} MW)" if status in ("Operational", "Under Construction") else ""))
+       return ", ".join(parts)
+
+   def _sentence(self, query: StructuredQuery, country: Optional[str]) -> str:
+       name = f"**{country}**" if country else "**Worldwide**, PRIS"
+       has = "has" if country else "lists"
+       if query.metric == "capacity":
+           parts = []
+           for group in query.status_groups:
+               units, mw, by_type = self.lookup(country, group, query.types)
+               label = " / ".join(STATUS_LABELS[s] for s in group)
+               types = ", ".join(f"{t} {n}" for t, n in by_type.items())
+               parts.append(f"**{mw:,} MW** of {label} gross capacity across {_units(units)} ({types})" if units
+                            else f"no {label} capacity")
+           return f"{name} {has} " + "; ".join(parts) + "."
+       if not query.status_groups:
+           units, _, _ = self.lookup(country, (), query.types)
+           if not units:
+               return f"{name} {has} no matching reactor units."
+           return f"{name} {has} **{units}** reactor units: {self._status_breakdown(country, query.types)}."
+       parts = []
+       for group in query.status_groups:
+           units, mw, by_type = self.lookup(country, group, query.types)
+           label = " / ".join(STATUS_LABELS[s] for s in group)
+           detail = ", ".join(f"{t} {n}" for t, n in by_type.items())
+           parts.append(f"**{_units(units)}** {label} ({mw:,} MW; {detail})" if units else f"no units {label}")
+       return f"{name} {has} " + "; ".join(parts) + "."
+
+   def answer(self, query: StructuredQuery) -> str:
+       """Templated markdown reply, one sentence per country"""
+       countries = query.countries or (None,)
+       sentences = [self._sentence(query, country) for country in countries]
+       text = sentences[0] if len(sentences) == 1 else "\n".join(f"- {s}" for s in sentences)
+       if query.types:
+           text += f"\n\nReactor types counted: {', '.join(query.types)}."
+       return text + "\n\n_Source: IAEA PRIS reactor table._"
+
+   def route(self, question: str, default_country: Optional[str] = None,
+             default_types: Optional[List[str]] = None, follow_up: bool = False) -> Optional[str]:
+       """The templated answer for a structured question, or None to send it to the RAG chain
+
+       A follow-up ("how many are under construction there?") is answered only
+       when it names its own country; otherwise it needs the previous turn.
+       """
+       query = self.parse(question, None if follow_up else default_country, default_types)
+       self.stats["structured" if query else "rag"] += 1
+       return self.answer(query) if query else None
@@ -0,0 +1,84 @@
+"""Second-stage relevance scoring of hybrid-search candidates, with an adaptive cutoff
+
+Hybrid search over-fetches candidates for every question. All candidates
+of a request are then scored against all of its questions in one batch
+with a cheap CPU-only scorer: BM25 scaled per question, blended with
+embedding cosine when the question's vector is already cached. Each
+question keeps its best chunks down to the first large drop in score,
+instead of a fixed k, so weak chunks no longer pad the prompt.
+"""
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+Ranking = List[Tuple[int, float]]  # (index row, score), best first
+
+
+def _scale_by_max(scores: np.ndarray) -> np.ndarray:
+   """Each row divided by its maximum; rows without any positive score stay zero"""
+   top = scores.max(axis=1, keepdims=True)
+   return np.divide(scores, top, out=np.zeros_like(scores), where=top > 0)
+
+
+def _rescale(scores: np.ndarray) -> np.ndarray:
+   """Each row min-max scaled to [0, 1]; constant rows become zero"""
+   low = scores.min(axis=1, keepdims=True)
+   spread = scores.max(axis=1, keepdims=True) - low
+   return np.divide(scores - low, spread, out=np.zeros_like(scores), where=spread > 0)
+
+
+def adaptive_cutoff(scores: Sequence[float], min_keep: int = 1, max_keep: int = 5,
+                    min_gap: float = 0.1, floor: float = 0.5) -> int:
+   """How many of the best-first scores to keep
+
+   At most max_keep, never fewer than min_keep. Scores under floor x the
+   best score are dropped, and the list is cut at its largest drop between
+   neighbours when that drop is at least min_gap.
+   """
+   scores = np.asarray(scores, dtype=np.float64)[:max_keep]
+   if len(scores) <= min_keep:
+       return len(scores)
+   keep = max(min_keep, int((scores >= floor * scores[0]).sum()))
+   gaps = scores[min_keep - 1:keep - 1] - scores[min_keep:keep]
+   if len(gaps) and gaps.max() >= min_gap:
+       keep = min_keep + int(np.argmax(gaps))
+   return keep
+
+
+class RelevanceReranker:
+   """Blends BM25 and embedding cosine over a request's candidates and cuts each question's list adaptively"""
+
+   def __init__(self, lexical_weight: float = 0.6, min_keep: int = 1, min_gap: float = 0.1, floor: float = 0.5):
+       self.lexical_weight = lexical_weight
+       self.min_keep = min_keep
+       self.min_gap = min_gap
+       self.floor = floor
+
+   def score(self, lexical: np.ndarray, cosine: Optional[np.ndarray] = None) -> np.ndarray:
+       """Relevance in [0, 1], shape (queries, candidates); cosine rows of NaN mean no vector for that query"""
+       lexical = _scale_by_max(np.asarray(lexical, dtype=np.float64))
+       if cosine is None:
+           return lexical
+       cosine = np.asarray(cosine, dtype=np.float64)
+       has_vector = ~np.isnan(cosine).any(axis=1)
+       has_terms = lexical.max(axis=1) > 0
+       # A question with no vector, or no term in common with any candidate, relies on the other signal
+       weight = np.where(has_vector & has_terms, self.lexical_weight, np.where(has_vector, 0.0, 1.0))[:, None]
+       return weight * lexical + (1 - weight) * _rescale(np.nan_to_num(cosine))
+
+   def select(self, rows: Sequence[int], scores: np.ndarray, first_stage: List[Ranking], k: int) -> List[Ranking]:
+       """Each question's candidates by score, cut adaptively to at most k
+
+       rows are the candidates in first-stage order, so ties keep that order.
+       A question that no signal separates keeps its first-stage top k.
+       """
+       rankings = []
+       for query_scores, fallback in zip(scores, first_stage):
+           if not len(rows) or query_scores.max() <= 0:
+               rankings.append(fallback[:k])
+               continue
+           order = np.argsort(-query_scores, kind="stable")
+           keep = adaptive_cutoff(query_scores[order], self.min_keep, k, self.min_gap, self.floor)
+           rankings.append([(int(rows[i]), float(query_scores[i])) for i in order[:keep]])
+       return rankings
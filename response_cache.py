@@ -0,0 +1,156 @@
+"""TTL and size-bounded cache of generated responses, with an optional semantic tier for chat"""
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+
+# Acronyms and model names ("PWRs", "APR-1400"), numbers and years, and capitalised names ("Japan's")
+_ENTITY_RE = re.compile(r"\b(?:[A-Z][A-Za-z]*[A-Z][\w\-]*|[\w\-]*\d[\w\-]*|[A-Z][a-z]+)\b")
+_POSSESSIVE_RE = re.compile(r"['’]s\b")
+_PLURAL_ACRONYM_RE = re.compile(r"^([A-Z][\w\-]*[A-Z])s$")
+# Capitalised words that open or phrase a question rather than name anything
+_QUESTION_WORDS = {
+   "how", "what", "which", "why", "when", "where", "who", "whose", "does", "do", "did", "is", "are", "was", "were",
+   "can", "could", "will", "would", "should", "has", "have", "tell", "list", "give", "show", "explain",
+   "describe", "summarize", "summarise", "compare", "please", "and", "the", "a", "an", "in", "of", "for", "i",
+}
+_REACTOR_PHRASES = {
+   "pressurized water": "pwr", "pressurised water": "pwr", "boiling water": "bwr", "heavy water": "phwr",
+   "candu": "phwr", "fast breeder": "fbr", "fast reactor": "fbr", "gas-cooled": "gcr", "gas cooled": "gcr",
+   "small modular": "smr",
+}
+
+
+def question_entities(question: str) -> List[str]:
+   """Names, reactor types and numbers in a question, normalised, for scoping the semantic tier
+
+   Two questions that differ only in these ("How many PWRs does Korea run?"
+   and "How many BWRs does Korea run?") embed almost identically but must not
+   share an answer.
+   """
+   text = _POSSESSIVE_RE.sub("", question)
+   entities = set()
+   for word in _ENTITY_RE.findall(text):
+       # Plural acronyms: "PWRs" names the same thing as "PWR"
+       word = _PLURAL_ACRONYM_RE.sub(r"\1", word).lower()
+       if word not in _QUESTION_WORDS:
+           entities.add(word)
+   lowered = text.lower()
+   entities.update(code for phrase, code in _REACTOR_PHRASES.items() if phrase in lowered)
+   return sorted(entities)
+
+
+class ResponseCache:
+   """Exact-key response cache plus per-scope nearest-question lookup
+
+   Semantic entries share one LRU bound across all scopes, and a scope is
+   forgotten with its last entry, so many short-lived scopes can't grow the
+   cache without limit.
+   """
+
+   def __init__(
+       self,
+       max_entries: int = 256,
+       ttl_seconds: float = 24 * 3600,
+       semantic_threshold: Optional[float] = 0.95,
+       max_semantic_entries: int = 512,
+   ):
+       self.max_entries = max_entries
+       self.ttl_seconds = ttl_seconds
+       self.semantic_threshold = semantic_threshold
+       self.max_semantic_entries = max_semantic_entries
+       self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+       # (scope, question key) -> (expiry, unit vector, response), least recently used first
+       self._semantic: "OrderedDict[Tuple[str, str], Tuple[float, np.ndarray, str]]" = OrderedDict()
+       self._scopes: Dict[str, Set[str]] = {}
+       self._lock = threading.Lock()
+       self.stats = {"hits": 0, "semantic_hits": 0, "misses": 0}
+
+   @staticmethod
+   def make_key(*parts: Any) -> str:
+       """Stable hash of the JSON-serialisable parts that determine a response"""
+       return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+   def _evict(self, entries: OrderedDict, limit: int):
+       now = time.monotonic()
+       for key in [key for key, value in entries.items() if value[0] <= now]:
+           del entries[key]
+       while len(entries) > limit:
+           entries.popitem(last=False)
+
+   def _evict_semantic(self):
+       """Drop expired and least recently used semantic entries, and scopes left empty"""
+       now = time.monotonic()
+       for entry in [entry for entry, value in self._semantic.items() if value[0] <= now]:
+           self._forget(entry)
+       while len(self._semantic) > self.max_semantic_entries:
+           self._forget(next(iter(self._semantic)))
+
+   def _forget(self, entry: Tuple[str, str]):
+       scope, question_key = entry
+       self._semantic.pop(entry, None)
+       keys = self._scopes.get(scope)
+       if keys is not None:
+           keys.discard(question_key)
+           if not keys:
+               del self._scopes[scope]
+
+   def get(self, key: str) -> Optional[str]:
+       with self._lock:
+           entry = self._entries.get(key)
+           if entry is None or entry[0] <= time.monotonic():
+               self._entries.pop(key, None)
+               return None
+           self._entries.move_to_end(key)
+           self.stats["hits"] += 1
+           return entry[1]
+
+   def put(self, key: str, response: str):
+       with self._lock:
+           self._entries[key] = (time.monotonic() + self.ttl_seconds, response)
+           self._entries.move_to_end(key)
+           self._evict(self._entries, self.max_entries)
+
+   def get_similar(self, scope: str, vector: List[float]) -> Optional[str]:
+       """Return the cached response whose question embedding is closest above the threshold"""
+       if self.semantic_threshold is None:
+           return None
+       with self._lock:
+           self._evict_semantic()
+           keys = [(scope, key) for key in self._scopes.get(scope, ())]
+           if not keys:
+               return None
+           matrix = np.stack([self._semantic[key][1] for key in keys])
+           similarities = matrix @ _unit(vector)
+           best = int(np.argmax(similarities))
+           if similarities[best] < self.semantic_threshold:
+               return None
+           self._semantic.move_to_end(keys[best])
+           self.stats["semantic_hits"] += 1
+           return self._semantic[keys[best]][2]
+
+   def put_similar(self, scope: str, question_key: str, vector: List[float], response: str):
+       if self.semantic_threshold is None:
+           return
+       with self._lock:
+           entry = (scope, question_key)
+           self._semantic[entry] = (time.monotonic() + self.ttl_seconds, _unit(vector), response)
+           self._semantic.move_to_end(entry)
+           self._scopes.setdefault(scope, set()).add(question_key)
+           self._evict_semantic()
+
+   def record_miss(self):
+       with self._lock:
+           self.stats["misses"] += 1
+
+
+def _unit(vector: List[float]) -> np.ndarray:
+   array = np.asarray(vector, dtype=np.float32)
+   norm = np.linalg.norm(array)
+   return array / norm if norm else array
@@ -0,0 +1,144 @@
+"""Local OpenAI-compatible stub server for exercising the API without network access
+
+Serves /v1/embeddings (HashingEmbeddings vectors) and /v1/chat/completions
+(a short deterministic reply, streamed or not) with configurable latency
+and an optional share of 429 rate-limit responses:
+
+   python stub_openai.py --port 8001 --dim 1536 --first-token-seconds 0.5
+   OPENAI_BASE_URL=http://127.0.0.1:8001/v1 OPENAI_API_KEY=stub uvicorn api:app
+
+--dim must match the dimension of the FAISS index being served.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import random
+import time
+import uuid
+from typing import List
+
+import numpy as np
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from offline import HashingEmbeddings
+
+
+def _as_text(item) -> str:
+   """OpenAIEmbeddings sends tiktoken ids rather than strings; decode them back to text"""
+   if isinstance(item, str):
+       return item
+   try:
+       import tiktoken
+       return tiktoken.get_encoding("cl100k_base").decode(item)
+   except Exception:
+       return " ".join(str(token) for token in item)
+
+
+def _reply(messages: List[dict]) -> List[str]:
+   prompt = " ".join(str(m.get("content", "")) for m in messages)
+   words = prompt.split()
+   text = f"Stub response to a {len(words)}-word prompt. " + " ".join(words[-12:])
+   return [word + " " for word in text.split()]
+
+
+def create_app(dim: int = 1536, first_token_seconds: float = 0.0, token_seconds: float = 0.0,
+               embedding_seconds: float = 0.0, rate_limit_share: float = 0.0) -> Starlette:
+   embeddings = HashingEmbeddings(dim)
+   rng = random.Random(0)
+
+   async def embed(request: Request):
+       body = await request.json()
+       inputs = body["input"]
+       if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+           inputs = [inputs]
+       await asyncio.sleep(embedding_seconds)
+       data = []
+       for i, vector in enumerate(embeddings.embed_documents([_as_text(item) for item in inputs])):
+           if body.get("encoding_format") == "base64":
+               vector = base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode()
+           data.append({"object": "embedding", "index": i, "embedding": vector})
+       return JSONResponse({
+           "object": "list",
+           "data": data,
+           "model": body.get("model", "stub"),
+           "usage": {"prompt_tokens": 0, "total_tokens": 0},
+       })
+
+   async def chat(request: Request):
+       body = await request.json()
+       if rng.random() < rate_limit_share:
+           return JSONResponse(
+               {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+               status_code=429, headers={"retry-after": "0.2"},
+           )
+       model = body.get("model", "stub")
+       tokens = _reply(body.get("messages", []))
+       completion_id, created = f"chatcmpl-{uuid.uuid4().hex}", int(time.time())
+
+       if not body.get("stream"):
+           await asyncio.sleep(first_token_seconds + token_seconds * len(tokens))
+           return JSONResponse({
+               "id": completion_id,
+               "object": "chat.completion",
+               "created": created,
+               "model": model,
+               "choices": [{
+                   "index": 0,
+                   "message": {"role": "assistant", "content": "".join(tokens)},
+                   "finish_reason": "stop",
+               }],
+               "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+           })
+
+       def event(delta: dict, finish_reason=None) -> str:
+           chunk = {
+               "id": completion_id,
+               "object": "chat.completion.chunk",
+               "created": created,
+               "model": model,
+               "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+           }
+           return f"data: {json.dumps(chunk)}\n\n"
+
+       async def stream():
+           await asyncio.sleep(first_token_seconds)
+           yield event({"role": "assistant", "content": ""})
+           for token in tokens:
+               yield event({"content": token})
+               await asyncio.sleep(token_seconds)
+           yield event({}, "stop")
+           yield "data: [DONE]\n\n"
+
+       return StreamingResponse(stream(), media_type="text/event-stream")
+
+   return Starlette(routes=[
+       Route("/v1/embeddings", embed, methods=["POST"]),
+       Route("/v1/chat/completions", chat, methods=["POST"]),
+   ])
+
+
+def main():
+   parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+   parser.add_argument("--host", default="127.0.0.1")
+   parser.add_argument("--port", type=int, default=8001)
+   parser.add_argument("--dim", type=int, default=1536)
+   parser.add_argument("--first-token-seconds", type=float, default=0.0)
+   parser.add_argument("--token-seconds", type=float, default=0.0)
+   parser.add_argument("--embedding-seconds", type=float, default=0.0)
+   parser.add_argument("--rate-limit-share", type=float, default=0.0, help="share of chat requests answered with 429")
+   args = parser.parse_args()
+
+   import uvicorn
+   uvicorn.run(
+       create_app(args.dim, args.first_token_seconds, args.token_seconds, args.embedding_seconds,
+                  args.rate_limit_share),
+       host=args.host, port=args.port, log_level="warning",
+   )
+
+
+if __name__ == "__main__":
+   main()
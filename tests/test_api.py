@@ -0,0 +1,266 @@
+"""HTTP API tests against the local OpenAI stub server (stub_openai.py) and offline embeddings (offline.py)
+
+The engine talks to a real stub server over HTTP, so the OpenAI clients,
+streaming and rate-limit handling are exercised without network access.
+"""
+import asyncio
+import os
+import socket
+import threading
+import time
+
+import pytest
+import uvicorn
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from starlette.testclient import TestClient
+
+import stub_openai
+from api import ConcurrencyLimiter, SlotStreamingResponse, create_app
+from embedding_cache import CachedEmbeddings
+from final_app import PRIS_CSV_PATH, DataAnalyzer, RAGQueryEngine
+from ingest import text_key, write_index
+from offline import HashingEmbeddings
+from response_cache import ResponseCache
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIM = 64
+CHUNKS = [
+   ("Korea, Republic of", "The APR-1400 is an evolutionary pressurized water reactor developed in Korea."),
+   ("Korea, Republic of", "KINS carries out regulatory reviews and inspections for the Nuclear Safety Commission."),
+   ("Korea, Republic of", "Korea plans to manage spent fuel in interim storage before a permanent repository."),
+   ("Canada", "Ontario is refurbishing its CANDU units at Darlington and Bruce to extend their lives."),
+   ("Canada", "The CNSC licenses SMR designs such as the BWRX-300 at Darlington."),
+]
+
+
+def _free_port() -> int:
+   with socket.socket() as sock:
+       sock.bind(("127.0.0.1", 0))
+       return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def stub_server():
+   """Start a stub server in a thread; yields a factory of base URLs by rate-limit share"""
+   servers = []
+
+   def start(rate_limit_share: float = 0.0) -> str:
+       port = _free_port()
+       app = stub_openai.create_app(dim=DIM, rate_limit_share=rate_limit_share)
+       server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+       thread = threading.Thread(target=server.run, daemon=True)
+       thread.start()
+       deadline = time.monotonic() + 10
+       while not server.started:
+           if time.monotonic() > deadline:
+               raise RuntimeError("stub server did not start")
+           time.sleep(0.01)
+       servers.append((server, thread))
+       return f"http://127.0.0.1:{port}/v1"
+
+   yield start
+   for server, thread in servers:
+       server.should_exit = True
+       thread.join(timeout=5)
+
+
+@pytest.fixture(scope="module")
+def index_dir(tmp_path_factory):
+   directory = str(tmp_path_factory.mktemp("index"))
+   texts = [text for _, text in CHUNKS]
+   vectors = HashingEmbeddings(DIM).embed_documents(texts)
+   chunks = [{"id": f"chunk-{i}", "text": text, "metadata": {"source": "CNPP", "country": country}}
+             for i, (country, text) in enumerate(CHUNKS)]
+   write_index(directory, chunks, {text_key(text): vector for text, vector in zip(texts, vectors)})
+   return directory
+
+
+@pytest.fixture(scope="module")
+def analyzer():
+   return DataAnalyzer(os.path.join(ROOT, PRIS_CSV_PATH))
+
+
+def _engine(index_dir: str, base_url: str) -> RAGQueryEngine:
+   embeddings = OpenAIEmbeddings(model="text-embedding-3-small", base_url=base_url, api_key="stub",
+                                 check_embedding_ctx_length=False)
+   llm = ChatOpenAI(model="gpt-4", base_url=base_url, api_key="stub", temperature=0, max_retries=0)
+   engine = RAGQueryEngine(index_dir, embeddings=embeddings, llm=llm)
+   # Keep the embedding and response caches in memory, so tests don't share state through disk
+   engine.embeddings = CachedEmbeddings(embeddings, db_path=None)
+   engine.response_cache = ResponseCache()
+   return engine
+
+
+@pytest.fixture
+def client(stub_server, index_dir, analyzer):
+   app = create_app(analyzer, _engine(index_dir, stub_server()), max_concurrency=1, max_queue=0)
+   with TestClient(app) as client:
+       yield client
+
+
+def test_warm_up_loads_the_index_in_the_background(stub_server, index_dir, monkeypatch, tmp_path):
+   # The warm cache is written under the working directory
+   monkeypatch.chdir(tmp_path)
+   engine = _engine(index_dir, stub_server())
+   thread = engine.start_warm_up(index_dir, os.path.join(ROOT, PRIS_CSV_PATH),
+                                 {"Canada": ["Which CANDU units are being refurbished?"]})
+   thread.join(timeout=30)
+   assert engine.index_loaded and engine.warm_cache is not None
+
+
+def _active(client: TestClient) -> int:
+   return client.get("/health").json()["active"]
+
+
+def test_answer_from_rag(client):
+   response = client.post("/answer", json={"question": "What is the APR-1400 design?",
+                                           "country": "Korea, Republic of"})
+   assert response.status_code == 200
+   body = response.json()
+   assert body["answer"].startswith("Stub response")
+   assert body["meta"]["prompt_tokens"] > 0
+   assert _active(client) == 0
+
+
+def test_answer_cache_is_scoped_by_history(client):
+   body = {"question": "What is the APR-1400 design?", "country": "Korea, Republic of"}
+   first = client.post("/answer", json=body).json()["meta"]
+   repeat = client.post("/answer", json=body).json()["meta"]
+   other = client.post("/answer", json={**body, "history": [["What does KINS do?", "KINS regulates."]]}).json()["meta"]
+   assert (first["cache"], repeat["cache"], other["cache"]) == ("miss", "hit", "miss")
+
+
+def test_answer_from_pris_table(client):
+   response = client.post("/answer", json={"question": "How many units are under construction in China?",
+                                           "country": "China"})
+   assert response.status_code == 200
+   assert response.json()["meta"]["route"] == "pris_table"
+
+
+def test_answer_streams_text(client):
+   with client.stream("POST", "/answer", json={"question": "How is CANDU refurbishment going?",
+                                               "country": "Canada", "stream": True}) as response:
+       assert response.status_code == 200
+       assert response.headers["content-type"].startswith("text/plain")
+       text = "".join(response.iter_text())
+   assert text.startswith("Stub response")
+   assert _active(client) == 0
+
+
+def test_analysis_streams_text(client):
+   with client.stream("POST", "/analysis", json={"questions": ["What does KINS do?"],
+                                                 "country": "Korea, Republic of", "stream": True}) as response:
+       assert response.status_code == 200
+       assert "".join(response.iter_text())
+   assert _active(client) == 0
+
+
+def test_rate_limited_model_returns_502_and_frees_the_slot(stub_server, index_dir, analyzer):
+   app = create_app(analyzer, _engine(index_dir, stub_server(rate_limit_share=1.0)), max_concurrency=1, max_queue=0)
+   with TestClient(app) as client:
+       response = client.post("/answer", json={"question": "What is the APR-1400 design?",
+                                               "country": "Korea, Republic of"})
+       assert response.status_code == 502
+       assert "Generation failed" in response.json()["error"]
+       assert _active(client) == 0
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_missing_index_returns_503_not_documents(stub_server, analyzer, tmp_path, stream):
+   app = create_app(analyzer, _engine(str(tmp_path / "missing"), stub_server()), max_concurrency=1, max_queue=0)
+   with TestClient(app) as client:
+       response = client.post("/retrieve", json={"query": "APR-1400", "country": "Korea, Republic of"})
+       assert response.status_code == 503
+       assert "FAISS index could not be loaded" in response.json()["error"]
+       response = client.post("/answer", json={"question": "What is the APR-1400 design?",
+                                               "country": "Korea, Republic of", "stream": stream})
+       assert response.status_code == 503
+       assert _active(client) == 0
+
+
+def test_failed_search_returns_503(client):
+   async def fail(*args, **kwargs):
+       raise RuntimeError("embedding service down")
+
+   client.app.state.engine._asearch = fail
+   response = client.post("/retrieve", json={"query": "CANDU refurbishment", "country": "Canada"})
+   assert response.status_code == 503
+   assert "embedding service down" in response.json()["error"]
+   assert _active(client) == 0
+
+
+def test_full_queue_is_rejected_with_retry_after(client):
+   limiter = client.app.state.limiter
+   client.portal.call(limiter.acquire)
+   try:
+       response = client.post("/retrieve", json={"query": "APR-1400", "country": "Korea, Republic of"})
+       assert response.status_code == 503
+       assert response.headers["retry-after"] == "1"
+       assert limiter.rejected == 1
+   finally:
+       client.portal.call(_release, limiter)
+   assert client.post("/retrieve", json={"query": "APR-1400", "country": "Korea, Republic of"}).status_code == 200
+
+
+async def _release(limiter: ConcurrencyLimiter):
+   limiter.release()
+
+
+def test_retrieve_returns_country_documents(client):
+   response = client.post("/retrieve", json={"query": "CANDU refurbishment", "country": "Canada", "k": 2})
+   assert response.status_code == 200
+   documents = response.json()["documents"]
+   assert 1 <= len(documents) <= 2
+   assert all("Canada" in document for document in documents)
+
+
+@pytest.mark.parametrize("body", [
+   {},
+   {"query": "APR-1400", "k": "five"},
+   {"query": "APR-1400", "k": 0},
+   {"query": "APR-1400", "k": 1000},
+   {"query": "APR-1400", "k": True},
+   {"queries": "APR-1400"},
+   {"queries": ["APR-1400", 3]},
+])
+def test_retrieve_rejects_bad_input(client, body):
+   response = client.post("/retrieve", json=body)
+   assert response.status_code == 400
+   assert "error" in response.json()
+   assert _active(client) == 0
+
+
+@pytest.mark.parametrize("path, body", [
+   ("/answer", {"question": "How many units are operating?", "country": "Canada", "types": 5}),
+   ("/answer", {"question": "What is the APR-1400 design?", "country": "Korea, Republic of", "types": {"PWR": 1}}),
+   ("/answer", {"question": "How many units are operating?", "country": "Canada", "types": ["PWR", 3]}),
+   ("/analysis", {"questions": ["What does KINS do?"], "country": "Korea, Republic of", "types": 5}),
+])
+def test_bad_types_are_rejected(client, path, body):
+   response = client.post(path, json=body)
+   assert response.status_code == 400
+   assert "'types'" in response.json()["error"]
+   assert _active(client) == 0
+
+
+def test_slot_released_when_client_disconnects_before_body():
+   async def scenario():
+       limiter = ConcurrencyLimiter(1, 0)
+       await limiter.acquire()
+
+       async def body():
+           yield "never sent"
+
+       async def receive():
+           return {"type": "http.disconnect"}
+
+       async def send(message):
+           raise OSError("client disconnected")
+
+       with pytest.raises(Exception):
+           await SlotStreamingResponse(body(), limiter)({"type": "http", "asgi": {"spec_version": "2.4"}},
+                                                        receive, send)
+       return limiter.active
+
+   assert asyncio.run(scenario()) == 0
@@ -0,0 +1,46 @@
+"""ConversationMemory follow-up detection and prompt window"""
+import pytest
+
+from context_budget import count_tokens
+from conversation import ConversationMemory
+
+
+@pytest.fixture
+def memory():
+   memory = ConversationMemory()
+   memory.add("How many reactors does Korea operate?", "Korea operates 26 reactors.")
+   return memory
+
+
+@pytest.mark.parametrize("question", [
+   "What is its safety record?",
+   "When were they connected?",
+   "What about Japan?",
+   "how about France",
+   "And Canada?",
+   "Same for China?",
+])
+def test_follow_ups_need_a_rewrite(memory, question):
+   assert memory.needs_rewrite(question)
+
+
+@pytest.mark.parametrize("question", [
+   "What is the APR-1400?",
+   "How does Japan regulate reactor restarts?",
+   "Is Canada building SMRs and large reactors?",
+])
+def test_standalone_questions_are_kept(memory, question):
+   assert not memory.needs_rewrite(question)
+
+
+def test_first_question_is_never_rewritten():
+   assert not ConversationMemory().needs_rewrite("What about Japan?")
+
+
+def test_prompt_block_stays_within_budget():
+   memory = ConversationMemory()
+   for i in range(50):
+       memory.add(f"Question {i} about reactors?", "A long answer. " * 200)
+   assert len(memory.transcript) == 50
+   # A few tokens of slack for the section label
+   assert count_tokens(memory.prompt_block()) <= memory.history_token_budget + memory.summary_token_budget + 10
@@ -0,0 +1,71 @@
+"""Startup check: import time of final_app and the modules it must not import eagerly
+
+Imports final_app in fresh interpreters with `-X importtime`. Fails when the
+median import takes MAX_IMPORT_SECONDS or longer, or when a module that should
+load on first use is imported at startup: pandas and the PRIS modules, the
+OpenAI client, the FAISS / LangChain stack or the LangChain runnables. The
+failure message lists the slowest top-level imports.
+"""
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+import pytest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = 5
+MAX_IMPORT_SECONDS = 0.9
+# Loaded by the first analysis, search or generation, never by importing the app
+DEFERRED_MODULES = ["pandas", "langchain_openai", "openai", "langchain_community", "faiss", "langsmith",
+                    "langchain_core.runnables", "langchain_core.language_models", "tiktoken"]
+
+PROBE = """
+import sys, time
+started = time.perf_counter()
+import final_app
+elapsed = time.perf_counter() - started
+print("PROBE", elapsed, ",".join(m for m in {deferred!r} if m in sys.modules))
+"""
+
+
+def profile_import() -> Tuple[float, List[str], Dict[str, int]]:
+   """(seconds, deferred modules that were imported, cumulative microseconds per top-level import)"""
+   result = subprocess.run(
+       [sys.executable, "-X", "importtime", "-c", PROBE.format(deferred=DEFERRED_MODULES)],
+       cwd=ROOT, capture_output=True, text=True, check=True,
+       env={**os.environ, "PYTHONPATH": ROOT},
+   )
+   probe = next(line for line in result.stdout.splitlines() if line.startswith("PROBE"))
+   _, seconds, loaded = (probe.split(" ", 2) + [""])[:3]
+
+   top_level: Dict[str, int] = {}
+   for line in result.stderr.splitlines():
+       if not line.startswith("import time:") or "self [us]" in line:
+           continue
+       _, cumulative, name = line[len("import time:"):].split("|")
+       # Two spaces of indent per nesting level; depth 1 are the module's own imports
+       if len(name) - len(name.lstrip()) <= 3:
+           top_level[name.strip()] = int(cumulative)
+   return float(seconds), [m for m in loaded.strip().split(",") if m], top_level
+
+
+@pytest.fixture(scope="module")
+def runs():
+   return [profile_import() for _ in range(RUNS)]
+
+
+def test_import_is_under_a_second(runs):
+   median = statistics.median(seconds for seconds, _, _ in runs)
+   slowest = sorted(runs[-1][2].items(), key=lambda item: -item[1])[:10]
+   assert median < MAX_IMPORT_SECONDS, (
+       f"median import {median:.3f}s over {RUNS} runs exceeds {MAX_IMPORT_SECONDS:.2f}s; slowest imports: "
+       + ", ".join(f"{name} {us / 1000:.0f} ms" for name, us in slowest)
+   )
+
+
+def test_heavy_modules_load_on_first_use(runs):
+   eager = sorted({m for _, loaded, _ in runs for m in loaded})
+   assert not eager, f"imported at startup but should load on first use: {', '.join(eager)}"
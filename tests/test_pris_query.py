@@ -0,0 +1,85 @@
+"""PrisQueryRouter parsing and templated answers against the bundled PRIS table"""
+import os
+
+import pytest
+
+from pris_data import parse_pris_csv
+from pris_query import PrisQueryRouter
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def df():
+   return parse_pris_csv(os.path.join(ROOT, "PRIS.csv"))
+
+
+@pytest.fixture(scope="module")
+def router(df):
+   return PrisQueryRouter(df)
+
+
+def _count(df, country, statuses=(), types=()):
+   rows = df[df['Country'] == country]
+   if statuses:
+       rows = rows[rows['Status'].isin(statuses)]
+   if types:
+       rows = rows[rows['Type'].isin(types)]
+   return len(rows)
+
+
+@pytest.mark.parametrize("question, metric, statuses, types", [
+   ("How many units are under construction in China?", "count", ("Under Construction",), ()),
+   ("How many reactors are operating in Korea?", "count", ("Operational",), ()),
+   ("How many PWRs are operating in Japan?", "count", ("Operational",), ("PWR",)),
+   ("What is France's nuclear capacity in MW?", "capacity", ("Operational",), ()),
+   ("How many nuclear reactors does Canada have?", "count", (), ()),
+])
+def test_parse_structured_questions(router, question, metric, statuses, types):
+   query = router.parse(question)
+   assert query is not None
+   assert (query.metric, query.statuses, query.types) == (metric, statuses, types)
+
+
+def test_answer_counts_match_the_table(router, df):
+   query = router.parse("How many reactors are operating in Korea?")
+   expected = _count(df, "Korea, Republic of", ("Operational",))
+   assert f"**{expected} units** operational" in router.answer(query)
+
+
+def test_default_country_applies_without_a_named_one(router):
+   assert router.parse("How many units are under construction?") is None
+   query = router.parse("How many units are under construction?", default_country="China")
+   assert query.countries == ("China",)
+
+
+@pytest.mark.parametrize("question", [
+   # Negation
+   "How many reactors in Korea are not operating?",
+   "How many units in Germany are no longer running?",
+   "How many reactors does France have without PWRs?",
+   "How many reactors in the US aren't operational?",
+   # Years, dates and grid connection
+   "How many reactors did China connect in 2023?",
+   "How many reactors has China connected since 2010?",
+   "How many units were operating in Japan before 2011?",
+   "How many reactors did India add between 2000 and 2010?",
+   "How many units in Korea were connected to the grid?",
+   # Status words the index has no mapping for
+   "How many reactors in Japan are offline?",
+   "How many units in France are down for maintenance?",
+   "How many reactors in Spain are inactive?",
+   # Reasons and generation
+   "Why is Korea building more reactors?",
+   "How much electricity do reactors in France generate?",
+])
+def test_questions_the_table_cannot_answer_go_to_rag(router, question):
+   assert router.parse(question, default_country="Korea, Republic of") is None
+   assert router.route(question, "Korea, Republic of") is None
+
+
+def test_follow_up_needs_its_own_country(router):
+   question = "How many are under construction?"
+   assert router.route(question, "China", follow_up=True) is None
+   assert router.route("How many units are under construction in China?", "Japan", follow_up=True) is not None
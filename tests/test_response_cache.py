@@ -0,0 +1,44 @@
+"""ResponseCache exact and semantic tiers, and the entity scoping of near-duplicate questions"""
+import numpy as np
+import pytest
+
+from response_cache import ResponseCache, question_entities
+
+
+VECTOR = np.linspace(1.0, 2.0, 16).tolist()
+
+
+def _scope(question: str) -> str:
+   return ResponseCache.make_key("Korea, Republic of", question_entities(question))
+
+
+@pytest.mark.parametrize("cached, asked", [
+   ("How many PWRs does Korea run?", "How many BWRs does Korea run?"),
+   ("How many reactors did Japan connect in 2010?", "How many reactors did Japan connect in 2012?"),
+   ("What is the nuclear capacity of France?", "What is the nuclear capacity of Spain?"),
+   ("How many pressurized water reactors are there?", "How many boiling water reactors are there?"),
+])
+def test_near_duplicate_with_another_entity_does_not_hit(cached, asked):
+   cache = ResponseCache(semantic_threshold=0.95)
+   cache.put_similar(_scope(cached), "key", VECTOR, "answer")
+   # Even an identical embedding is no hit once the named entities differ
+   assert cache.get_similar(_scope(asked), VECTOR) is None
+
+
+def test_paraphrase_with_the_same_entities_hits():
+   cache = ResponseCache(semantic_threshold=0.95)
+   cache.put_similar(_scope("How many PWRs does Korea run?"), "key", VECTOR, "answer")
+   assert cache.get_similar(_scope("How many PWRs does Korea operate?"), VECTOR) == "answer"
+   assert cache.stats["semantic_hits"] == 1
+
+
+def test_entities_are_normalised():
+   assert question_entities("How many PWRs are in Japan's fleet?") == ["japan", "pwr"]
+   assert question_entities("How many pressurised water reactors are there?") == ["pwr"]
+   assert question_entities("Tell me about the APR-1400") == ["apr-1400"]
+
+
+def test_exact_tier_expires():
+   cache = ResponseCache(ttl_seconds=0)
+   cache.put("key", "answer")
+   assert cache.get("key") is None
@@ -0,0 +1,265 @@
+"""Per-stage request tracing, exported as JSONL traces and Prometheus-style metrics
+
+   with tracer.trace("answer", country=country) as trace:
+       with span("retrieval") as stage:
+           ...
+           stage.set(documents=len(docs))
+
+The active trace lives in a context variable, so instrumented helpers don't
+need it passed in, and span() outside a trace is a no-op. A trace opened
+inside another trace becomes one of its spans.
+
+PRIS_TRACE_FILE appends every finished trace to a JSONL file. Metrics are
+rendered in the Prometheus text format by tracer.metrics.render(), served
+by serve_metrics(port) or the API's /metrics route. PRIS_METRICS_PORT makes
+the Streamlit app start serve_metrics itself.
+"""
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+TOKEN_ATTRS = ("context_tokens", "prompt_tokens", "completion_tokens")
+
+
+@dataclass
+class Span:
+   name: str
+   trace_id: str
+   start: float  # seconds since the trace started
+   depth: int = 0
+   duration: float = 0.0
+   attrs: Dict = field(default_factory=dict)
+   error: Optional[str] = None
+
+   def set(self, **attrs):
+       self.attrs.update(attrs)
+
+   def to_dict(self) -> Dict:
+       return {"name": self.name, "start": round(self.start, 6), "depth": self.depth,
+               "duration": round(self.duration, 6), "attrs": self.attrs, "error": self.error}
+
+
+@dataclass
+class Trace:
+   name: str
+   trace_id: str
+   started_at: float  # epoch seconds
+   attrs: Dict = field(default_factory=dict)
+   spans: List[Span] = field(default_factory=list)
+   duration: float = 0.0
+   status: str = "ok"
+   error: Optional[str] = None
+   _t0: float = field(default_factory=time.perf_counter, repr=False)
+   _stack: List[Span] = field(default_factory=list, repr=False)
+
+   def set(self, **attrs):
+       self.attrs.update(attrs)
+
+   def to_dict(self) -> Dict:
+       return {
+           "trace_id": self.trace_id,
+           "name": self.name,
+           "started_at": self.started_at,
+           "duration": round(self.duration, 6),
+           "status": self.status,
+           "error": self.error,
+           "attrs": self.attrs,
+           "spans": [s.to_dict() for s in self.spans],
+       }
+
+
+class _NullSpan:
+   trace_id = None
+
+   def set(self, **attrs):
+       pass
+
+
+_NULL_SPAN = _NullSpan()
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("pris_trace", default=None)
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Span]:
+   """Time a stage of the active trace"""
+   trace = _current.get()
+   if trace is None:
+       yield _NULL_SPAN
+       return
+   stage = Span(name, trace.trace_id, time.perf_counter() - trace._t0, len(trace._stack), attrs=dict(attrs))
+   trace.spans.append(stage)
+   trace._stack.append(stage)
+   started = time.perf_counter()
+   try:
+       yield stage
+   except Exception as e:
+       stage.error = f"{type(e).__name__}: {e}"
+       raise
+   finally:
+       stage.duration = time.perf_counter() - started
+       trace._stack.remove(stage)
+
+
+def record_error(exc: Exception):
+   """Mark the innermost open span and the trace as failed, for errors that are handled rather than raised"""
+   trace = _current.get()
+   if trace is None:
+       return
+   message = f"{type(exc).__name__}: {exc}"
+   if trace._stack:
+       trace._stack[-1].error = message
+   trace.status, trace.error = "error", message
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+   def escape(value) -> str:
+       return str(value).replace("\\", "\\\\").replace('"', '\\"')
+   return ",".join(f'{key}="{escape(value)}"' for key, value in labels)
+
+
+class Metrics:
+   """Stage-duration histograms and request, cache and token counters"""
+
+   def __init__(self):
+       self._lock = threading.Lock()
+       self._histograms: Dict[Tuple, List] = {}
+       self._counters: Dict[Tuple, float] = {}
+
+   def _observe(self, labels: Tuple, seconds: float):
+       buckets, total, count = self._histograms.get(labels) or ([0] * len(STAGE_BUCKETS), 0.0, 0)
+       for i, bound in enumerate(STAGE_BUCKETS):
+           if seconds <= bound:
+               buckets[i] += 1
+       self._histograms[labels] = [buckets, total + seconds, count + 1]
+
+   def _inc(self, name: str, labels: Tuple, value: float = 1):
+       self._counters[(name, labels)] = self._counters.get((name, labels), 0) + value
+
+   def observe(self, trace: Trace):
+       with self._lock:
+           request = ("request", trace.name)
+           self._observe((request, ("stage", "total")), trace.duration)
+           for stage in trace.spans:
+               if stage.depth == 0:
+                   self._observe((request, ("stage", stage.name)), stage.duration)
+           self._inc("pris_requests_total", (request, ("status", trace.status)))
+           if "cache" in trace.attrs:
+               self._inc("pris_response_cache_total", (request, ("outcome", trace.attrs["cache"])))
+           if "route" in trace.attrs:
+               self._inc("pris_routes_total", (request, ("route", trace.attrs["route"])))
+           for attr in TOKEN_ATTRS:
+               if trace.attrs.get(attr):
+                   self._inc("pris_tokens_total", (request, ("kind", attr[:-len("_tokens")])), trace.attrs[attr])
+
+   def render(self) -> str:
+       """Prometheus text exposition format"""
+       lines = ["# HELP pris_stage_seconds Duration of request stages",
+                "# TYPE pris_stage_seconds histogram"]
+       with self._lock:
+           for labels, (buckets, total, count) in sorted(self._histograms.items()):
+               for bound, bucket_count in zip(STAGE_BUCKETS, buckets):
+                   le = "+Inf" if math.isinf(bound) else repr(bound)
+                   lines.append(f'pris_stage_seconds_bucket{{{_labels(labels)},le="{le}"}} {bucket_count}')
+               lines.append(f"pris_stage_seconds_sum{{{_labels(labels)}}} {total:.6f}")
+               lines.append(f"pris_stage_seconds_count{{{_labels(labels)}}} {count}")
+           names = sorted({name for name, _ in self._counters})
+           for name in names:
+               lines.append(f"# TYPE {name} counter")
+               for (counter, labels), value in sorted(self._counters.items()):
+                   if counter == name:
+                       lines.append(f"{name}{{{_labels(labels)}}} {value:g}")
+       return "\n".join(lines) + "\n"
+
+
+class Tracer:
+   """Opens traces, keeps the most recent ones for the debug panel and exports finished ones"""
+
+   def __init__(self, trace_file: Optional[str] = None, keep: int = 256):
+       self.trace_file = trace_file
+       self.keep = keep
+       self.metrics = Metrics()
+       self._recent: "OrderedDict[str, Trace]" = OrderedDict()
+       self._lock = threading.Lock()
+
+   @classmethod
+   def from_env(cls) -> "Tracer":
+       return cls(os.environ.get("PRIS_TRACE_FILE") or None)
+
+   @contextmanager
+   def trace(self, name: str, **attrs) -> Iterator[Trace]:
+       if _current.get() is not None:
+           with span(name, **attrs) as stage:
+               yield stage
+           return
+
+       trace = Trace(name, uuid.uuid4().hex[:16], time.time(), dict(attrs))
+       token = _current.set(trace)
+       try:
+           yield trace
+       except Exception as e:
+           trace.status, trace.error = "error", f"{type(e).__name__}: {e}"
+           raise
+       finally:
+           trace.duration = time.perf_counter() - trace._t0
+           try:
+               _current.reset(token)
+           except ValueError:
+               pass  # a stream abandoned mid-way and finalised from another context
+           self._finish(trace)
+
+   def _finish(self, trace: Trace):
+       self.metrics.observe(trace)
+       with self._lock:
+           self._recent[trace.trace_id] = trace
+           while len(self._recent) > self.keep:
+               self._recent.popitem(last=False)
+           if self.trace_file:
+               os.makedirs(os.path.dirname(self.trace_file) or ".", exist_ok=True)
+               with open(self.trace_file, "a", encoding="utf-8") as f:
+                   f.write(json.dumps(trace.to_dict(), ensure_ascii=False, default=str) + "\n")
+
+   def get(self, trace_id: Optional[str]) -> Optional[Trace]:
+       with self._lock:
+           return self._recent.get(trace_id) if trace_id else None
+
+
+tracer = Tracer.from_env()
+_metrics_server: Optional[ThreadingHTTPServer] = None
+
+
+def serve_metrics(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+   """Serve tracer.metrics at http://host:port/metrics from a daemon thread (once per process)"""
+   global _metrics_server
+   with tracer._lock:
+       if _metrics_server is not None:
+           return _metrics_server
+
+       class Handler(BaseHTTPRequestHandler):
+           def do_GET(self):
+               if self.path.split("?")[0] != "/metrics":
+                   self.send_error(404)
+                   return
+               body = tracer.metrics.render().encode()
+               self.send_response(200)
+               self.send_header("Content-Type", "text/plain; version=0.0.4")
+               self.send_header("Content-Length", str(len(body)))
+               self.end_headers()
+               self.wfile.write(body)
+
+           def log_message(self, *args):
+               pass
+
+       _metrics_server = ThreadingHTTPServer((host, port), Handler)
+       threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+       return _metrics_server
@@ -0,0 +1,129 @@
+"""FAISS index types for large corpora: exact flat, HNSW graph or IVF-PQ, with exact reranking
+
+Index types are named like embedders on the command line:
+   flat                  exact search (default)
+   hnsw[:M]              HNSW graph over full vectors, M links per node (default 32)
+   ivfpq[:nlist[:m]]     inverted lists with product-quantised codes; nlist defaults to
+                         ~4*sqrt(n), m to dim/8 sub-quantisers of 8 bits each
+Anything else is passed to faiss.index_factory, e.g. "HNSW32,SQ8".
+
+Approximate indexes return more candidates than asked for. Their exact
+float32 vectors are kept beside the index in a memory-mapped .npy. That
+file lives on disk and only the pages of reranked rows are read, so
+reranking does not need the whole corpus in RAM.
+"""
+import math
+import os
+from typing import Optional, Tuple
+
+import faiss
+import numpy as np
+
+
+EXACT_VECTORS_NAME = "exact_vectors.npy"
+# faiss wants 39 training points per centroid of the 8-bit PQ codebooks; smaller
+# corpora (and country partitions) stay exact, where flat search is cheap anyway
+MIN_IVFPQ_VECTORS = 39 * 256
+
+
+def factory_string(index_type: str, n: int, dim: int) -> str:
+   """faiss.index_factory description for an index type name and corpus shape"""
+   name, *params = index_type.split(":")
+   if name == "flat":
+       return "Flat"
+   if name == "hnsw":
+       return f"HNSW{int(params[0]) if params else 32}"
+   if name == "ivfpq":
+       if n < MIN_IVFPQ_VECTORS:
+           return "Flat"
+       nlist = int(params[0]) if params else max(1, min(int(4 * math.sqrt(n)), n // 39))
+       m = int(params[1]) if len(params) > 1 else max(1, dim // 8)
+       while dim % m:
+           m -= 1
+       return f"IVF{nlist},PQ{m}"
+   return index_type
+
+
+def build_index(vectors: np.ndarray, index_type: str = "flat", metric: int = faiss.METRIC_L2) -> faiss.Index:
+   """Build and, where needed, train an index of the given type over the vectors"""
+   vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+   index = faiss.index_factory(vectors.shape[1], factory_string(index_type, *vectors.shape), metric)
+   if not index.is_trained:
+       index.train(vectors)
+   index.add(vectors)
+   return index
+
+
+def is_approximate(index: faiss.Index) -> bool:
+   return not isinstance(faiss.downcast_index(index), faiss.IndexFlat)
+
+
+def configure(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+   """Set the search-time accuracy knobs of an IVF or HNSW index; other indexes are left alone"""
+   index = faiss.downcast_index(index)
+   if nprobe is not None:
+       try:
+           ivf = faiss.extract_index_ivf(index)
+       except RuntimeError:
+           ivf = None
+       if ivf is not None:
+           ivf.nprobe = min(nprobe, ivf.nlist)
+   if ef_search is not None and hasattr(index, "hnsw"):
+       index.hnsw.efSearch = ef_search
+
+
+def index_bytes(index: faiss.Index) -> int:
+   """Serialised size of an index, a close proxy for its resident memory"""
+   return int(faiss.serialize_index(index).size)
+
+
+def write_exact_vectors(index_dir: str, vectors: Optional[np.ndarray]):
+   """Keep exact vectors for reranking beside an approximate index; remove them for a flat one"""
+   path = os.path.join(index_dir, EXACT_VECTORS_NAME)
+   if vectors is None:
+       if os.path.exists(path):
+           os.remove(path)
+       return
+   tmp = f"{path}.tmp.npy"
+   np.save(tmp, np.ascontiguousarray(vectors, dtype=np.float32))
+   os.replace(tmp, path)
+
+
+class ExactReranker:
+   """Re-scores approximate candidates against their exact, memory-mapped vectors"""
+
+   def __init__(self, vectors: np.ndarray, metric: int = faiss.METRIC_L2):
+       self.vectors = vectors
+       self.metric = metric
+
+   @classmethod
+   def load(cls, index_dir: str, ntotal: int, metric: int = faiss.METRIC_L2) -> Optional["ExactReranker"]:
+       """Open the exact vectors saved with the index; None when absent or out of date"""
+       path = os.path.join(index_dir, EXACT_VECTORS_NAME)
+       if not os.path.exists(path):
+           return None
+       vectors = np.load(path, mmap_mode="r")
+       if len(vectors) != ntotal:
+           return None
+       return cls(vectors, metric)
+
+   def rerank(self, queries: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+       """Best k of each query's candidate rows by exact distance; -1 rows are padding"""
+       scores = np.full((len(queries), k), np.inf if self.metric == faiss.METRIC_L2 else -np.inf, dtype=np.float32)
+       ranked = np.full((len(queries), k), -1, dtype=np.int64)
+       for i, (query, candidates) in enumerate(zip(queries, rows)):
+           candidates = candidates[candidates >= 0]
+           if not len(candidates):
+               continue
+           # Sorted rows give sequential reads from the memory-mapped file
+           candidates = np.unique(candidates)
+           vectors = np.asarray(self.vectors[candidates])
+           if self.metric == faiss.METRIC_L2:
+               distances = ((vectors - query) ** 2).sum(axis=1)
+               order = np.argsort(distances, kind="stable")[:k]
+           else:
+               distances = vectors @ query
+               order = np.argsort(-distances, kind="stable")[:k]
+           scores[i, :len(order)] = distances[order]
+           ranked[i, :len(order)] = candidates[order]
+       return scores, ranked
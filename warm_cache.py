@@ -0,0 +1,179 @@
+"""Precomputed retrieval for the guided-analysis questions, built at deploy time
+
+Usage:
+   python warm_cache.py                   # rebuild if the index or PRIS.csv changed
+   python warm_cache.py --check           # exit 1 when the stored results are stale
+   python warm_cache.py --embedder hashing:64 --index-dir /tmp/index --force
+
+The fused (row, score) candidates of every guided question, as deep as
+the engine's relevance stage over-fetches, are stored per country. A
+guided analysis reranks its selected questions' candidates together and
+merges them by document, so any combination of up to three questions is
+served from the stored candidates as a live search would rank it,
+provided the embedder returns the vectors the build saw for the same
+model name (the query embedding cache is keyed by that name). Entries
+are keyed by a content hash of the files search reads (vectors,
+docstore, partitions, exact vectors) and of PRIS.csv, plus the embedder
+and search settings; a mismatch rebuilds them. Ingest bookkeeping such
+as the manifest and chunk-vector cache is not hashed, so refreshing it
+alone keeps the stored results.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from country_partitions import PARTITIONS_DIR
+from embedding_cache import normalize_text
+from mmap_docstore import DOCSTORE_DATA, DOCSTORE_OFFSETS, INDEX_NAME
+from response_cache import ResponseCache
+from vector_index import EXACT_VECTORS_NAME
+
+
+WARM_CACHE_PATH = os.path.join(".cache", "warm_retrieval.json")
+# Bump when the ranking or the stored format changes so old files are rebuilt
+WARM_CACHE_VERSION = 3
+
+Ranking = List[Tuple[int, float]]  # (index row, fused score), best first
+
+
+def _hash_files(paths: List[str]) -> str:
+   digest = hashlib.sha256()
+   for path in paths:
+       digest.update(os.path.basename(path).encode() + b"\0")
+       try:
+           with open(path, "rb") as f:
+               for block in iter(lambda: f.read(1 << 20), b""):
+                   digest.update(block)
+       except OSError:
+           digest.update(b"missing")
+   return digest.hexdigest()
+
+
+def index_version(index_path: str) -> str:
+   """Content hash of the index files that search reads: vectors, docstore, exact vectors and partitions"""
+   paths = [os.path.join(index_path, name)
+            for name in (INDEX_NAME, DOCSTORE_DATA, DOCSTORE_OFFSETS, EXACT_VECTORS_NAME)]
+   partitions = os.path.join(index_path, PARTITIONS_DIR)
+   if os.path.isdir(partitions):
+       paths += [os.path.join(partitions, name) for name in sorted(os.listdir(partitions))]
+   return _hash_files(paths)
+
+
+def warm_cache_key(engine, index_path: str, csv_path: str, k: int) -> str:
+   """Everything the stored rankings depend on: index and data versions, embedder and search settings"""
+   return ResponseCache.make_key(
+       WARM_CACHE_VERSION, index_version(index_path), _hash_files([csv_path]),
+       type(engine.embeddings.embeddings).__name__, engine.embeddings.model_name,
+       engine.retrieval_mode, engine.search_params, k,
+   )
+
+
+class WarmCache:
+   """Per-country rankings of the guided questions for one index and data version"""
+
+   def __init__(self, key: str, k: int, rankings: Dict[str, Dict[str, Ranking]], built_seconds: float = 0.0):
+       self.key = key
+       self.k = k
+       self.rankings = rankings
+       self.built_seconds = built_seconds
+
+   def __len__(self) -> int:
+       return sum(len(questions) for questions in self.rankings.values())
+
+   def lookup(self, country: str, queries: List[str], k: int) -> Optional[List[Ranking]]:
+       """Rankings for the queries, or None unless every one of them was precomputed"""
+       questions = self.rankings.get(country)
+       if k != self.k or not questions:
+           return None
+       try:
+           return [questions[normalize_text(query)] for query in queries]
+       except KeyError:
+           return None
+
+   @classmethod
+   def build(cls, engine, key: str, questions: Dict[str, List[str]], k: int = 5) -> "WarmCache":
+       """Rank every country's guided questions; all of them are embedded in one batch first"""
+       started = time.perf_counter()
+       engine.embeddings.prewarm(q for country_questions in questions.values() for q in country_questions)
+       rankings = {}
+       for country, country_questions in questions.items():
+           ranked = engine.rank_queries(country_questions, country, candidates=k)
+           rankings[country] = {
+               normalize_text(q): [(int(row), float(score)) for row, score in ranking]
+               for q, ranking in zip(country_questions, ranked)
+           }
+       return cls(key, k, rankings, time.perf_counter() - started)
+
+   @classmethod
+   def load(cls, path: str) -> Optional["WarmCache"]:
+       try:
+           with open(path, encoding="utf-8") as f:
+               data = json.load(f)
+           return cls(data["key"], data["k"], data["rankings"], data.get("built_seconds", 0.0))
+       except (OSError, ValueError, KeyError):
+           return None
+
+   def save(self, path: str):
+       os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+       tmp = f"{path}.tmp"
+       with open(tmp, "w", encoding="utf-8") as f:
+           json.dump({"key": self.key, "k": self.k, "built_seconds": self.built_seconds,
+                      "rankings": self.rankings}, f, ensure_ascii=False)
+       os.replace(tmp, path)
+
+
+def ensure_warm_cache(engine, index_path: str, csv_path: str, questions: Dict[str, List[str]],
+                      path: str = WARM_CACHE_PATH, k: int = 5, force: bool = False) -> Tuple[WarmCache, bool]:
+   """Load the stored rankings, rebuilding them when stale; returns (cache, rebuilt)"""
+   key = warm_cache_key(engine, index_path, csv_path, k)
+   cache = None if force else WarmCache.load(path)
+   if cache is not None and cache.key == key:
+       return cache, False
+   cache = WarmCache.build(engine, key, questions, k)
+   cache.save(path)
+   return cache, True
+
+
+def guided_questions(dynamic_questions: Dict[str, Dict[str, List[str]]]) -> Dict[str, List[str]]:
+   """Every guided question per country, across its topic groups"""
+   return {
+       country: list(dict.fromkeys(q for topic_questions in topics.values() for q in topic_questions))
+       for country, topics in dynamic_questions.items()
+   }
+
+
+def main():
+   parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+   parser.add_argument("--index-dir", default="faiss_index")
+   parser.add_argument("--csv", default="PRIS.csv")
+   parser.add_argument("--output", default=WARM_CACHE_PATH)
+   parser.add_argument("--embedder", default="openai", help="'openai[:model]' or 'hashing[:size]' (offline)")
+   parser.add_argument("--check", action="store_true", help="only report freshness; exit 1 when stale")
+   parser.add_argument("--force", action="store_true", help="rebuild even when the stored results are fresh")
+   args = parser.parse_args()
+
+   from final_app import DYNAMIC_QUESTIONS, RAGQueryEngine
+   from offline import FakeChatModel, get_embeddings
+
+   # Retrieval only, so no chat model (or API key for one) is needed
+   engine = RAGQueryEngine(args.index_dir, embeddings=get_embeddings(args.embedder), llm=FakeChatModel())
+   if engine.vectorstore is None:
+       parser.error(f"could not load the FAISS index from {args.index_dir}")
+
+   if args.check:
+       cache = WarmCache.load(args.output)
+       fresh = cache is not None and cache.key == warm_cache_key(engine, args.index_dir, args.csv, cache.k)
+       print(f"{args.output}: {'fresh' if fresh else 'stale'}")
+       raise SystemExit(0 if fresh else 1)
+
+   cache, rebuilt = ensure_warm_cache(engine, args.index_dir, args.csv, guided_questions(DYNAMIC_QUESTIONS),
+                                      args.output, k=engine.candidate_depth(5), force=args.force)
+   state = f"rebuilt in {cache.built_seconds:.1f}s" if rebuilt else "already fresh"
+   print(f"{len(cache)} guided questions across {len(cache.rankings)} countries, {state} -> {args.output}")
+
+
+if __name__ == "__main__":
+   main()